@@ -1,6 +1,9 @@
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Optional, Type, Union
 
+import hashlib
+import json
 import numpy as np
 import os
 import sapien.core as sapien
@@ -9,6 +12,8 @@ import cv2
 
 from mani_skill2_real2sim import ASSET_DIR, format_path
 from mani_skill2_real2sim.utils.io_utils import load_json
+from mani_skill2_real2sim.utils.object_names import clean_object_name
+from mani_skill2_real2sim.utils.stage_collider import load_stage_collider, stage_collider_path
 from mani_skill2_real2sim.agents.base_agent import BaseAgent
 from mani_skill2_real2sim.agents.robots.googlerobot import (
     GoogleRobotStaticBase,
@@ -26,6 +31,38 @@ from mani_skill2_real2sim.utils.sapien_utils import (
     vectorize_pose,
 )
 
+# Bump to invalidate settle caches written by an older version of the scene initialization
+SETTLE_CACHE_VERSION = 1
+
+# Number of object models whose asset files are remembered per process (see model_asset_files)
+MODEL_ASSET_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=MODEL_ASSET_CACHE_SIZE)
+def model_asset_files(model_dir: str):
+    """Collision and visual file of an object model directory, looked up once per process and shared by every env
+    instance and reconfigure (least recently used models are dropped beyond MODEL_ASSET_CACHE_SIZE).
+
+    The visual file is the first of textured.obj, textured.dae and textured.glb that exists. Raises FileNotFoundError
+    if the model or its collision file is missing.
+    """
+    files = set(os.listdir(model_dir)) if os.path.isdir(model_dir) else None
+    if files is None:
+        raise FileNotFoundError(
+            f"{model_dir} is not found."
+            "If you installed this repo through 'pip install .', or if you stored the assets outside of ManiSkill2_real2sim/data, "
+            "you need to set the following environment variable: export MS2_REAL2SIM_ASSET_DIR={path_to_your_ManiSkill2_real2sim_assets} . "
+            "(for example, you can download this directory https://github.com/simpler-env/ManiSkill2_real2sim/tree/main/data and set the env variable to the downloaded directory). "
+            "Additionally, for assets in the original ManiSkill2 repo, you can copy the assets into the directory that corresponds to MS2_REAL2SIM_ASSET_DIR."
+        )
+    if "collision.obj" not in files:
+        raise FileNotFoundError(
+            "convex.obj has been renamed to collision.obj. "
+        )
+    visual_file = next((name for name in ("textured.obj", "textured.dae") if name in files), "textured.glb")
+    return os.path.join(model_dir, "collision.obj"), os.path.join(model_dir, visual_file)
+
+
 class CustomSceneEnv(BaseEnv):
     SUPPORTED_ROBOTS = {"google_robot_static": GoogleRobotStaticBase, 
                         "widowx": WidowX,
@@ -64,6 +101,13 @@ class CustomSceneEnv(BaseEnv):
             model_ids: List[str] = (),
             model_db_override: Dict[str, Dict] = {},
             urdf_version: str = "",
+            settle_cache_dir: Optional[str] = None,
+            stage_collision: str = "mesh",
+            adaptive_settle: bool = False,
+            settle_lin_vel_threshold: float = 1e-3,
+            settle_ang_vel_threshold: float = 1e-2,
+            settle_window: float = 0.1,
+            settle_chunk: float = 0.02,
             **kwargs
         ):
         # Assets and scene
@@ -78,6 +122,10 @@ class CustomSceneEnv(BaseEnv):
         self.scene_offset = scene_offset
         self.scene_pose = scene_pose
         self.scene_table_height = scene_table_height
+        # "mesh": the non-convex collision mesh of the whole stage; "simplified": the boxes of its pre-cooked collider
+        # (see mani_skill2_real2sim.utils.stage_collider)
+        assert stage_collision in ("mesh", "simplified"), stage_collision
+        self.stage_collision = stage_collision
 
         # Load object model database
         if model_json is None:
@@ -122,6 +170,10 @@ class CustomSceneEnv(BaseEnv):
         self.rgb_overlay_mode = rgb_overlay_mode # 'background' or 'object' or 'debug' or combinations of them
         self.rgb_always_overlay_objects = rgb_always_overlay_objects # always overlay / greenscreen these objects regardless of the rgb_overlay_mode
         assert ('background' in self.rgb_overlay_mode) or ('debug' in self.rgb_overlay_mode), 'Invalid rgb_overlay_mode'
+        # Overlay images resized to each camera resolution, and the per-episode actor id -> overlay lookup table
+        self._overlay_src = None
+        self._overlay_cache = {}
+        self._overlay_lut = None
 
         self.arena = None
         self.robot_init_options = {}
@@ -130,6 +182,28 @@ class CustomSceneEnv(BaseEnv):
             urdf_version = ""
         self.urdf_version = urdf_version
         self.disable_bad_material = disable_bad_material
+
+        # Cache of the scene states after settling (see initialize_episode)
+        self.settle_cache_dir = settle_cache_dir
+        self.settle_cache_hit = False
+        self._episode_options = {}
+        self._settle_record = None
+        self._settle_replay = None
+
+        # With adaptive_settle, _settle(t) steps the physics in chunks of settle_chunk seconds and stops early once the
+        # linear and angular velocity of every dynamic actor stayed below the thresholds for settle_window seconds;
+        # t is the hard cap. settle_steps is the number of physics steps the episode initialization used.
+        self.adaptive_settle = adaptive_settle
+        self.settle_lin_vel_threshold = settle_lin_vel_threshold
+        self.settle_ang_vel_threshold = settle_ang_vel_threshold
+        self.settle_window = settle_window
+        self.settle_chunk = settle_chunk
+        self.settle_steps = 0
+
+        # Actor pool of the envs with use_actor_pool, pool key -> actors built in the current scene (see
+        # _take_pooled_actors), and the pooled actors the episode uses
+        self._actor_pool = {}
+        self._pooled_actors_in_use = []
         
         super().__init__(**kwargs)
     
@@ -184,7 +258,18 @@ class CustomSceneEnv(BaseEnv):
         # Build scene
         if (self.scene_name is None) or ("dummy" not in self.scene_name):
             # NOTE: use nonconvex collision for static scene
-            if add_collision:
+            if add_collision and self.stage_collision == "simplified":
+                collider_path = stage_collider_path(scene_path)
+                if not os.path.exists(collider_path):
+                    raise FileNotFoundError(
+                        f"{collider_path} is not found. Build it with python -m mani_skill2_real2sim.utils.stage_collider"
+                    )
+                (collider_p, collider_q), boxes = load_stage_collider(collider_path)
+                if not (np.allclose(collider_p, scene_pose.p) and np.allclose(collider_q, scene_pose.q, atol=1e-3)):
+                    raise ValueError(f"{collider_path} was built for another scene pose than {scene_pose}")
+                for box in boxes:
+                    builder.add_box_collision(pose=sapien.Pose(box[:3]), half_size=box[3:])
+            elif add_collision:
                 builder.add_nonconvex_collision_from_file(scene_path, scene_pose)
             builder.add_visual_from_file(scene_path, scene_pose)
         else:
@@ -217,14 +302,143 @@ class CustomSceneEnv(BaseEnv):
         
         self.arena.set_pose(sapien.Pose(-scene_offset))
         
-    def _settle(self, t):
-        # step the simulation and let the scene settle for t seconds
+    def _build_pooled_actor(self, key):
+        """Build an actor for the pool key (needed by use_actor_pool)."""
+        raise NotImplementedError
+
+    def _take_pooled_actors(self, keys):
+        """Take one actor per key from the actor pool, building the ones it lacks with _build_pooled_actor, and park
+        every pooled actor off-stage: hidden, and with all motion locked far above the scene. The actors taken stay
+        parked until _initialize_actors sets their pose and unhides them, so they cannot touch the objects placed
+        before them, as in a scene built for the episode. Returns the actors in the order of keys."""
+        free = {key: list(actors) for key, actors in self._actor_pool.items()}
+        in_use = []
+        for key in keys:
+            if free.get(key):
+                in_use.append(free[key].pop())
+            else:
+                actor = self._build_pooled_actor(key)
+                self._actor_pool.setdefault(key, []).append(actor)
+                in_use.append(actor)
+
+        parked = [actor for actors in free.values() for actor in actors]
+        for i, actor in enumerate(parked + in_use):
+            actor.lock_motion(1, 1, 1, 1, 1, 1)
+            actor.set_velocity(np.zeros(3))
+            actor.set_angular_velocity(np.zeros(3))
+            actor.set_pose(sapien.Pose([100 + 2 * i, 100, 100]))
+            actor.hide_visual()
+        self._pooled_actors_in_use = in_use
+        return in_use
+
+    def get_actors(self):
+        actors = super().get_actors()
+        if not self._actor_pool:
+            return actors
+        # parked actors are left out of the simulation state and the segmentation, and the pooled actors in use come
+        # last in episode order, as when the scene is built for the episode only
+        pooled = {actor.id for pooled_actors in self._actor_pool.values() for actor in pooled_actors}
+        return [actor for actor in actors if actor.id not in pooled] + self._pooled_actors_in_use
+
+    def _settle(self, t, actors=None):
+        # step the simulation and let the scene settle for t seconds; with adaptive_settle, stop early once the given
+        # actors (by default, every dynamic actor of the scene) are at rest
+        if self._settle_replay:
+            self.set_sim_state(self._settle_replay.pop(0))
+            return
         sim_steps = int(self.sim_freq * t)
-        for _ in range(sim_steps):
-            self._scene.step()
-    
+        if not self.adaptive_settle:
+            for _ in range(sim_steps):
+                self._scene.step()
+            self.settle_steps += sim_steps
+        else:
+            self.settle_steps += self._settle_adaptive(sim_steps, actors)
+        if self._settle_record is not None:
+            self._settle_record.append(self.get_sim_state())
+
+    def _settle_adaptive(self, max_steps, actors=None):
+        # step in chunks until the actors have been at rest for settle_window seconds, at most max_steps steps
+        chunk = max(1, int(self.sim_freq * self.settle_chunk))
+        window = max(1, int(np.ceil(self.settle_window / self.settle_chunk)))
+        if actors is None:
+            actors = [x for x in self.get_actors() if x.type == "dynamic"]
+        steps, at_rest = 0, 0
+        while steps < max_steps:
+            n = min(chunk, max_steps - steps)
+            for _ in range(n):
+                self._scene.step()
+            steps += n
+            if all(np.linalg.norm(x.velocity) < self.settle_lin_vel_threshold
+                   and np.linalg.norm(x.angular_velocity) < self.settle_ang_vel_threshold for x in actors):
+                at_rest += 1
+                if at_rest >= window:
+                    break
+            else:
+                at_rest = 0
+        return steps
+
+    def _settle_cache_path(self):
+        # everything the settled scene depends on: the env and its physics, the scenario, and the episode seed
+        scene_config = self._get_default_scene_config()
+        signature = {
+            "version": SETTLE_CACHE_VERSION,
+            "env": type(self).__name__,
+            "env_kwargs": {k: v for k, v in self.spec.kwargs.items() if k != "settle_cache_dir"}
+            if self.spec is not None else None,
+            "robot": [self.robot_uid, self.urdf_version],
+            "scene": [self.scene_name, self.scene_offset, self.scene_pose, self.scene_table_height],
+            "sim_freq": self.sim_freq,
+            "scene_config": {k: getattr(scene_config, k) for k in dir(scene_config)
+                             if not k.startswith("_") and isinstance(getattr(scene_config, k), (bool, int, float))},
+            "options": {k: v for k, v in self._episode_options.items() if k != "reconfigure"},
+            "seed": self._episode_seed,
+        }
+        if self.adaptive_settle:
+            # only added with adaptive_settle, so the caches of fixed-duration settles stay valid
+            signature["adaptive_settle"] = [self.settle_lin_vel_threshold, self.settle_ang_vel_threshold,
+                                            self.settle_window, self.settle_chunk]
+        key = hashlib.sha256(
+            json.dumps(signature, sort_keys=True, default=lambda o: o.tolist() if hasattr(o, "tolist") else str(o))
+            .encode()
+        ).hexdigest()
+        return os.path.join(self.settle_cache_dir, key + ".npy")
+
+    def initialize_episode(self):
+        # With settle_cache_dir, the simulation state after every _settle call of a scenario is saved on its first run.
+        # Later runs of the same scenario (e.g., with another policy) restore these states in place of stepping the
+        # physics, so the episode starts from the same settled scene without letting the objects fall again.
+        # settle_steps stays 0 when the settled states are replayed from the cache
+        self.settle_steps = 0
+        self.settle_cache_hit = False
+        if self.settle_cache_dir is None:
+            return super().initialize_episode()
+        path = self._settle_cache_path()
+        try:
+            states = np.load(path)
+            if states.ndim != 2 or states.shape[1] != len(self.get_sim_state()):
+                states = None
+        except (OSError, ValueError):
+            states = None
+        if states is not None:
+            self._settle_replay = list(states)
+            self.settle_cache_hit = True
+        else:
+            self._settle_record = []
+        try:
+            super().initialize_episode()
+            if self._settle_record:
+                os.makedirs(self.settle_cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.save(f, np.stack(self._settle_record))
+                os.replace(tmp_path, path)
+        finally:
+            self._settle_record, self._settle_replay = None, None
+
     def reset(self, seed=None, options=None):
         self.robot_init_options = options.get("robot_init_options", {})
+        self._episode_options = options
+        self._overlay_lut = None # the actors may change; rebuilt at the first observation of the episode
         obs, info = super().reset(seed=seed, options=options)
         info.update({
             'scene_name': self.scene_name,
@@ -236,6 +450,8 @@ class CustomSceneEnv(BaseEnv):
             'rgb_overlay_cameras': self.rgb_overlay_cameras,
             'rgb_overlay_mode': self.rgb_overlay_mode,
             'disable_bad_material': self.disable_bad_material,
+            'settle_cache_hit': self.settle_cache_hit,
+            'settle_steps': self.settle_steps,
         })
         return obs, info
     
@@ -346,55 +562,84 @@ class CustomSceneEnv(BaseEnv):
         obs["base_pose"] = vectorize_pose(self.agent.robot.pose)
         return obs
     
+    def _build_overlay_lut(self):
+        """Boolean lookup table: actor id -> whether its pixels are overlaid by the greenscreen image.
+
+        Ids beyond the table (actors added after it was built) map to its last entry, and are overlaid.
+        """
+        # get the actor ids of objects to manipulate; note that objects here are not articulated
+        target_object_actor_ids = [x.id for x in self.get_actors() if x.name not in ['ground', 'goal_site', '', 'arena'] + self.rgb_always_overlay_objects]
+
+        # get the robot link ids (links are subclass of actors)
+        robot_links = self.agent.robot.get_links() # e.g., [Actor(name="root", id="1"), Actor(name="root_arm_1_link_1", id="2"), Actor(name="root_arm_1_link_2", id="3"), ...]
+        robot_link_ids = [x.id for x in robot_links]
+
+        # get the link ids of other articulated objects
+        other_link_ids = []
+        for art_obj in self._scene.get_all_articulations():
+            if art_obj is self.agent.robot:
+                continue
+            if art_obj.name in self.rgb_always_overlay_objects:
+                continue
+            for link in art_obj.get_links():
+                other_link_ids.append(link.id)
+
+        if ('background' in self.rgb_overlay_mode) or ('debug' in self.rgb_overlay_mode):
+            if ('object' not in self.rgb_overlay_mode) or ('debug' in self.rgb_overlay_mode):
+                # only overlay the background and keep the foregrounds (robot and target objects) rendered in simulation
+                kept_ids = robot_link_ids + target_object_actor_ids + other_link_ids
+            else:
+                # overlay everything except the robot links
+                kept_ids = robot_link_ids
+        else:
+            raise NotImplementedError(self.rgb_overlay_mode)
+        lut = np.ones(max(kept_ids, default=0) + 2, dtype=bool)
+        lut[kept_ids] = False
+        return lut
+
+    def _get_overlay_img(self, width, height, dtype):
+        """The greenscreen image resized to (width, height), as uint8 or as a float texture in [0, 1]."""
+        if self.rgb_overlay_img is not self._overlay_src:
+            # some envs pick another overlay image at every reset
+            self._overlay_src = self.rgb_overlay_img
+            self._overlay_cache = {}
+        key = (width, height, np.dtype(dtype))
+        if key not in self._overlay_cache:
+            key_uint8 = (width, height, np.dtype(np.uint8))
+            if key_uint8 not in self._overlay_cache:
+                img = self.rgb_overlay_img
+                if img.dtype != np.uint8:
+                    img = np.clip(np.round(img * 255), 0, 255).astype(np.uint8)
+                self._overlay_cache[key_uint8] = cv2.resize(img, (width, height))
+            img = self._overlay_cache[key_uint8]
+            if key != key_uint8:
+                img = img.astype(dtype) / np.array(255, dtype=dtype)
+            self._overlay_cache[key] = img
+        return self._overlay_cache[key]
+
     def get_obs(self):
         obs = super().get_obs()
         
         # "greenscreen" process
         if self._obs_mode == "image" and self.rgb_overlay_img is not None:
-            # get the actor ids of objects to manipulate; note that objects here are not articulated
-            target_object_actor_ids = [x.id for x in self.get_actors() if x.name not in ['ground', 'goal_site', '', 'arena'] + self.rgb_always_overlay_objects]
-            target_object_actor_ids = np.array(target_object_actor_ids, dtype=np.int32)
-
-            # get the robot link ids (links are subclass of actors)
-            robot_links = self.agent.robot.get_links() # e.g., [Actor(name="root", id="1"), Actor(name="root_arm_1_link_1", id="2"), Actor(name="root_arm_1_link_2", id="3"), ...]
-            robot_link_ids = np.array([x.id for x in robot_links], dtype=np.int32)
-
-            # get the link ids of other articulated objects
-            other_link_ids = []
-            for art_obj in self._scene.get_all_articulations():
-                if art_obj is self.agent.robot:
-                    continue
-                if art_obj.name in self.rgb_always_overlay_objects:
-                    continue
-                for link in art_obj.get_links():
-                    other_link_ids.append(link.id)
-            other_link_ids = np.array(other_link_ids, dtype=np.int32)
+            if self._overlay_lut is None:
+                self._overlay_lut = self._build_overlay_lut()
 
             for camera_name in self.rgb_overlay_cameras:
                 # obtain overlay mask based on segmentation info
                 assert 'Segmentation' in obs['image'][camera_name].keys(), 'Image overlay requires segment info in the observation!'
                 seg = obs['image'][camera_name]['Segmentation'] # (H, W, 4); [..., 0] is mesh-level; [..., 1] is actor-level; [..., 2:] is zero (unused)
-                actor_seg = seg[..., 1]
-                mask = np.ones_like(actor_seg, dtype=np.float32)
-                if ('background' in self.rgb_overlay_mode) or ('debug' in self.rgb_overlay_mode):
-                    if ('object' not in self.rgb_overlay_mode) or ('debug' in self.rgb_overlay_mode):
-                        # only overlay the background and keep the foregrounds (robot and target objects) rendered in simulation
-                        mask[np.isin(actor_seg, np.concatenate([robot_link_ids, target_object_actor_ids, other_link_ids]))] = 0.0
-                    else:
-                        # overlay everything except the robot links
-                        mask[np.isin(actor_seg, robot_link_ids)] = 0.0
-                else:
-                    raise NotImplementedError(self.rgb_overlay_mode)
-                mask = mask[..., np.newaxis]
-                
+                color = obs['image'][camera_name]['Color']
+                rgb_overlay_img = self._get_overlay_img(color.shape[1], color.shape[0], color.dtype)
+
                 # perform overlay on the RGB observation image
-                rgb_overlay_img = cv2.resize(self.rgb_overlay_img, (obs['image'][camera_name]['Color'].shape[1], obs['image'][camera_name]['Color'].shape[0]))
                 if 'debug' not in self.rgb_overlay_mode:
-                    obs['image'][camera_name]['Color'][..., :3] = obs['image'][camera_name]['Color'][..., :3] * (1 - mask) + rgb_overlay_img * mask
+                    # the mask is binary, so the overlay copies pixels of the cached image without any arithmetic
+                    mask = np.take(self._overlay_lut, seg[..., 1], mode='clip')
+                    np.copyto(color[..., :3], rgb_overlay_img, where=mask[..., np.newaxis])
                 else:
                     # debug
-                    # obs['image'][camera_name]['Color'][..., :3] = obs['image'][camera_name]['Color'][..., :3] * (1 - mask) + rgb_overlay_img * mask
-                    obs['image'][camera_name]['Color'][..., :3] = obs['image'][camera_name]['Color'][..., :3] * 0.5 + rgb_overlay_img * 0.5
+                    color[..., :3] = color[..., :3] * 0.5 + rgb_overlay_img * 0.5
                 
         return obs
 
@@ -411,16 +656,7 @@ class CustomSceneEnv(BaseEnv):
     @staticmethod
     def _get_instruction_obj_name(s):
         # given an object name, process its name to be used for language instruction
-        s = s.split('_')
-        rm_list = ['opened', 'light', 'generated', 'modified', 'objaverse', 'bridge', 'baked', 'v2']
-        cleaned = []
-        for w in s:
-            if w[-2:] == "cm":
-                # object size in object name
-                continue
-            if w not in rm_list:
-                cleaned.append(w)
-        return ' '.join(cleaned)
+        return clean_object_name(s)
     
     def advance_to_next_subtask(self):
         raise NotImplementedError("advance_to_next_subtask is not implemented for this environment.")
@@ -428,6 +664,11 @@ class CustomSceneEnv(BaseEnv):
     def is_final_subtask(self):
         # whether the current subtask is the final one, only meaningful for long-horizon tasks
         return True
+
+    def get_decided_outcome(self, info):
+        # given the info of the latest step, return a short reason if the final success of the episode can no longer
+        # change (so the episode may be stopped early), or None if the outcome is still open
+        return None
     
     
     
@@ -445,21 +686,7 @@ class CustomOtherObjectsInSceneEnv(CustomSceneEnv):
     def _check_assets(self):
         models_dir = self.asset_root / "models"
         for model_id in self.model_ids:
-            model_dir = models_dir / model_id
-            if not model_dir.exists():
-                raise FileNotFoundError(
-                    f"{model_dir} is not found."
-                    "If you installed this repo through 'pip install .', or if you stored the assets outside of ManiSkill2_real2sim/data, "
-                    "you need to set the following environment variable: export MS2_REAL2SIM_ASSET_DIR={path_to_your_ManiSkill2_real2sim_assets} . "
-                    "(for example, you can download this directory https://github.com/simpler-env/ManiSkill2_real2sim/tree/main/data and set the env variable to the downloaded directory). "
-                    "Additionally, for assets in the original ManiSkill2 repo, you can copy the assets into the directory that corresponds to MS2_REAL2SIM_ASSET_DIR."
-                )
-
-            collision_file = model_dir / "collision.obj"
-            if not collision_file.exists():
-                raise FileNotFoundError(
-                    "convex.obj has been renamed to collision.obj. "
-                )
+            model_asset_files(str(models_dir / model_id))
                 
     @staticmethod
     def _build_actor_helper(
@@ -471,9 +698,8 @@ class CustomOtherObjectsInSceneEnv(CustomSceneEnv):
         root_dir: str = ASSET_DIR / "custom",
     ):
         builder = scene.create_actor_builder()
-        model_dir = Path(root_dir) / "models" / model_id
+        collision_file, visual_file = model_asset_files(str(Path(root_dir) / "models" / model_id))
 
-        collision_file = str(model_dir / "collision.obj")
         builder.add_multiple_collisions_from_file(
             filename=collision_file,
             scale=[scale] * 3,
@@ -481,11 +707,6 @@ class CustomOtherObjectsInSceneEnv(CustomSceneEnv):
             density=density,
         )
 
-        visual_file = str(model_dir / "textured.obj")
-        if not os.path.exists(visual_file):
-            visual_file = str(model_dir / "textured.dae")
-            if not os.path.exists(visual_file):
-                visual_file = str(model_dir / "textured.glb")
         builder.add_visual_from_file(filename=visual_file, scale=[scale] * 3)
 
         actor = builder.build()
@@ -299,7 +299,8 @@ class GraspSingleInSceneEnv(CustomSceneEnv):
 
         # Lock rotation around x and y to let the target object fall onto the table
         self.obj.lock_motion(0, 0, 0, 1, 1, 0)
-        self._settle(0.5)
+        # the distractors are not placed yet, so only wait for the target object
+        self._settle(0.5, actors=[self.obj])
 
         # Unlock motion
         self.obj.lock_motion(0, 0, 0, 0, 0, 0)
@@ -307,20 +308,20 @@ class GraspSingleInSceneEnv(CustomSceneEnv):
         self.obj.set_pose(self.obj.pose)
         self.obj.set_velocity(np.zeros(3))
         self.obj.set_angular_velocity(np.zeros(3))
-        self._settle(0.5)
+        self._settle(0.5, actors=[self.obj])
 
         # Some objects need longer time to settle
         lin_vel = np.linalg.norm(self.obj.velocity)
         ang_vel = np.linalg.norm(self.obj.angular_velocity)
         if lin_vel > 1e-3 or ang_vel > 1e-2:
-            self._settle(1.5)
+            self._settle(1.5, actors=[self.obj])
 
         # Record the object height after it settles
         self.obj_height_after_settle = self.obj.pose.p[2]
 
         if len(self.distractor_objs) > 0:
             # Set distractor objects
-            for distractor_obj in self.distractor_objs:
+            for i, distractor_obj in enumerate(self.distractor_objs):
                 distractor_obj_init_options = self.distractor_obj_init_options.get(
                     distractor_obj.name, {}
                 )
@@ -365,7 +366,7 @@ class GraspSingleInSceneEnv(CustomSceneEnv):
                 #     self._scene.step()
 
                 # Let distractor objects fall onto the table
-                self._settle(0.5)
+                self._settle(0.5, actors=[self.obj] + self.distractor_objs[: i + 1])
 
             # Unlock motion
             for distractor_obj in self.distractor_objs:
@@ -26,6 +26,7 @@ class GraspSingleInSceneCustomizableEnv(CustomSceneEnv):
             slightly_brighter_lighting: bool = False,
             darker_lighting: bool = False,
             prepackaged_config: bool = False,
+            use_actor_pool: bool = False,
             **kwargs,
     ):
         if isinstance(distractor_model_ids, str):
@@ -58,6 +59,12 @@ class GraspSingleInSceneCustomizableEnv(CustomSceneEnv):
 
         self.lighting_cfgs = None
 
+        # With use_actor_pool, objects are built once per scene and kept in the actor pool, keyed by
+        # (model_id, scale, is_target); the ones an episode does not use are parked off-stage, so a new set of objects
+        # needs no reconfigure
+        self.use_actor_pool = use_actor_pool
+        self._applied_camera_cfgs = None
+
         self.prepackaged_config = prepackaged_config
         if self.prepackaged_config:
             # use prepackaged evaluation configs (visual matching)
@@ -84,18 +91,46 @@ class GraspSingleInSceneCustomizableEnv(CustomSceneEnv):
 
     def _load_actors(self):
         self._load_arena_helper()
-        self._load_model()
-        self.obj.set_damping(0.1, 0.1)
+        self._actor_pool = {}  # the pool of the previous scene is gone with it
+        if self.use_actor_pool:
+            self._activate_pooled_actors()
+        else:
+            self._load_model()
+            self.obj.set_damping(0.1, 0.1)
 
     def _load_model(self):
         """Load the target object."""
         raise NotImplementedError
 
+    def _build_object(self, model_id, model_scale):
+        """Build one object of the model db (needed by use_actor_pool)."""
+        raise NotImplementedError
+
+    def _build_pooled_actor(self, key):
+        model_id, model_scale, is_target = key
+        actor = self._build_object(model_id, model_scale)
+        if is_target:
+            actor.set_damping(0.1, 0.1)
+        return actor
+
+    def _activate_pooled_actors(self):
+        """Take the target and distractor objects of the episode from the actor pool."""
+        keys = [(self.model_id, self.model_scale, True)]
+        if self.selected_distractor_model_ids is not None:
+            for distractor_model_id, distractor_model_scale in zip(
+                    self.selected_distractor_model_ids,
+                    self.selected_distractor_model_scales,
+            ):
+                keys.append((distractor_model_id, distractor_model_scale, False))
+        actors = self._take_pooled_actors(keys)
+        self.obj, self.distractor_objs = actors[0], actors[1:]
+
     def reset(self, seed=None, options=None):
-        # remove distractor objects
-        for distractor_obj in self.distractor_objs:
-            self._scene.remove_actor(distractor_obj)
-        self.distractor_objs = []
+        if not self.use_actor_pool:
+            # remove distractor objects
+            for distractor_obj in self.distractor_objs:
+                self._scene.remove_actor(distractor_obj)
+            self.distractor_objs = []
 
         if options is None:
             options = dict()
@@ -112,30 +147,42 @@ class GraspSingleInSceneCustomizableEnv(CustomSceneEnv):
         model_id = options.get("model_id", None)
         reconfigure = options.get("reconfigure", False)
         _reconfigure = self._set_model(model_id, model_scale)
-        reconfigure = _reconfigure or reconfigure
+        # a pooled object is swapped in without rebuilding the scene
+        reconfigure = (_reconfigure and not self.use_actor_pool) or reconfigure
         # if self.distractor_model_ids is not None:
         distractor_model_scales = options.get("distractor_model_scales", None)
         distractor_model_ids = options.get("distractor_model_ids", None)
         if distractor_model_ids is not None:
-            reconfigure = True
+            reconfigure = reconfigure or not self.use_actor_pool
             self._set_distractor_models(
                 distractor_model_ids, distractor_model_scales
             )
+        elif self.use_actor_pool:
+            self.selected_distractor_model_ids = None
+            self.selected_distractor_model_scales = None
 
         if self.prepackaged_config:
             _reconfigure = self._additional_prepackaged_config_reset(options)
             reconfigure = reconfigure or _reconfigure
 
-        if options.get("camera_cfgs", None) is not None:
+        # with the actor pool, cameras and lights are only set up again when they change
+        camera_cfgs = options.get("camera_cfgs", None)
+        if camera_cfgs is not None and (not self.use_actor_pool or camera_cfgs != self._applied_camera_cfgs):
             reconfigure = True
 
         lighting_cfgs = options.get("lighting_cfgs", None)
 
         if lighting_cfgs is not None:
+            if not self.use_actor_pool or lighting_cfgs != self.lighting_cfgs:
+                reconfigure = True
             self.lighting_cfgs = lighting_cfgs
-            reconfigure = True
 
         options["reconfigure"] = reconfigure
+        if reconfigure and camera_cfgs is not None:
+            self._applied_camera_cfgs = camera_cfgs
+        if self.use_actor_pool and not reconfigure:
+            self._activate_pooled_actors()
+            self._actors = self.get_actors()
 
         self.consecutive_grasp = 0
         self.lifted_obj = False
@@ -335,6 +382,7 @@ class GraspSingleInSceneCustomizableEnv(CustomSceneEnv):
             ori = self._episode_rng.uniform(0, init_rand_axis_rot_range)
             q = qmult(q, axangle2quat(axis, ori, True))
         self.obj.set_pose(sapien.Pose(p, q))
+        self.obj.unhide_visual()  # pooled actors are hidden while parked (see _take_pooled_actors)
 
         # Move the robot far away to avoid collision
         # The robot should be initialized later in _initialize_agent (in base_env.py)
@@ -342,7 +390,8 @@ class GraspSingleInSceneCustomizableEnv(CustomSceneEnv):
 
         # Lock rotation around x and y to let the target object fall onto the table
         self.obj.lock_motion(0, 0, 0, 1, 1, 0)
-        self._settle(0.5)
+        # the distractors are not placed yet, so only wait for the target object
+        self._settle(0.5, actors=[self.obj])
 
         # Unlock motion
         self.obj.lock_motion(0, 0, 0, 0, 0, 0)
@@ -350,20 +399,20 @@ class GraspSingleInSceneCustomizableEnv(CustomSceneEnv):
         self.obj.set_pose(self.obj.pose)
         self.obj.set_velocity(np.zeros(3))
         self.obj.set_angular_velocity(np.zeros(3))
-        self._settle(0.5)
+        self._settle(0.5, actors=[self.obj])
 
         # Some objects need longer time to settle
         lin_vel = np.linalg.norm(self.obj.velocity)
         ang_vel = np.linalg.norm(self.obj.angular_velocity)
         if lin_vel > 1e-3 or ang_vel > 1e-2:
-            self._settle(1.5)
+            self._settle(1.5, actors=[self.obj])
 
         # Record the object height after it settles
         self.obj_height_after_settle = self.obj.pose.p[2]
 
         if len(self.distractor_objs) > 0:
             # Set distractor objects
-            for distractor_obj in self.distractor_objs:
+            for i, distractor_obj in enumerate(self.distractor_objs):
                 distractor_obj_init_options = self.distractor_obj_init_options.get(
                     distractor_obj.name, {}
                 )
@@ -409,6 +458,7 @@ class GraspSingleInSceneCustomizableEnv(CustomSceneEnv):
                     else distractor_init_rot_quat
                 )
                 distractor_obj.set_pose(sapien.Pose(p, q))
+                distractor_obj.unhide_visual()
                 distractor_obj.set_velocity(np.zeros(3))
                 distractor_obj.set_angular_velocity(np.zeros(3))
                 # Lock rotation around x and y
@@ -426,7 +476,7 @@ class GraspSingleInSceneCustomizableEnv(CustomSceneEnv):
                 #     self._scene.step()
 
                 # Let distractor objects fall onto the table
-                self._settle(0.5)
+                self._settle(0.5, actors=[self.obj] + self.distractor_objs[: i + 1])
 
             # Unlock motion
             for distractor_obj in self.distractor_objs:
@@ -521,6 +571,15 @@ class GraspSingleInSceneCustomizableEnv(CustomSceneEnv):
             episode_stats=self.episode_stats,
         )
 
+    def get_decided_outcome(self, info):
+        if self.success_from_episode_stats and self.episode_stats["n_lift_significant"] >= 5:
+            # success is latched for the rest of the episode
+            return "success_latched"
+        if not info["success"] and self.obj.pose.p[2] - self.obj_height_after_settle < -0.15:
+            # the object is knocked off the table and can no longer be lifted
+            return "obj_off_table"
+        return None
+
 
 # ---------------------------------------------------------------------------- #
 # Custom Assets
@@ -554,13 +613,22 @@ class GraspSingleCustomInSceneEnv(GraspSingleInSceneCustomizableEnv, CustomOther
         super().__init__(**kwargs)
 
     def _load_model(self):
-        density = self.model_db[self.model_id].get("density", 1000)
+        self.obj = self._build_object(self.model_id, self.model_scale)
+
+        if self.selected_distractor_model_ids is not None:
+            for distractor_model_id, distractor_model_scale in zip(
+                    self.selected_distractor_model_ids,
+                    self.selected_distractor_model_scales,
+            ):
+                distractor_obj = self._build_object(distractor_model_id, distractor_model_scale)
+                self.distractor_objs.append(distractor_obj)
 
-        self.obj = self._build_actor_helper(
-            self.model_id,
+    def _build_object(self, model_id, model_scale):
+        obj = self._build_actor_helper(
+            model_id,
             self._scene,
-            scale=self.model_scale,
-            density=density,
+            scale=model_scale,
+            density=self.model_db[model_id].get("density", 1000),
             physical_material=self._scene.create_physical_material(
                 static_friction=self.obj_static_friction,
                 dynamic_friction=self.obj_dynamic_friction,
@@ -568,27 +636,8 @@ class GraspSingleCustomInSceneEnv(GraspSingleInSceneCustomizableEnv, CustomOther
             ),
             root_dir=self.asset_root,
         )
-        self.obj.name = self.model_id
-
-        if self.selected_distractor_model_ids is not None:
-            for distractor_model_id, distractor_model_scale in zip(
-                    self.selected_distractor_model_ids,
-                    self.selected_distractor_model_scales,
-            ):
-                distractor_obj = self._build_actor_helper(
-                    distractor_model_id,
-                    self._scene,
-                    scale=distractor_model_scale,
-                    density=self.model_db[distractor_model_id].get("density", 1000),
-                    physical_material=self._scene.create_physical_material(
-                        static_friction=self.obj_static_friction,
-                        dynamic_friction=self.obj_dynamic_friction,
-                        restitution=0.0,
-                    ),
-                    root_dir=self.asset_root,
-                )
-                distractor_obj.name = distractor_model_id
-                self.distractor_objs.append(distractor_obj)
+        obj.name = model_id
+        return obj
 
     def _get_init_z(self):
         bbox_min = self.model_db[self.model_id]["bbox"]["min"]
@@ -26,6 +26,7 @@ class MoveNearInSceneCustomizableEnv(CustomSceneEnv):
             slightly_brighter_lighting: bool = False,
             ambient_only_lighting: bool = False,
             prepackaged_config: bool = False,
+            use_actor_pool: bool = False,
             **kwargs,
     ):
         self.episode_objs = [None] * 3
@@ -52,6 +53,10 @@ class MoveNearInSceneCustomizableEnv(CustomSceneEnv):
 
         self.lighting_cfgs = None
 
+        # With use_actor_pool, objects are built once per scene and kept in the actor pool, keyed by (model_id, scale);
+        # the ones an episode does not use are parked off-stage, so a new set of objects needs no reconfigure
+        self.use_actor_pool = use_actor_pool
+
         self.prepackaged_config = prepackaged_config
         if self.prepackaged_config:
             # use prepackaged evaluation configs (visual matching)
@@ -174,14 +179,33 @@ class MoveNearInSceneCustomizableEnv(CustomSceneEnv):
 
     def _load_actors(self):
         self._load_arena_helper()
-        self._load_model()
-        for obj in self.episode_objs:
-            obj.set_damping(0.1, 0.1)
+        self._actor_pool = {}  # the pool of the previous scene is gone with it
+        if self.use_actor_pool:
+            self._activate_pooled_actors()
+        else:
+            self._load_model()
+            for obj in self.episode_objs:
+                obj.set_damping(0.1, 0.1)
 
     def _load_model(self):
         """Load the target object."""
         raise NotImplementedError
 
+    def _build_object(self, model_id, model_scale):
+        """Build one object of the model db (needed by use_actor_pool)."""
+        raise NotImplementedError
+
+    def _build_pooled_actor(self, key):
+        obj = self._build_object(*key)
+        obj.set_damping(0.1, 0.1)
+        return obj
+
+    def _activate_pooled_actors(self):
+        """Take the objects of the episode from the actor pool."""
+        self.episode_objs = self._take_pooled_actors(
+            list(zip(self.episode_model_ids, self.episode_model_scales))
+        )
+
     def reset(self, seed=None, options=None):
         if options is None:
             options = dict()
@@ -194,13 +218,17 @@ class MoveNearInSceneCustomizableEnv(CustomSceneEnv):
         model_ids = options.get("model_ids", None)
         reconfigure = options.get("reconfigure", False)
         _reconfigure = self._set_model(model_ids, model_scales)
-        reconfigure = _reconfigure or reconfigure
+        # a pooled object is swapped in without rebuilding the scene
+        reconfigure = (_reconfigure and not self.use_actor_pool) or reconfigure
 
         if self.prepackaged_config:
             _reconfigure = self._additional_prepackaged_config_reset(options)
             reconfigure = reconfigure or _reconfigure
 
         options["reconfigure"] = reconfigure
+        if self.use_actor_pool and not reconfigure:
+            self._activate_pooled_actors()
+            self._actors = self.get_actors()
 
         self._initialize_episode_stats()
 
@@ -339,6 +367,7 @@ class MoveNearInSceneCustomizableEnv(CustomSceneEnv):
             p = np.hstack([obj_init_xys[i], obj_init_z])
             q = obj_init_rot_quats[i]
             obj.set_pose(sapien.Pose(p, q))
+            obj.unhide_visual()  # pooled actors are hidden while parked (see _take_pooled_actors)
             # Lock rotation around x and y
             obj.lock_motion(0, 0, 0, 1, 1, 0)
 
@@ -509,6 +538,17 @@ class MoveNearInSceneCustomizableEnv(CustomSceneEnv):
 
         return ret_info
 
+    def get_decided_outcome(self, info):
+        # an object knocked off the table cannot be brought back, so the episode fails for good
+        # (the same condition fails all_obj_keep_height in evaluate)
+        if info["success"]:
+            return None
+        if self.source_obj_pose.p[2] - self.episode_source_obj_xyz_after_settle[2] < -0.15:
+            return "source_obj_off_table"
+        if self.target_obj_pose.p[2] - self.episode_target_obj_xyz_after_settle[2] < -0.15:
+            return "target_obj_off_table"
+        return None
+
     def compute_dense_reward(self, info, **kwargs):
         reward = 0.0
         if info["success"]:
@@ -587,34 +627,36 @@ class MoveNearGoogleInSceneEnv(MoveNearInSceneCustomizableEnv, CustomOtherObject
         for (model_id, model_scale) in zip(
                 self.episode_model_ids, self.episode_model_scales
         ):
-            if model_id in self.special_density_dict:
-                density = self.special_density_dict[model_id]
-            else:
-                density = self.model_db[model_id].get("density", 1000)
-
-            obj = self._build_actor_helper(
-                model_id,
-                self._scene,
-                scale=model_scale,
-                density=density,
-                physical_material=self._scene.create_physical_material(
-                    static_friction=self.obj_static_friction,
-                    dynamic_friction=self.obj_dynamic_friction,
-                    restitution=0.0,
-                ),
-                root_dir=self.asset_root,
-            )
-            obj.name = model_id
-            self.episode_objs.append(obj)
+            self.episode_objs.append(self._build_object(model_id, model_scale))
 
-        for obj in self.episode_objs:
-            for visual in obj.get_visual_bodies():
-                for rs in visual.get_render_shapes():
-                    mtl = rs.material
-                    mtl.set_roughness(1.0)
-                    mtl.set_metallic(0.0)
-                    mtl.set_specular(0.0)
-                    rs.set_material(mtl)
+    def _build_object(self, model_id, model_scale):
+        if model_id in self.special_density_dict:
+            density = self.special_density_dict[model_id]
+        else:
+            density = self.model_db[model_id].get("density", 1000)
+
+        obj = self._build_actor_helper(
+            model_id,
+            self._scene,
+            scale=model_scale,
+            density=density,
+            physical_material=self._scene.create_physical_material(
+                static_friction=self.obj_static_friction,
+                dynamic_friction=self.obj_dynamic_friction,
+                restitution=0.0,
+            ),
+            root_dir=self.asset_root,
+        )
+        obj.name = model_id
+
+        for visual in obj.get_visual_bodies():
+            for rs in visual.get_render_shapes():
+                mtl = rs.material
+                mtl.set_roughness(1.0)
+                mtl.set_metallic(0.0)
+                mtl.set_specular(0.0)
+                rs.set_material(mtl)
+        return obj
 
 
 @register_env("MoveNearCustomizableYCB-v0", max_episode_steps=120)
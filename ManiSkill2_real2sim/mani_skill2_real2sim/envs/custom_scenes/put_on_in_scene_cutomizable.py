@@ -141,6 +141,11 @@ class PutOnInSceneCustomizableEnv(MoveNearInSceneCustomizableEnv):
             success=success,
         )
 
+    def get_decided_outcome(self, info):
+        # success is src_on_target at the latest step, whatever happened before, and a drop of the source object is
+        # not a failure here (in PutIn it is dropped into the sink on purpose), so the outcome is never decided early
+        return None
+
     def get_language_instruction(self, **kwargs):
         src_name = self._get_instruction_obj_name(self.episode_source_obj.name)
         tgt_name = self._get_instruction_obj_name(self.episode_target_obj.name)
@@ -253,22 +258,23 @@ class PutOnBridgeInSceneEnv(PutOnInSceneCustomizableEnv, CustomOtherObjectsInSce
         for (model_id, model_scale) in zip(
                 self.episode_model_ids, self.episode_model_scales
         ):
-            density = self.model_db[model_id].get("density", 1000)
-
-            obj = self._build_actor_helper(
-                model_id,
-                self._scene,
-                scale=model_scale,
-                density=density,
-                physical_material=self._scene.create_physical_material(
-                    static_friction=self.obj_static_friction,
-                    dynamic_friction=self.obj_dynamic_friction,
-                    restitution=0.0,
-                ),
-                root_dir=self.asset_root,
-            )
-            obj.name = model_id
-            self.episode_objs.append(obj)
+            self.episode_objs.append(self._build_object(model_id, model_scale))
+
+    def _build_object(self, model_id, model_scale):
+        obj = self._build_actor_helper(
+            model_id,
+            self._scene,
+            scale=model_scale,
+            density=self.model_db[model_id].get("density", 1000),
+            physical_material=self._scene.create_physical_material(
+                static_friction=self.obj_static_friction,
+                dynamic_friction=self.obj_dynamic_friction,
+                restitution=0.0,
+            ),
+            root_dir=self.asset_root,
+        )
+        obj.name = model_id
+        return obj
 
 
 @register_env("PutOnCustomizable-v0", max_episode_steps=120)
@@ -393,8 +399,9 @@ class PutInCustomizableScene(PutOnBridgeInSceneEnv):
         tgt_name = self._get_instruction_obj_name(self._target_obj_name)
         return f"put the {src_name} into the yellow basket"
 
-    def _load_model(self):
-        super()._load_model()
+    def _load_actors(self):
+        # the sink belongs to the scene rather than to the episode objects, so it is also built with use_actor_pool
+        super()._load_actors()
         self.sink_id = 'sink'
         self.sink = self._build_actor_helper(
             self.sink_id,
@@ -0,0 +1,19 @@
+from functools import lru_cache
+
+# words of asset names that are not part of how the object is referred to in a language instruction
+INSTRUCTION_NAME_STOP_WORDS = frozenset(
+    ["opened", "light", "generated", "modified", "objaverse", "bridge", "baked", "v2"]
+)
+
+
+@lru_cache(maxsize=None)
+def clean_object_name(name: str) -> str:
+    """Turn an asset name (e.g., "opened_coke_can", "green_cube_3cm") into its instruction name ("coke can")."""
+    cleaned = []
+    for w in name.split("_"):
+        if w[-2:] == "cm":
+            # object size in object name
+            continue
+        if w not in INSTRUCTION_NAME_STOP_WORDS:
+            cleaned.append(w)
+    return " ".join(cleaned)
@@ -0,0 +1,170 @@
+"""Simplified, pre-cooked colliders of scene stages.
+
+The non-convex collision mesh of a whole stage (e.g., google_pick_coke_can_1_v4.glb) is cooked again on every
+reconfigure. Episodes only ever touch the horizontal surfaces of the workspace (the table top and the floor), so a stage
+can instead be given a collider of a few boxes: every large horizontal surface inside the workspace bounds is rasterized
+and covered by thin slabs whose tops lie exactly at the surface height. The boxes are computed offline and saved next to
+the stage as {stage}.collider.json, and loaded by CustomSceneEnv with stage_collision="simplified".
+
+Usage:
+    python -m mani_skill2_real2sim.utils.stage_collider --stage data/hab2_bench_assets/stages/google_pick_coke_can_1_v4.glb \
+        --offset -1.6616 -3.0337 0 --bounds -1.0 -1.0 0.0 0.5 1.0 1.2
+"""
+
+import argparse
+import json
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from transforms3d.quaternions import quat2mat
+
+STAGE_COLLIDER_VERSION = 1
+
+
+def stage_collider_path(stage_path) -> str:
+    stage_path = str(stage_path)
+    return (stage_path[: -len(".glb")] if stage_path.endswith(".glb") else stage_path) + ".collider.json"
+
+
+def _merge_rectangles(grid: np.ndarray):
+    """Cover the True cells of a 2D grid with disjoint rectangles (i0, j0, i1, j1), greedily row by row."""
+    grid = grid.copy()
+    nx, ny = grid.shape
+    rects = []
+    for i in range(nx):
+        j = 0
+        while j < ny:
+            if not grid[i, j]:
+                j += 1
+                continue
+            j1 = j
+            while j1 < ny and grid[i, j1]:
+                j1 += 1
+            i1 = i + 1
+            while i1 < nx and grid[i1, j:j1].all():
+                i1 += 1
+            grid[i:i1, j:j1] = False
+            rects.append((i, j, i1, j1))
+            j = j1
+    return rects
+
+
+def _rasterize(triangles: np.ndarray, origin: np.ndarray, shape, pitch: float) -> np.ndarray:
+    """Grid cells (of size pitch, starting at origin) whose centers lie in any of the triangles, projected onto xy."""
+    grid = np.zeros(shape, dtype=bool)
+    for tri in triangles[:, :, :2]:
+        lo = np.clip(np.floor((tri.min(0) - origin) / pitch).astype(int), 0, np.array(shape) - 1)
+        hi = np.clip(np.ceil((tri.max(0) - origin) / pitch).astype(int), 0, np.array(shape))
+        ii, jj = np.meshgrid(np.arange(lo[0], hi[0]), np.arange(lo[1], hi[1]), indexing="ij")
+        centers = origin + (np.stack([ii, jj], axis=-1) + 0.5) * pitch
+        # barycentric coordinates of the cell centers
+        v0, v1, v2 = tri[1] - tri[0], tri[2] - tri[0], centers - tri[0]
+        denom = v0[0] * v1[1] - v1[0] * v0[1]
+        if abs(denom) < 1e-12:
+            continue
+        a = (v2[..., 0] * v1[1] - v1[0] * v2[..., 1]) / denom
+        b = (v0[0] * v2[..., 1] - v2[..., 0] * v0[1]) / denom
+        inside = (a >= 0) & (b >= 0) & (a + b <= 1)
+        grid[ii[inside], jj[inside]] = True
+    return grid
+
+
+def stage_collider_boxes(
+    vertices: np.ndarray,
+    faces: np.ndarray,
+    bounds: np.ndarray,
+    pitch: float = 0.01,
+    thickness: float = 0.05,
+    min_area: float = 0.02,
+    level_tol: float = 0.005,
+    normal_tol: float = 0.99,
+) -> np.ndarray:
+    """Boxes [cx, cy, cz, hx, hy, hz] covering the horizontal surfaces of a mesh inside bounds ([[min xyz], [max xyz]]).
+
+    Horizontal triangles are grouped into levels of level_tol height; every level of at least min_area m^2 is rasterized
+    at pitch and covered by slabs of the given thickness, with their tops at the (area-weighted) height of the level.
+    """
+    bounds = np.asarray(bounds, dtype=np.float64)
+    triangles = vertices[faces]
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    areas = np.linalg.norm(normals, axis=-1) / 2
+    horizontal = np.abs(normals[:, 2]) > normal_tol * np.maximum(2 * areas, 1e-12)
+    heights = triangles[:, :, 2].mean(axis=1)
+    # triangles reaching into the bounds; the rasterization clips them to the bounds
+    xy_min, xy_max = triangles[:, :, :2].min(axis=1), triangles[:, :, :2].max(axis=1)
+    inside = ((xy_max >= bounds[0, :2]) & (xy_min <= bounds[1, :2])).all(axis=-1)
+    inside &= (heights >= bounds[0, 2]) & (heights <= bounds[1, 2])
+    keep = horizontal & inside & (areas > 0)
+    triangles, areas, heights = triangles[keep], areas[keep], heights[keep]
+
+    origin = bounds[0, :2]
+    shape = tuple(np.ceil((bounds[1, :2] - bounds[0, :2]) / pitch).astype(int))
+    levels = np.round(heights / level_tol).astype(np.int64)
+    boxes = []
+    for level in np.unique(levels):
+        members = levels == level
+        if areas[members].sum() < min_area:
+            continue
+        height = np.average(heights[members], weights=areas[members])
+        grid = _rasterize(triangles[members], origin, shape, pitch)
+        for i0, j0, i1, j1 in _merge_rectangles(grid):
+            lo, hi = origin + np.array([i0, j0]) * pitch, origin + np.array([i1, j1]) * pitch
+            boxes.append([*(lo + hi) / 2, height - thickness / 2, *(hi - lo) / 2, thickness / 2])
+    return np.array(boxes, dtype=np.float64).reshape(-1, 6)
+
+
+@lru_cache(maxsize=None)
+def load_stage_collider(path: str):
+    """(scene pose [p, q], boxes) of a collider file, read once per process."""
+    with open(path, "r") as f:
+        collider = json.load(f)
+    if collider.get("version") != STAGE_COLLIDER_VERSION:
+        raise ValueError(f"{path} was written by another version of stage_collider.py, please build it again")
+    return collider["scene_pose"], np.array(collider["boxes"], dtype=np.float64).reshape(-1, 6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the simplified collider of a scene stage.")
+    parser.add_argument("--stage", type=str, required=True, help="Stage file, e.g., stages/bridge_table_1_v1.glb")
+    parser.add_argument("--pose-p", type=float, nargs=3, default=[0.0, 0.0, 0.0], help="Position of the scene pose")
+    parser.add_argument(
+        "--pose-q", type=float, nargs=4, default=[0.707, 0.707, 0.0, 0.0],
+        help="Quaternion (wxyz) of the scene pose; the default turns the y-up Habitat stages z-up",
+    )
+    parser.add_argument("--offset", type=float, nargs=3, required=True, help="Scene offset of the env")
+    parser.add_argument(
+        "--bounds", type=float, nargs=6, required=True,
+        help="Workspace bounds in the world frame: min x y z, max x y z",
+    )
+    parser.add_argument("--pitch", type=float, default=0.01)
+    parser.add_argument("--thickness", type=float, default=0.05)
+    parser.add_argument("--min-area", type=float, default=0.02)
+    parser.add_argument("-o", "--output", type=str, default=None)
+    args = parser.parse_args()
+
+    import trimesh
+
+    mesh = trimesh.load(args.stage, force="mesh")
+    # the collider is built in the frame of the arena actor: the stage posed by the scene pose, before the offset
+    vertices = np.asarray(mesh.vertices) @ quat2mat(args.pose_q).T + np.array(args.pose_p)
+    bounds = np.array(args.bounds).reshape(2, 3) + np.array(args.offset)
+    boxes = stage_collider_boxes(
+        vertices, np.asarray(mesh.faces), bounds, args.pitch, args.thickness, args.min_area
+    )
+    output = args.output or stage_collider_path(args.stage)
+    with open(output, "w") as f:
+        json.dump(
+            dict(
+                version=STAGE_COLLIDER_VERSION,
+                stage=Path(args.stage).name,
+                scene_pose=[args.pose_p, args.pose_q],
+                boxes=boxes.tolist(),
+            ),
+            f,
+        )
+    print(f"Saved {len(boxes)} boxes to {output}")
+
+
+if __name__ == "__main__":
+    main()
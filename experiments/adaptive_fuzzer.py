@@ -0,0 +1,354 @@
+"""Coverage-guided adaptive fuzzing: generate more scenarios around the coverage cells that are novel or fail often."""
+import argparse
+import os
+import shutil
+from collections import Counter
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from experiments.manifest import dump_json_atomic
+from experiments.run_fuzzer import get_task, make_frame_sink, save_result
+from experiments.scenario_dataset import ScenarioWriter
+from experiments.scene_feasibility import TASK_CATALOGS, SceneFeasibility, scene_objects
+from experiments.test_generation import GENERATORS
+from experiments.worker_pool import ScenarioWorkerPool
+
+# Setup paths
+PACKAGE_DIR = Path(__file__).parent.resolve()
+
+
+def outcome_label(final_info):
+    """Coarse outcome of an episode from the info of its last step."""
+    if final_info.get("success"):
+        return "success"
+    if final_info.get("moved_wrong_obj"):
+        return "moved_wrong_obj"
+    if any(final_info.get(k) for k in ("is_grasped", "consecutive_grasp", "is_src_obj_grasped")):
+        return "grasped_not_completed"
+    return "not_grasped"
+
+
+def record_result(result_dir, image_dir, idx, run_kwargs, images, episode_stats, **save_kwargs):
+    # runs inside the worker: save the episode like run_fuzzer, and only send the scalars of its last step back
+    save_result(result_dir, image_dir, idx, run_kwargs, images, episode_stats, **save_kwargs)
+    if not episode_stats:
+        return {}
+    final_info = episode_stats[max(episode_stats.keys())]
+    return {k: v.item() if isinstance(v, np.generic) else v for k, v in final_info.items()
+            if isinstance(v, (bool, int, float, str, np.bool_, np.number))}
+
+
+class CoverageMap:
+    """Incremental run and failure counts of coverage cells.
+
+    A scenario covers a handful of cells (see AdaptiveScheduler.cells), e.g., ("source", "coke can") or
+    ("distractor", 2, 1, "standing"). Cells with few runs are novel, and the failure rate of a cell is the mean of its
+    Beta(1, 1) posterior, so cells that were never run count as 50% failing.
+    """
+
+    def __init__(self):
+        self.runs = Counter()
+        self.failures = Counter()
+
+    def add(self, cells, failed):
+        for cell in cells:
+            self.runs[cell] += 1
+            self.failures[cell] += int(failed)
+
+    def novelty(self, cells, pending=None):
+        runs = np.array([self.runs[cell] + (pending[cell] if pending else 0) for cell in cells])
+        return float(np.mean(1 / np.sqrt(1 + runs)))
+
+    def failure_rate(self, cells):
+        return float(np.mean([(self.failures[cell] + 1) / (self.runs[cell] + 2) for cell in cells]))
+
+    def summary(self, top=20, min_runs=3):
+        rates = [(self.failures[cell] / runs, runs, cell) for cell, runs in self.runs.items() if runs >= min_runs]
+        rates.sort(key=lambda v: v[:2], reverse=True)
+        return {
+            "num_cells": len(self.runs),
+            "top_failure_cells": [{"cell": list(cell), "runs": runs, "failure_rate": rate}
+                                  for rate, runs, cell in rates[:top]],
+        }
+
+
+class AdaptiveScheduler:
+    """Pick the next scenarios to run from fresh random ones and mutants of failing ones, steered by a CoverageMap.
+
+    Scenarios are scheduled in rounds of round_size. Each round draws pool_factor * round_size candidates, part of them
+    from generator.generate_options_batch (exploration) and the rest by mutating scenarios that failed (moving,
+    rotating, swapping, adding or removing an object). The share of mutants follows how often mutants fail compared to
+    fresh scenarios, but at least min_explore of every round is fresh. Infeasible candidates (overlapping bounding
+    boxes, objects closer than the generator's safe_dist) are dropped, and the round is filled greedily with the
+    candidates of the highest novelty + risk_weight * failure rate, counting the cells of the already picked ones as
+    pending so a round spreads out.
+    """
+
+    def __init__(self, generator, task, rng, ycb=False, round_size=32, pool_factor=4, min_explore=0.2, risk_weight=1.0,
+                 bins=4, sigma=0.05):
+        self.generator = generator
+        self.task = task
+        self.rng = rng
+        self.round_size = round_size
+        self.pool_factor = pool_factor
+        self.min_explore = min_explore
+        self.risk_weight = risk_weight
+        self.bins = bins
+        self.sigma = sigma
+        self.catalog = generator.catalog
+        self.low = np.array([r[0] for r in generator.safe_rage])
+        self.high = np.array([r[1] for r in generator.safe_rage])
+        self.safe_dist = getattr(generator, "safe_dist", 0)
+        self.max_objects = generator.max_obstacles + (1 if task == "grasp" else 2)
+        self.feasibility = SceneFeasibility(TASK_CATALOGS[(task, ycb)], generator.safe_rage)
+        self.coverage = CoverageMap()
+        self.corpus = []  # [options, number of mutants] of failing scenarios
+        self.origins = {"explore": [0, 0], "mutate": [0, 0]}  # origin -> [runs, failures]
+        self.outcomes = Counter()
+        self.queue = []
+
+    # Scenario layout: grasp scenarios name one target plus distractors, the other tasks a list of objects with a source
+    # and a target index. Both are handled as a list of [model_id, xy, quat] and the roles of its entries.
+
+    def _unpack(self, options):
+        objects = [[model_id, list(xy), list(quat) if quat is not None else [1.0, 0.0, 0.0, 0.0]]
+                   for model_id, xy, quat in scene_objects(options)]
+        if self.task == "grasp":
+            return objects, 0, None
+        return objects, options["source_obj_id"], options["target_obj_id"]
+
+    def _pack(self, objects, source, target):
+        if self.task == "grasp":
+            options = {"model_id": objects[0][0], "obj_init_options": {"init_xy": objects[0][1],
+                                                                       "orientation": objects[0][2]}}
+            if len(objects) > 1:
+                options["distractor_model_ids"] = [obj[0] for obj in objects[1:]]
+                options["distractor_obj_init_options"] = {obj[0]: {"init_xy": obj[1], "init_rot_quat": obj[2]}
+                                                          for obj in objects[1:]}
+            return options
+        return {
+            "model_ids": [obj[0] for obj in objects],
+            "obj_init_options": {obj[0]: {"init_xy": obj[1], "init_rot_quat": obj[2]} for obj in objects},
+            "source_obj_id": source,
+            "target_obj_id": target,
+        }
+
+    def _roles(self, num_objects, source, target):
+        roles = ["distractor"] * num_objects
+        roles[source] = "source"
+        if target is not None:
+            roles[target] = "target"
+        return roles
+
+    def cells(self, options):
+        """Coverage cells of a scenario: its object count, and per object its name and its binned pose by role."""
+        objects, source, target = self._unpack(options)
+        cells = [("objects", len(objects))]
+        for (model_id, xy, quat), role in zip(objects, self._roles(len(objects), source, target)):
+            x_bin, y_bin = np.clip(((np.array(xy) - self.low) / (self.high - self.low) * self.bins).astype(int),
+                                   0, self.bins - 1).tolist()
+            if abs(quat[1]) > 0.5:
+                orientation = "standing"
+            else:
+                orientation = f"yaw{int((2 * np.arctan2(quat[3], quat[0]) + np.pi) / (2 * np.pi) * 4) % 4}"
+            cells += [(role, self.catalog.cleaned_name(model_id)), (role, x_bin, y_bin, orientation)]
+        return cells
+
+    def _fixed(self, idx, target):
+        # the target of put-on keeps its plate/cloth and orientation, the sink of put-in does not change at all
+        return self.task in ("put-on", "put-in") and idx == target
+
+    def _new_object(self, used_groups):
+        for _ in range(10):
+            model_id = self.catalog.names[self.rng.integers(len(self.catalog))]
+            if self.catalog.cleaned_name(model_id) not in used_groups:
+                return model_id
+        return None
+
+    def _new_orientation(self):
+        return self.generator._sample_orientations_batch(self.rng, (1,))[0].tolist()
+
+    def _mutate(self, options):
+        objects, source, target = self._unpack(options)
+        for _ in range(self.rng.integers(1, 3)):
+            op = self.rng.choice(["move", "rotate", "swap", "add", "remove"])
+            idx = int(self.rng.integers(len(objects)))
+            if op == "move" and not (self.task == "put-in" and idx == target):
+                objects[idx][1] = np.clip(np.array(objects[idx][1]) + self.rng.normal(0, self.sigma, 2),
+                                          self.low, self.high).tolist()
+            elif op == "rotate" and not self._fixed(idx, target):
+                objects[idx][2] = self._new_orientation()
+            elif op == "swap" and not self._fixed(idx, target):
+                used = {self.catalog.cleaned_name(obj[0]) for i, obj in enumerate(objects) if i != idx}
+                model_id = self._new_object(used)
+                if model_id is not None:
+                    objects[idx][0] = model_id
+            elif op == "add" and len(objects) < self.max_objects:
+                model_id = self._new_object({self.catalog.cleaned_name(obj[0]) for obj in objects})
+                if model_id is not None:
+                    objects.append([model_id, self.rng.uniform(self.low, self.high).tolist(),
+                                    self._new_orientation()])
+            elif op == "remove":
+                distractors = [i for i in range(len(objects)) if i != source and i != target]
+                if distractors:
+                    idx = distractors[self.rng.integers(len(distractors))]
+                    objects.pop(idx)
+                    source -= int(source > idx)
+                    if target is not None:
+                        target -= int(target > idx)
+        return self._pack(objects, source, target)
+
+    def _far_enough(self, options):
+        if self.safe_dist <= 0:
+            return True
+        xy = np.array([obj[1] for obj in self._unpack(options)[0]])
+        dist = np.linalg.norm(xy[:, None] - xy[None], axis=-1)
+        return bool((dist[np.triu_indices(len(xy), 1)] >= self.safe_dist).all())
+
+    def mutate_share(self):
+        if not self.corpus:
+            return 0.0
+        explore_runs, explore_failures = self.origins["explore"]
+        mutate_runs, mutate_failures = self.origins["mutate"]
+        explore_rate = (explore_failures + 1) / (explore_runs + 2)
+        mutate_rate = (mutate_failures + 1) / (mutate_runs + 2)
+        return min(mutate_rate / (explore_rate + mutate_rate), 1 - self.min_explore)
+
+    def _next_round(self):
+        pool_size = self.pool_factor * self.round_size
+        num_mutants = int(round(pool_size * self.mutate_share()))
+        candidates = [(options, "explore") for options in
+                      self.generator.generate_options_batch(pool_size - num_mutants, self.rng)]
+        if num_mutants:
+            weights = 1 / (1 + np.array([children for _, children in self.corpus], dtype=np.float64))
+            for parent in self.rng.choice(len(self.corpus), size=num_mutants, p=weights / weights.sum()):
+                self.corpus[parent][1] += 1
+                candidates.append((self._mutate(self.corpus[parent][0]), "mutate"))
+        feasible, _ = self.feasibility.check([options for options, _ in candidates])
+        candidates = [c for c, ok in zip(candidates, feasible) if ok and self._far_enough(c[0])]
+        cells = [self.cells(options) for options, _ in candidates]
+        risk = np.array([self.coverage.failure_rate(c) for c in cells])
+        pending = Counter()
+        num_picks = min(self.round_size, len(candidates))
+        num_explore = min(int(np.ceil(self.min_explore * num_picks)), sum(origin == "explore" for _, origin in candidates))
+        for pick in range(num_picks):
+            scores = np.array([self.coverage.novelty(c, pending) for c in cells]) + self.risk_weight * risk
+            if num_explore >= num_picks - pick:
+                # the last picks of a round go to fresh scenarios until min_explore of it is fresh
+                scores[[origin != "explore" for _, origin in candidates]] = -np.inf
+            best = int(np.argmax(scores))
+            num_explore -= candidates[best][1] == "explore"
+            self.queue.append(candidates.pop(best))
+            pending.update(cells.pop(best))
+            risk = np.delete(risk, best)
+
+    def next_scenario(self):
+        """Return (options, origin) of the next scenario to run, origin being "explore" or "mutate"."""
+        while not self.queue:
+            self._next_round()
+        return self.queue.pop(0)
+
+    def report(self, options, origin, final_info):
+        """Feed back the outcome of a scheduled scenario (the info of its last step)."""
+        label = outcome_label(final_info)
+        failed = label != "success"
+        self.outcomes[label] += 1
+        self.origins[origin][0] += 1
+        self.origins[origin][1] += int(failed)
+        self.coverage.add(self.cells(options), failed)
+        if failed:
+            self.corpus.append([options, 0])
+
+    def summary(self):
+        return dict(self.coverage.summary(), outcomes=dict(self.outcomes), origins=self.origins,
+                    corpus_size=len(self.corpus))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="VLA Adaptive Fuzzing")
+    parser.add_argument('-t', '--task', type=str, choices=["grasp", "move", "put-in", "put-on"], default="grasp",
+                        help="VLA Task")
+    parser.add_argument('-n', '--num', type=int, default=100, help="Number of scenarios to run")
+    parser.add_argument('-s', '--seed', type=int, default=None, help="Random Seed")
+    parser.add_argument('-m', '--model', type=str,
+                        choices=["rt_1_x", "rt_1_400k", "rt_1_58k", "rt_1_1k", "octo-base", "octo-small",
+                                 "openvla-7b"],
+                        default="rt_1_x", help="VLA model")
+    parser.add_argument('--obstacles', type=int, default=3, help="Max number of obstacles")
+    parser.add_argument('--ycb', type=bool, default=False, help="Use YCB dataset")
+    parser.add_argument('-o', '--output', type=str, default=None, help="Output path, e.g., folder")
+    parser.add_argument('-io', '--image_output', type=str, default=None, help="Image output path, e.g., folder")
+    parser.add_argument('-if', '--image_format', type=str, choices=["jpg", "png", "mp4", "frames"], default="jpg",
+                        help="Save episode images as one file per frame (jpg, png), a video (mp4) or frames")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="Number of worker processes, each with its own environment and model.")
+    parser.add_argument('-rs', '--round_size', type=int, default=32, help="Number of scenarios scheduled per round")
+    parser.add_argument('-me', '--min_explore', type=float, default=0.2,
+                        help="Minimum share of fresh random scenarios in every round")
+    parser.add_argument('-rw', '--risk_weight', type=float, default=1.0,
+                        help="Weight of the failure rate of a scenario's coverage cells against their novelty")
+    parser.add_argument('-es', '--early_stop', type=bool, default=False,
+                        help="Stop an episode as soon as its final success can no longer change.")
+    parser.add_argument('-ps', '--policy_server', type=str, default=None,
+                        help="Unix socket of a running policy_server.py to use instead of loading the model here.")
+    parser.add_argument('-sc', '--settle_cache', type=str, default=None,
+                        help="Directory to cache the settled initial scenes in, shared by the runs of all models.")
+
+    args = parser.parse_args()
+
+    random_seed = args.seed if args.seed else np.random.randint(0, 4294967295)  # max uint32
+
+    generator = GENERATORS[args.task](seed=random_seed, max_obstacles=args.obstacles,
+                                      object_list="ycb" if args.ycb else None)
+    scheduler = AdaptiveScheduler(generator, args.task, np.random.default_rng(random_seed), ycb=args.ycb,
+                                  round_size=args.round_size, min_explore=args.min_explore,
+                                  risk_weight=args.risk_weight)
+
+    run_name = ("ycb_" if args.ycb else "") + f"adaptive_t-{args.task}_n-{args.num}_o-m{args.obstacles}"
+    result_dir = (args.output if args.output else str(PACKAGE_DIR) + "/../results/") + run_name
+    result_dir += f'/{args.model}_{random_seed}'
+    if os.path.exists(result_dir):
+        shutil.rmtree(result_dir)
+    os.makedirs(result_dir, exist_ok=True)
+
+    if args.image_output:
+        image_dir = args.image_output + run_name + f'/{args.model}_{random_seed}'
+        os.makedirs(image_dir, exist_ok=True)
+    else:
+        image_dir = None
+
+    vla_kwargs = dict(model_name=args.model, task=get_task(args.task + ("_ycb" if args.ycb else "")),
+                      stop_on_decided_outcome=args.early_stop, policy_server=args.policy_server,
+                      settle_cache_dir=args.settle_cache)
+    handler = partial(record_result, result_dir, image_dir, image_format=args.image_format)
+
+    # every scheduled scenario is also written to a dataset, so a campaign can be re-run with run_fuzzer.py
+    writer = ScenarioWriter(result_dir + "/scenarios.jsonl", dict(seed=random_seed, num=args.num, task=args.task))
+    scheduled = {}
+
+    def items():
+        for idx in range(args.num):
+            options, origin = scheduler.next_scenario()
+            scheduled[idx] = (options, origin)
+            writer.write(options)
+            yield idx, dict(seed=random_seed, options=options,
+                            frame_sink=make_frame_sink(image_dir, idx, args.image_format))
+
+    with ScenarioWorkerPool(args.workers, vla_kwargs, handler=handler) as pool:
+        # one scenario per worker in flight, so every new pick sees the outcomes of all but the running ones
+        with tqdm(total=args.num) as pbar:
+            for idx, final_info, error in pool.imap_unordered(items(), window=1):
+                pbar.update(1)
+                options, origin = scheduled.pop(idx)
+                if error:
+                    print(f"Scenario {idx} failed:\n{error}")
+                    continue
+                scheduler.report(options, origin, final_info)
+                pbar.set_postfix(failures=sum(v for k, v in scheduler.outcomes.items() if k != "success"))
+    writer.close()
+
+    dump_json_atomic(scheduler.summary(), result_dir + "/coverage.json", default=str)
+    print(scheduler.summary()["outcomes"])
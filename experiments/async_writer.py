@@ -0,0 +1,103 @@
+"""Background writer pool for episode images."""
+import os
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import util
+
+from PIL import Image
+
+
+def _write_images(image_dir, paths, images):
+    os.makedirs(image_dir, exist_ok=True)
+    for path, image in zip(paths, images):
+        Image.fromarray(image).save(path)
+
+
+class AsyncImageWriter:
+    """Encode and write episode frames as JPEG/PNG files in the background.
+
+    Submitted frames count against max_pending_bytes until they are on disk. When the budget is exhausted, submit
+    blocks until earlier writes finish (back-pressure), or, with drop_when_full, the write is dropped and counted.
+    close() waits for all pending writes and reports dropped and failed ones; it also runs automatically at interpreter
+    or worker-process exit. The writer pickles as its configuration only, so every process that receives it (e.g., the
+    workers of a ScenarioWorkerPool) gets its own pool.
+    """
+
+    def __init__(self, max_workers=4, max_pending_bytes=1 << 30, drop_when_full=False, use_processes=False):
+        self.config = dict(max_workers=max_workers, max_pending_bytes=max_pending_bytes, drop_when_full=drop_when_full,
+                           use_processes=use_processes)
+        self.max_pending_bytes = max_pending_bytes
+        self.drop_when_full = drop_when_full
+        executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.executor = executor_cls(max_workers=max_workers)
+        self.cond = threading.Condition()
+        self.pending_bytes = 0
+        self.num_pending = 0
+        self.stats = dict(submitted=0, written=0, dropped=0, failed=0)
+        self.errors = []
+        self.closed = False
+        # multiprocessing runs exit-priority finalizers both at interpreter exit and when a worker process finishes
+        util.Finalize(self, AsyncImageWriter.close, args=(self,), exitpriority=10)
+
+    def __getstate__(self):
+        return self.config
+
+    def __setstate__(self, config):
+        self.__init__(**config)
+
+    def _reserve(self, nbytes):
+        with self.cond:
+            # a single job larger than the whole budget is still accepted once nothing else is pending
+            while self.num_pending > 0 and self.pending_bytes + nbytes > self.max_pending_bytes:
+                if self.drop_when_full:
+                    self.stats["dropped"] += 1
+                    return False
+                self.cond.wait()
+            self.pending_bytes += nbytes
+            self.num_pending += 1
+            self.stats["submitted"] += 1
+            return True
+
+    def _release(self, nbytes, future):
+        with self.cond:
+            self.pending_bytes -= nbytes
+            self.num_pending -= 1
+            error = future.exception()
+            if error is None:
+                self.stats["written"] += 1
+            else:
+                self.stats["failed"] += 1
+                self.errors.append("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+            self.cond.notify_all()
+
+    def _submit(self, nbytes, fn, *args):
+        if self.closed:
+            raise RuntimeError("Writer is closed")
+        if not self._reserve(nbytes):
+            return None
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda f: self._release(nbytes, f))
+        return future
+
+    def write_episode(self, image_dir, images, image_format="jpg"):
+        """Write images as image_dir/{img_idx}.{image_format}, i.e., the layout of the synchronous writer."""
+        paths = [image_dir + f"/{img_idx}.{image_format}" for img_idx in range(len(images))]
+        return self._submit(sum(image.nbytes for image in images), _write_images, image_dir, paths, list(images))
+
+    def flush(self):
+        with self.cond:
+            while self.num_pending > 0:
+                self.cond.wait()
+
+    def close(self):
+        if self.closed:
+            return self.stats
+        self.flush()
+        self.executor.shutdown(wait=True)
+        self.closed = True
+        if self.stats["dropped"] or self.stats["failed"]:
+            print(f"Image writer: {self.stats['dropped']} episode(s) dropped, {self.stats['failed']} failed")
+            for error in self.errors:
+                print(error)
+        return self.stats
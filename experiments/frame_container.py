@@ -0,0 +1,118 @@
+"""One frame container (or MP4) per episode in place of one image file per step."""
+import io
+import json
+import os
+import struct
+
+import numpy as np
+from PIL import Image
+
+MAGIC = b"VLAFRAME"
+FOOTER = struct.Struct("<Q8s")  # index length, magic
+
+
+class EpisodeFrameWriter:
+    """Stream the frames of one episode into a single file as they are produced.
+
+    Each frame is JPEG/PNG-encoded and appended right away, so frames are never held in memory until the episode ends.
+    close() appends a JSON index of (offset, length) per frame followed by a fixed-size footer, and only then moves the
+    file to its final name, so a half-written episode never looks complete. The file is opened on the first frame,
+    which keeps an unused writer picklable (e.g., when passed to a worker process).
+    """
+
+    def __init__(self, path, image_format="jpeg", quality=75):
+        self.path = path
+        self.image_format = image_format
+        self.quality = quality
+        self.f = None
+        self.offsets = []
+        self.lengths = []
+        self.shape = None
+
+    def append(self, image):
+        if self.f is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.f = open(self.path + ".tmp", "wb")
+            self.shape = list(image.shape)
+        buf = io.BytesIO()
+        if self.image_format == "jpeg":
+            Image.fromarray(image).save(buf, format="jpeg", quality=self.quality)
+        else:
+            Image.fromarray(image).save(buf, format=self.image_format)
+        data = buf.getvalue()
+        self.offsets.append(self.f.tell())
+        self.lengths.append(len(data))
+        self.f.write(data)
+
+    def close(self):
+        if self.f is None:
+            return
+        index = json.dumps(dict(format=self.image_format, shape=self.shape, offsets=self.offsets,
+                                lengths=self.lengths)).encode()
+        self.f.write(index)
+        self.f.write(FOOTER.pack(len(index), MAGIC))
+        self.f.close()
+        self.f = None
+        os.replace(self.path + ".tmp", self.path)
+
+
+class EpisodeFrameReader:
+    """Random access to the frames of a file written by EpisodeFrameWriter."""
+
+    def __init__(self, path):
+        self.f = open(path, "rb")
+        self.f.seek(-FOOTER.size, os.SEEK_END)
+        index_length, magic = FOOTER.unpack(self.f.read(FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a complete frame container")
+        self.f.seek(-FOOTER.size - index_length, os.SEEK_END)
+        self.index = json.loads(self.f.read(index_length))
+        self.offsets = self.index["offsets"]
+        self.lengths = self.index["lengths"]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        self.f.seek(self.offsets[i])
+        return np.asarray(Image.open(io.BytesIO(self.f.read(self.lengths[i]))).convert("RGB"))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class EpisodeVideoWriter:
+    """Stream the frames of one episode into an MP4 file as they are produced."""
+
+    def __init__(self, path, fps=5):
+        self.path = path
+        self.fps = fps
+        self.writer = None
+
+    def append(self, image):
+        if self.writer is None:
+            import mediapy as media
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.writer = media.VideoWriter(self.path + ".tmp.mp4", shape=image.shape[:2], fps=self.fps)
+            self.writer.__enter__()
+        self.writer.add_image(image)
+
+    def close(self):
+        if self.writer is None:
+            return
+        self.writer.__exit__(None, None, None)
+        self.writer = None
+        os.replace(self.path + ".tmp.mp4", self.path)
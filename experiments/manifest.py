@@ -0,0 +1,165 @@
+"""Append-only manifest of the finished scenarios of a run, to resume it."""
+import fcntl
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dump_json_atomic(obj, path, **kwargs):
+    """json.dump to path through a temporary file, so readers never see a half-written file."""
+    with open(path + ".tmp", "w") as f:
+        json.dump(obj, f, **kwargs)
+    os.replace(path + ".tmp", path)
+
+
+class ResumeManifest:
+    """Append-only record of finished (and claimed) scenarios of one result folder.
+
+    Every scenario key (e.g., the scenario index, or "{dataset}_{model}_{idx}_{sample}") gets a "done" line carrying the
+    sha256 of its log.json once all of its files are written, so resuming takes one read of manifest.jsonl instead of
+    one stat per scenario, and a log.json without a "done" line is a partial result that gets re-run. Before running a
+    scenario, a runner claims it; claims by other live runs that are younger than claim_ttl seconds are respected, so
+    several fuzzer processes can share one result folder. All appends happen under an exclusive flock, and a torn last line
+    (e.g., after a crash) is ignored. Folders written before the manifest existed are migrated on first load.
+    """
+
+    def __init__(self, result_dir, run_id=None, claim_ttl=3600.0, log_name="log.json"):
+        self.result_dir = result_dir
+        self.path = os.path.join(result_dir, MANIFEST_NAME)
+        self.run_id = run_id if run_id else f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.claim_ttl = claim_ttl
+        self.log_name = log_name
+        self.done = {}
+        self.claims = {}
+        self.offset = 0
+        self.loaded = False
+
+    def __getstate__(self):
+        # workers re-read the manifest themselves when they need it
+        state = self.__dict__.copy()
+        state.update(done={}, claims={}, offset=0, loaded=False)
+        return state
+
+    def _apply(self, data):
+        """Parse complete lines of data; return the number of bytes consumed."""
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line torn by a crash, later appends start on a fresh line
+            if record["event"] == "done":
+                self.done[record["key"]] = record["sha256"]
+            elif record["event"] == "claim":
+                self.claims[record["key"]] = record
+        return end
+
+    def _refresh(self, f):
+        f.seek(self.offset)
+        self.offset += self._apply(f.read())
+
+    def _append(self, f, records):
+        f.seek(0, os.SEEK_END)
+        data = b"".join(json.dumps(record).encode() + b"\n" for record in records)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                data = b"\n" + data
+        f.write(data)
+        f.flush()
+        self._refresh(f)
+
+    def _locked(self, fn):
+        os.makedirs(self.result_dir, exist_ok=True)
+        with open(self.path, "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._refresh(f)
+                return fn(f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            self.rebuild()
+        else:
+            with open(self.path, "rb") as f:
+                self.offset = self._apply(f.read())
+        self.loaded = True
+        return self
+
+    def rebuild(self):
+        """Create the manifest from an existing result folder ({key}/log.json), keeping only readable logs."""
+        records = []
+        if os.path.isdir(self.result_dir):
+            for key in sorted(os.listdir(self.result_dir)):
+                log_path = os.path.join(self.result_dir, key, self.log_name)
+                if not os.path.isfile(log_path):
+                    continue
+                try:
+                    with open(log_path, "r") as f:
+                        json.load(f)
+                except ValueError:
+                    continue  # torn write of an interrupted run
+                records.append(dict(event="done", key=key, sha256=file_sha256(log_path), run_id="migrated"))
+
+        def migrate(f):
+            # another process may have migrated the folder in the meantime
+            if records and not self.done:
+                self._append(f, records)
+
+        self._locked(migrate)
+
+    def _is_live(self, claim):
+        if claim["run_id"] == self.run_id or time.time() - claim["time"] >= self.claim_ttl:
+            return False
+        if claim.get("host") == socket.gethostname():
+            # a claim of a crashed run on this machine can be taken over right away
+            try:
+                os.kill(claim["pid"], 0)
+            except ProcessLookupError:
+                return False
+            except PermissionError:
+                pass
+        return True
+
+    def is_done(self, key):
+        if not self.loaded:
+            self.load()
+        return str(key) in self.done
+
+    def claim(self, key):
+        """Claim a scenario for this run; returns False if it is finished or claimed by another live run."""
+        key = str(key)
+        if self.is_done(key):
+            return False
+
+        def try_claim(f):
+            if key in self.done:
+                return False
+            if key in self.claims and self._is_live(self.claims[key]):
+                return False
+            self._append(f, [dict(event="claim", key=key, run_id=self.run_id, time=time.time(),
+                                  host=socket.gethostname(), pid=os.getpid())])
+            return True
+
+        return self._locked(try_claim)
+
+    def mark_done(self, key):
+        """Record a scenario as finished; call after all of its files are written."""
+        key = str(key)
+        sha256 = file_sha256(os.path.join(self.result_dir, key, self.log_name))
+        self._locked(lambda f: self._append(f, [dict(event="done", key=key, sha256=sha256, run_id=self.run_id)]))
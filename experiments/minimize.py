@@ -0,0 +1,277 @@
+"""Delta-debugging minimizer for the failing scenarios of a dataset."""
+import argparse
+import copy
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from experiments.adaptive_fuzzer import outcome_label
+from experiments.manifest import dump_json_atomic
+from experiments.result_store import ResultCache, result_cache_key
+from experiments.run_fuzzer import StableJSONizer, get_task
+from experiments.scenario_dataset import open_dataset
+from experiments.scenario_fingerprint import scenario_fingerprint
+from experiments.worker_pool import ScenarioWorkerPool
+
+# Setup paths
+PACKAGE_DIR = Path(__file__).parent.resolve()
+
+NOMINAL_QUAT = [1.0, 0.0, 0.0, 0.0]
+
+
+def episode_result(key, run_kwargs, images, episode_stats):
+    # runs inside the worker: only the episode in its log.json form goes back (and into the result cache)
+    return json.loads(json.dumps(episode_stats, cls=StableJSONizer))
+
+
+def final_info(episode_stats):
+    """Info of the last step of an episode in log.json form, with the "true"/"false" of numpy booleans turned back."""
+    if not episode_stats:
+        return {}
+    info = episode_stats[max(episode_stats.keys(), key=int)]
+    return {k: v == "true" if v in ("true", "false") else v for k, v in info.items()}
+
+
+def _is_nominal(quat):
+    return isinstance(quat, (list, tuple)) and np.allclose(np.abs(quat), NOMINAL_QUAT, atol=1e-3)
+
+
+def scenario_features(options):
+    """What a failing scenario can be reduced by: its distractors, the non-nominal orientation of every object, and a
+    non-default lighting or camera."""
+    features = []
+    if "model_id" in options:
+        features += [["distractor", model_id] for model_id in options.get("distractor_model_ids", [])]
+        orientations = {options["model_id"]: options.get("obj_init_options", {}).get("orientation")}
+        orientations.update({model_id: init.get("init_rot_quat")
+                             for model_id, init in options.get("distractor_obj_init_options", {}).items()})
+    else:
+        special = (options.get("source_obj_id"), options.get("target_obj_id"))
+        features += [["distractor", model_id] for i, model_id in enumerate(options.get("model_ids", []))
+                     if i not in special]
+        orientations = {model_id: init.get("init_rot_quat")
+                        for model_id, init in options.get("obj_init_options", {}).items()}
+    features += [["orientation", model_id] for model_id, quat in orientations.items()
+                 if quat is not None and not _is_nominal(quat)]
+    if options.get("lighting_cfgs") not in (None, "DEFAULT"):
+        features.append(["lighting"])
+    if options.get("camera_cfgs") is not None:
+        features.append(["camera"])
+    return features
+
+
+def reduce_scenario(options, kept, features):
+    """The scenario with every feature that is not in kept reduced: distractors removed, orientations set to nominal,
+    lighting and camera set back to default."""
+    options = copy.deepcopy(options)
+    reduced = [feature for feature in features if feature not in kept]
+    removed = {feature[1] for feature in reduced if feature[0] == "distractor"}
+    nominal = {feature[1] for feature in reduced if feature[0] == "orientation"}
+    if "model_id" in options:
+        if "obj_init_options" in options and options["model_id"] in nominal:
+            options["obj_init_options"]["orientation"] = NOMINAL_QUAT
+        distractors = [model_id for model_id in options.get("distractor_model_ids", []) if model_id not in removed]
+        init_options = {model_id: init for model_id, init in options.get("distractor_obj_init_options", {}).items()
+                        if model_id not in removed}
+        for model_id in nominal.intersection(init_options):
+            init_options[model_id]["init_rot_quat"] = NOMINAL_QUAT
+        if distractors:
+            options["distractor_model_ids"] = distractors
+            options["distractor_obj_init_options"] = init_options
+        else:
+            options.pop("distractor_model_ids", None)
+            options.pop("distractor_obj_init_options", None)
+    else:
+        model_ids = options.get("model_ids", [])
+        keep = [i for i, model_id in enumerate(model_ids) if model_id not in removed]
+        for role in ("source_obj_id", "target_obj_id"):
+            if options.get(role) is not None:
+                options[role] = keep.index(options[role])
+        options["model_ids"] = [model_ids[i] for i in keep]
+        options["obj_init_options"] = {model_id: init for model_id, init in options.get("obj_init_options", {}).items()
+                                       if model_id not in removed}
+        for model_id in nominal.intersection(options["obj_init_options"]):
+            options["obj_init_options"][model_id]["init_rot_quat"] = NOMINAL_QUAT
+    if ["lighting"] not in kept and "lighting_cfgs" in options:
+        options["lighting_cfgs"] = "DEFAULT"
+    if ["camera"] not in kept:
+        options.pop("camera_cfgs", None)
+    return options
+
+
+class ScenarioMinimizer:
+    """Shrink a failing scenario to a 1-minimal set of features that still fails, by delta debugging (ddmin).
+
+    The features of a scenario (scenario_features) are split into n chunks; if keeping only one chunk, or dropping one,
+    still fails, the search goes on from there, otherwise n is doubled, until no single feature can be dropped. All
+    chunks and complements of a step are re-simulated at once on the worker pool. Every evaluated variant is kept by
+    its scenario_fingerprint, in memory and, if given, in a ResultCache (under the result_cache_key of the vla_kwargs
+    the pool runs with), so no variant is simulated twice. At most budget episodes are simulated (and no new step
+    starts after time_budget seconds) per scenario; once the budget is spent, the smallest failing variant found so far
+    is returned. With same_outcome, a variant only counts as failing if it fails like the original (see
+    adaptive_fuzzer.outcome_label).
+    """
+
+    def __init__(self, pool, vla_kwargs, seed, budget=64, time_budget=None, same_outcome=False, cache=None):
+        self.pool = pool
+        self.seed = seed
+        self.cache_key = result_cache_key(vla_kwargs, seed)
+        self.budget = budget
+        self.time_budget = time_budget
+        self.same_outcome = same_outcome
+        self.cache = cache
+        self.results = {}  # fingerprint -> episode_stats
+        self.keys = iter(range(1 << 62))
+
+    def _lookup(self, fingerprint):
+        if fingerprint not in self.results and self.cache is not None:
+            episode_stats = self.cache.get(fingerprint, *self.cache_key)
+            if episode_stats is not None:
+                self.results[fingerprint] = episode_stats
+        return self.results.get(fingerprint)
+
+    def _evaluate(self, variants, state):
+        """Final infos of the variants; None for the ones that could not be run within the budget."""
+        fingerprints = [scenario_fingerprint(options) for options in variants]
+        todo = {}
+        for fingerprint, options in zip(fingerprints, variants):
+            if self._lookup(fingerprint) is None and fingerprint not in todo:
+                todo[fingerprint] = options
+        todo = list(todo.items())[:max(self.budget - state["simulated"], 0)]
+        if todo and not self._out_of_time(state):
+            keys = {next(self.keys): fingerprint for fingerprint, _ in todo}
+            items = ((key, dict(seed=self.seed, options=options)) for key, (_, options) in zip(keys, todo))
+            for key, episode_stats, error in self.pool.imap_unordered(items):
+                state["simulated"] += 1
+                if error:
+                    print(f"Variant failed to run:\n{error}")
+                    continue
+                self.results[keys[key]] = episode_stats
+                if self.cache is not None:
+                    self.cache.put(keys[key], *self.cache_key, episode_stats)
+        return [final_info(self.results[fp]) if fp in self.results else None for fp in fingerprints]
+
+    def _out_of_time(self, state):
+        return self.time_budget is not None and time.monotonic() - state["start"] > self.time_budget
+
+    def _fails(self, info, label):
+        if info is None or info.get("success"):
+            return False
+        return not self.same_outcome or outcome_label(info) == label
+
+    def minimize(self, options):
+        state = {"simulated": 0, "start": time.monotonic()}
+        features = scenario_features(options)
+        history = []
+        # the fully reduced scenario is run along with the original: if it fails too, there is nothing to search
+        original, empty = self._evaluate([options, reduce_scenario(options, [], features)], state)
+        report = {"original": options, "features": features, "original_outcome": None, "reproduced": False}
+        if original is None or original.get("success"):
+            report.update(original_outcome=None if original is None else outcome_label(original),
+                          simulated=state["simulated"])
+            return report
+        label = outcome_label(original)
+        history.append([features, label])
+        kept = features
+        if self._fails(empty, label):
+            kept = []
+        history.append([[], None if empty is None else outcome_label(empty)])
+        n = 2
+        while len(kept) > 1 and state["simulated"] < self.budget and not self._out_of_time(state):
+            chunks = [list(chunk) for chunk in np.array_split(np.arange(len(kept)), n)]
+            subsets = [[kept[i] for i in chunk] for chunk in chunks]
+            if n > 2:
+                subsets += [[kept[i] for i in range(len(kept)) if i not in chunk] for chunk in chunks]
+            infos = self._evaluate([reduce_scenario(options, subset, features) for subset in subsets], state)
+            history += [[subset, None if info is None else outcome_label(info)] for subset, info in zip(subsets, infos)]
+            failing = next((i for i, info in enumerate(infos) if self._fails(info, label)), None)
+            if failing is not None and failing < n:
+                kept, n = subsets[failing], 2
+            elif failing is not None:
+                kept, n = subsets[failing], max(n - 1, 2)
+            elif n >= len(kept):
+                break
+            else:
+                n = min(2 * n, len(kept))
+        report.update(
+            original_outcome=label,
+            reproduced=True,
+            minimized=reduce_scenario(options, kept, features),
+            kept=kept,
+            removed=[feature for feature in features if feature not in kept],
+            simulated=state["simulated"],
+            budget_exhausted=state["simulated"] >= self.budget or self._out_of_time(state),
+            history=history,
+        )
+        return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="VLA Failure Minimization")
+    parser.add_argument('-d', '--data', type=str, default=None, help="Testing data the failures come from")
+    parser.add_argument('-i', '--indices', type=str, default=None,
+                        help="Comma-separated indices of the failing scenarios in the testing data")
+    parser.add_argument('-op', '--options', type=str, default=None,
+                        help="A failing scenario as a JSON file (e.g., the options.json of a lighting/camera run)")
+    parser.add_argument('-t', '--task', type=str, choices=["grasp", "move", "put-in", "put-on"], default=None,
+                        help="VLA Task, by default taken from the name of the testing data")
+    parser.add_argument('--ycb', type=bool, default=False, help="Use YCB dataset (with --options)")
+    parser.add_argument('-m', '--model', type=str,
+                        choices=["rt_1_x", "rt_1_400k", "rt_1_58k", "rt_1_1k", "octo-base", "octo-small",
+                                 "openvla-7b"],
+                        default="rt_1_x", help="VLA model")
+    parser.add_argument('-s', '--seed', type=int, required=True, help="Random Seed the failures were found with")
+    parser.add_argument('-o', '--output', type=str, default=None, help="Output path, e.g., folder")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="Number of worker processes, each with its own environment and model.")
+    parser.add_argument('-b', '--budget', type=int, default=64, help="Maximum number of episodes per scenario")
+    parser.add_argument('-tb', '--time_budget', type=float, default=None,
+                        help="Start no new reduction step after this many seconds per scenario")
+    parser.add_argument('-so', '--same_outcome', type=bool, default=False,
+                        help="Only accept variants that fail the same way as the original (e.g., moved_wrong_obj)")
+    parser.add_argument('-dd', '--dedup', type=str, default=None,
+                        help="SQLite result cache (as in run_fuzzer.py) to look up and store every evaluated variant")
+    parser.add_argument('-es', '--early_stop', type=bool, default=False,
+                        help="Stop an episode as soon as its final success can no longer change.")
+    parser.add_argument('-ps', '--policy_server', type=str, default=None,
+                        help="Unix socket of a running policy_server.py to use instead of loading the model here.")
+    parser.add_argument('-sc', '--settle_cache', type=str, default=None,
+                        help="Directory to cache the settled initial scenes in, shared by the runs of all models.")
+
+    args = parser.parse_args()
+
+    if args.options and not args.task:
+        parser.error("--task is required with --options")
+    if args.options:
+        with open(args.options, 'r') as f:
+            scenarios = {args.options.split('/')[-1].split(".")[0]: json.load(f)}
+        run_name = "options"
+        task = get_task(args.task + ("_ycb" if args.ycb else ""))
+    else:
+        tasks = open_dataset(args.data)
+        run_name = args.data.split('/')[-1].split(".")[0]
+        scenarios = {idx: tasks[idx] for idx in args.indices.split(",")}
+        task = get_task(args.task + ("_ycb" if "ycb" in run_name else "") if args.task else run_name)
+
+    result_dir = (args.output if args.output else str(PACKAGE_DIR) + "/../results/") + f"minimized/{run_name}"
+    result_dir += f'/{args.model}_{args.seed}'
+    os.makedirs(result_dir, exist_ok=True)
+
+    vla_kwargs = dict(model_name=args.model, task=task, stop_on_decided_outcome=args.early_stop,
+                      policy_server=args.policy_server, settle_cache_dir=args.settle_cache)
+    cache = ResultCache(args.dedup) if args.dedup else None
+
+    with ScenarioWorkerPool(args.workers, vla_kwargs, handler=episode_result) as pool:
+        minimizer = ScenarioMinimizer(pool, vla_kwargs, args.seed, budget=args.budget,
+                                      time_budget=args.time_budget, same_outcome=args.same_outcome, cache=cache)
+        for name, options in scenarios.items():
+            report = minimizer.minimize(options)
+            dump_json_atomic(report, result_dir + f"/{name}.json", cls=StableJSONizer)
+            if report["reproduced"]:
+                print(f"{name}: {report['original_outcome']}, kept {report['kept']} of {len(report['features'])} "
+                      f"features after {report['simulated']} episodes")
+            else:
+                print(f"{name}: the failure did not reproduce ({report['original_outcome']})")
@@ -5,6 +5,8 @@ Time   : 7/19/24
 """
 
 import os
+import queue
+import threading
 import numpy as np
 import simpler_env
 from simpler_env.utils.env.observation_utils import get_image_from_maniskill2_obs_dict
@@ -42,9 +44,32 @@ ckpt_dir = str(PACKAGE_DIR) + '/../checkpoints'
 
 sapien.render_config.rt_use_denoiser = True
 
+# reset options that are baked into the environment at construction/reconfigure time and are not reverted by a
+# plain reset, so a reused environment is rebuilt whenever they differ from the previous scenario
+ENV_CFG_KEYS = ("camera_cfgs", "lighting_cfgs")
+
+
+def load_policy(model_name, policy_setup):
+    if "rt_1" in model_name:
+        from simpler_env.policies.rt1.rt1_model import RT1Inference
+
+        ckpt_path = os.path.join(ckpt_dir, RT_1_CHECKPOINTS[model_name])
+        return RT1Inference(saved_model_path=ckpt_path, policy_setup=policy_setup)
+    elif "octo" in model_name:
+        from simpler_env.policies.octo.octo_model import OctoInference
+
+        return OctoInference(model_type=model_name, policy_setup=policy_setup, init_rng=0)
+    elif "openvla" in model_name:
+        from simpler_env.policies.openvla.openvla_model import OpenVLAInference
+
+        return OpenVLAInference(model_type=model_name, policy_setup=policy_setup)
+    else:
+        raise ValueError(model_name)
+
 
 class VLAInterface:
-    def __init__(self, task, model_name):
+    def __init__(self, task, model_name, reuse_env=False, stop_on_decided_outcome=False, policy_server=None,
+                 settle_cache_dir=None, use_actor_pool=False, adaptive_settle=False):
         if task in TASKS:
             self.task = task
         else:
@@ -53,24 +78,71 @@ class VLAInterface:
             self.policy_setup = "google_robot"
         else:
             self.policy_setup = "widowx_bridge"
-        if "rt_1" in model_name:
-            from simpler_env.policies.rt1.rt1_model import RT1Inference
+        if policy_server:
+            from experiments.policy_server import PolicyClient
 
-            ckpt_path = os.path.join(ckpt_dir, RT_1_CHECKPOINTS[model_name])
-            self.model = RT1Inference(saved_model_path=ckpt_path, policy_setup=self.policy_setup)
-        elif "octo" in model_name:
-            from simpler_env.policies.octo.octo_model import OctoInference
+            self.model = PolicyClient(policy_server, model_name, self.policy_setup)
+        else:
+            self.model = load_policy(model_name, self.policy_setup)
+        self.reuse_env = reuse_env
+        self.stop_on_decided_outcome = stop_on_decided_outcome
+        # directory of the settled initial scenes shared by all runs of a dataset (see CustomSceneEnv.initialize_episode)
+        self.settle_cache_dir = settle_cache_dir
+        # build the objects of the scenarios once per environment and swap them in on reset (customizable tasks)
+        self.use_actor_pool = use_actor_pool
+        # stop letting the objects fall onto the table once they are at rest instead of after fixed durations
+        self.adaptive_settle = adaptive_settle
+        # slot -> environment; slot 0 serves run_interface, slots 0..N-1 serve the N lockstep rollouts of
+        # run_interface_batch
+        self.envs = {}
+        self.env_cfgs = {}
 
-            self.model = OctoInference(model_type=model_name, policy_setup=self.policy_setup, init_rng=0)
-        elif "openvla" in model_name:
-            from simpler_env.policies.openvla.openvla_model import OpenVLAInference
+    def get_env(self, options=None, slot=0):
+        """Return an environment for the next scenario.
 
-            self.model = OpenVLAInference(model_type=model_name, policy_setup=self.policy_setup)
-        else:
-            raise ValueError(model_name)
+        With reuse_env, the environment is built once per task and every scenario is fed in through reset(options=...),
+        so the engine, renderer and stage are only created again when an environment-level config changes.
+        """
+        env_cfgs = {k: options.get(k, None) for k in ENV_CFG_KEYS} if options else {k: None for k in ENV_CFG_KEYS}
+        if slot in self.envs and env_cfgs != self.env_cfgs[slot]:
+            self.close(slot)
+        if slot not in self.envs:
+            env_kwargs = dict(settle_cache_dir=self.settle_cache_dir)
+            if self.use_actor_pool and "customizable" in self.task:
+                env_kwargs["use_actor_pool"] = True
+            if self.adaptive_settle:
+                env_kwargs["adaptive_settle"] = True
+            self.envs[slot] = simpler_env.make(self.task, **env_kwargs)
+            self.env_cfgs[slot] = env_cfgs
+        return self.envs[slot]
+
+    def release_env(self):
+        if not self.reuse_env:
+            self.close()
+
+    def close(self, slot=None):
+        for s in list(self.envs.keys()) if slot is None else [slot]:
+            if s in self.envs:
+                self.envs.pop(s).close()
+                self.env_cfgs.pop(s)
+
+    def decided_outcome(self, env, info):
+        """With stop_on_decided_outcome, end the episode once its final success is fixed and record why in info."""
+        if not self.stop_on_decided_outcome:
+            return False
+        decided_outcome = env.get_decided_outcome(info)
+        if decided_outcome is None:
+            return False
+        info["decided_outcome"] = decided_outcome
+        return True
+
+    def run_interface(self, seed=None, options=None, frame_sink=None):
+        """Roll out one scenario and return (images, episode_stats).
 
-    def run_interface(self, seed=None, options=None):
-        env = simpler_env.make(self.task)
+        If frame_sink is given, every frame is handed to frame_sink.append as soon as it is rendered instead of being
+        collected in the returned images list, and the sink is closed when the episode ends.
+        """
+        env = self.get_env(options)
         obs, reset_info = env.reset(seed=seed, options=options)
         instruction = env.get_language_instruction()
         self.model.reset(instruction)
@@ -78,33 +150,139 @@ class VLAInterface:
         print("Reset info", reset_info)
 
         image = get_image_from_maniskill2_obs_dict(env, obs)  # np.ndarray of shape (H, W, 3), uint8
-        images = [image]
-        predicted_terminated, success, truncated = False, False, False
+        images = [] if frame_sink is not None else [image]
+        if frame_sink is not None:
+            frame_sink.append(image)
+        predicted_terminated, success, truncated, decided = False, False, False, False
         timestep = 0
         episode_stats = {}
-        while not (predicted_terminated or truncated):
+        while not (predicted_terminated or truncated or decided):
             # step the model; "raw_action" is raw model action output; "action" is the processed action to be sent into maniskill env
             raw_action, action = self.model.step(image)
             predicted_terminated = bool(action["terminate_episode"][0] > 0)
             obs, reward, success, truncated, info = env.step(
                 np.concatenate([action["world_vector"], action["rot_axangle"], action["gripper"]])
             )
+            decided = self.decided_outcome(env, info)
             print(timestep, info)
             episode_stats[timestep] = info
             # update image observation
             image = get_image_from_maniskill2_obs_dict(env, obs)
-            images.append(image)
+            if frame_sink is not None:
+                frame_sink.append(image)
+            else:
+                images.append(image)
             timestep += 1
 
         print(f"Episode success: {success}")
-        env.close()
-        del env
+        if frame_sink is not None:
+            frame_sink.close()
+        self.release_env()
         return images, episode_stats
 
+    def run_interface_batch(self, seed=None, options_list=None, instructions=None, num_groups=1, frame_sinks=None):
+        """Roll out len(options_list) scenarios in lockstep with one batched policy call per timestep.
+
+        Episodes that finish early (predicted termination or truncation) are masked out of the following policy calls,
+        while the remaining ones keep stepping. With num_groups > 1, the environments are split into that many groups
+        that are pipelined: a simulation thread steps one group while the policy runs on another, so physics and
+        rendering overlap with inference (both release the GIL in their native code). Returns a list of
+        (images, episode_stats), one per scenario; frame_sinks, if given, work per scenario as in run_interface.
+        """
+        num_envs = len(options_list)
+        frame_sinks = frame_sinks if frame_sinks is not None else [None] * num_envs
+        envs = [self.get_env(options, slot) for slot, options in enumerate(options_list)]
+        images = []
+        last_images = []
+        task_descriptions = []
+        for i, (env, options) in enumerate(zip(envs, options_list)):
+            obs, reset_info = env.reset(seed=seed, options=options)
+            instruction = instructions[i] if instructions and instructions[i] else env.get_language_instruction()
+            task_descriptions.append(instruction)
+            image = get_image_from_maniskill2_obs_dict(env, obs)
+            last_images.append(image)
+            if frame_sinks[i] is not None:
+                images.append([])
+                frame_sinks[i].append(image)
+            else:
+                images.append([image])
+            print(instruction)
+            print("Reset info", reset_info)
+        self.model.reset_batch(task_descriptions)
+
+        episode_stats = [{} for _ in range(num_envs)]
+
+        def step_group(env_actions):
+            still_active = []
+            for i, action in env_actions:
+                predicted_terminated = bool(action["terminate_episode"][0] > 0)
+                obs, reward, success, truncated, info = envs[i].step(
+                    np.concatenate([action["world_vector"], action["rot_axangle"], action["gripper"]])
+                )
+                decided = self.decided_outcome(envs[i], info)
+                episode_stats[i][len(episode_stats[i])] = info
+                last_images[i] = get_image_from_maniskill2_obs_dict(envs[i], obs)
+                if frame_sinks[i] is not None:
+                    frame_sinks[i].append(last_images[i])
+                else:
+                    images[i].append(last_images[i])
+                if predicted_terminated or truncated or decided:
+                    print(f"Episode {i} success: {success}")
+                    if frame_sinks[i] is not None:
+                        frame_sinks[i].close()
+                else:
+                    still_active.append(i)
+            return still_active
+
+        def infer_group(active):
+            outputs = self.model.step_batch([last_images[i] for i in active], env_ids=active)
+            return [(i, action) for i, (raw_action, action) in zip(active, outputs)]
+
+        groups = [list(range(g, num_envs, num_groups)) for g in range(min(num_groups, num_envs))]
+        if len(groups) == 1:
+            active = groups[0]
+            while active:
+                active = step_group(infer_group(active))
+        else:
+            # each group has at most one entry in flight, so neither queue can hold more than len(groups) items
+            job_queue = queue.Queue(maxsize=len(groups))
+            done_queue = queue.Queue(maxsize=len(groups))
+
+            def simulate():
+                while True:
+                    job = job_queue.get()
+                    if job is None:
+                        break
+                    try:
+                        done_queue.put((step_group(job), None))
+                    except Exception as e:
+                        done_queue.put(([], e))
+
+            sim_thread = threading.Thread(target=simulate, daemon=True)
+            sim_thread.start()
+            try:
+                for group in groups:
+                    done_queue.put((group, None))
+                remaining = len(groups)
+                while remaining:
+                    active, error = done_queue.get()
+                    if error is not None:
+                        raise error
+                    if not active:
+                        remaining -= 1
+                        continue
+                    job_queue.put(infer_group(active))
+            finally:
+                job_queue.put(None)
+                sim_thread.join()
+
+        self.release_env()
+        return list(zip(images, episode_stats))
+
 
 class VLAInterfaceLM(VLAInterface):
-    def run_interface(self, seed=None, options=None, instruction=None):
-        env = simpler_env.make(self.task)
+    def run_interface(self, seed=None, options=None, instruction=None, frame_sink=None):
+        env = self.get_env(options)
         obs, reset_info = env.reset(seed=seed, options=options)
         if not instruction:
             instruction = env.get_language_instruction()
@@ -113,27 +291,34 @@ class VLAInterfaceLM(VLAInterface):
         print("Reset info", reset_info)
 
         image = get_image_from_maniskill2_obs_dict(env, obs)  # np.ndarray of shape (H, W, 3), uint8
-        images = [image]
-        predicted_terminated, success, truncated = False, False, False
+        images = [] if frame_sink is not None else [image]
+        if frame_sink is not None:
+            frame_sink.append(image)
+        predicted_terminated, success, truncated, decided = False, False, False, False
         timestep = 0
         episode_stats = {}
-        while not (predicted_terminated or truncated):
+        while not (predicted_terminated or truncated or decided):
             # step the model; "raw_action" is raw model action output; "action" is the processed action to be sent into maniskill env
             raw_action, action = self.model.step(image)
             predicted_terminated = bool(action["terminate_episode"][0] > 0)
             obs, reward, success, truncated, info = env.step(
                 np.concatenate([action["world_vector"], action["rot_axangle"], action["gripper"]])
             )
+            decided = self.decided_outcome(env, info)
             print(timestep, info)
             episode_stats[timestep] = info
             # update image observation
             image = get_image_from_maniskill2_obs_dict(env, obs)
-            images.append(image)
+            if frame_sink is not None:
+                frame_sink.append(image)
+            else:
+                images.append(image)
             timestep += 1
 
         print(f"Episode success: {success}")
-        env.close()
-        del env
+        if frame_sink is not None:
+            frame_sink.close()
+        self.release_env()
         return images, episode_stats
 
 
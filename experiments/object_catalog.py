@@ -0,0 +1,116 @@
+"""Precomputed catalog of the objects that test generation samples from."""
+import json
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from mani_skill2_real2sim.utils.object_names import clean_object_name
+
+# Setup paths
+PACKAGE_DIR = Path(__file__).parent.resolve()
+
+CATALOG_PATHS = {
+    "custom": str(PACKAGE_DIR) + '/../ManiSkill2_real2sim/data/custom/info_pick_custom_v0.json',
+    "ycb": str(PACKAGE_DIR) + '/../ManiSkill2_real2sim/data/ycb-dataset/info_ycb.json',
+    "bridge": str(PACKAGE_DIR) + '/../ManiSkill2_real2sim/data/custom/info_bridge_custom_v0.json',
+    "ycb_put": str(PACKAGE_DIR) + '/../ManiSkill2_real2sim/data/ycb-dataset/info_ycb_put.json',
+}
+
+
+class ObjectCatalog:
+    """Objects of a model info file (e.g., info_pick_custom_v0.json) with everything test generation looks up per draw.
+
+    names keeps the order of the info file. Objects are grouped by their instruction name (clean_object_name), since
+    two objects that are referred to by the same words must never appear in one scene. group_objects lists the objects
+    group by group, group_starts/group_sizes locate a group in it, and group_of maps an object index to its group.
+    """
+
+    def __init__(self, info):
+        self.info = info
+        self.names = list(info.keys())
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.cleaned_names = [clean_object_name(name) for name in self.names]
+        groups = {}
+        for i, cleaned_name in enumerate(self.cleaned_names):
+            groups.setdefault(cleaned_name, []).append(i)
+        self.group_names = list(groups.keys())
+        self.groups = list(groups.values())
+        self.group_of = np.empty(len(self.names), dtype=np.int64)
+        for g, members in enumerate(self.groups):
+            self.group_of[members] = g
+        self.group_sizes = np.array([len(members) for members in self.groups])
+        self.group_starts = np.cumsum(self.group_sizes) - self.group_sizes
+        self.group_objects = np.array([self.names[i] for members in self.groups for i in members], dtype=object)
+        # full (unscaled) extents of the model bounding boxes; objects without a bbox get zeros
+        self.bbox_extents = np.array([np.subtract(v["bbox"]["max"], v["bbox"]["min"]) if "bbox" in v else np.zeros(3)
+                                      for v in info.values()])
+        self.scales = [v.get("scales", [1.0]) for v in info.values()]
+
+    def __len__(self):
+        return len(self.names)
+
+    def cleaned_name(self, name):
+        return self.cleaned_names[self.index[name]] if name in self.index else clean_object_name(name)
+
+    def bbox_extent(self, name, scale=1.0):
+        return self.bbox_extents[self.index[name]] * scale
+
+
+@lru_cache(maxsize=None)
+def load_catalog(name_or_path="custom"):
+    """Load (once per process) the catalog of a known object set ("custom", "ycb") or of a model info json file."""
+    with open(CATALOG_PATHS.get(name_or_path, name_or_path), 'r') as f:
+        return ObjectCatalog(json.load(f))
+
+
+class GroupSampler:
+    """Draw objects of a catalog without replacement by instruction-name group.
+
+    Every draw picks the k-th of the objects still available, in catalog order, with k = np.random.randint(0, n), and
+    removes the whole group of the drawn object. This is the draw of np.random.choice over the shrinking object queue of
+    the original test generation, so seeded datasets stay the same, but the k-th available object is found in a Fenwick
+    tree (O(log n)) instead of rebuilding and scanning the queue.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.reset()
+
+    def reset(self):
+        n = len(self.catalog)
+        self.available = np.ones(n, dtype=bool)
+        self.remaining = n
+        # Fenwick tree over the availability flags, built in O(n)
+        self.tree = [0] * (n + 1)
+        for i in range(1, n + 1):
+            self.tree[i] += 1
+            parent = i + (i & -i)
+            if parent <= n:
+                self.tree[parent] += self.tree[i]
+
+    def _remove(self, idx):
+        self.available[idx] = False
+        self.remaining -= 1
+        i = idx + 1
+        while i < len(self.tree):
+            self.tree[i] -= 1
+            i += i & -i
+
+    def _find(self, k):
+        # index of the (k+1)-th available object
+        pos, step = 0, 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if pos + step < len(self.tree) and self.tree[pos + step] <= k:
+                pos += step
+                k -= self.tree[pos]
+            step >>= 1
+        return pos
+
+    def draw(self):
+        if self.remaining == 0:
+            raise ValueError("No objects left to draw from")
+        idx = self._find(np.random.randint(0, self.remaining))
+        for member in self.catalog.groups[self.catalog.group_of[idx]]:
+            if self.available[member]:
+                self._remove(member)
+        return self.catalog.names[idx]
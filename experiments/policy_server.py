@@ -0,0 +1,219 @@
+"""Local policy server shared by several clients, batching their inference requests."""
+import argparse
+import itertools
+import os
+import queue
+import threading
+import time
+import traceback
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+DEFAULT_ADDRESS = "/tmp/vlatest_policy.sock"
+AUTHKEY = b"vlatest"
+
+
+def _to_numpy(outputs):
+    # actions may be TF/JAX arrays; only plain numpy arrays cross the socket
+    return [tuple({k: np.asarray(v) for k, v in d.items()} for d in output) for output in outputs]
+
+
+class PolicyServer:
+    """Load one policy once and serve it to any number of fuzzer processes over a local Unix socket.
+
+    Every client connection gets a thread that forwards its requests to a single inference thread, so the model is only
+    ever touched from one thread. Each episode a client runs is a session, i.e., an entry of the policy's batch_states,
+    and "step" requests that arrive within batch_window seconds of each other (from any client, up to max_batch
+    sessions) are served by one step_batch call. Sessions of a client are dropped when it disconnects.
+    """
+
+    def __init__(self, model_name, policy_setup, address=DEFAULT_ADDRESS, max_batch=16, batch_window=0.005):
+        from experiments.model_interface import load_policy
+
+        self.model_name = model_name
+        self.policy_setup = policy_setup
+        self.address = address
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.model = load_policy(model_name, policy_setup)
+        self.requests = queue.Queue()
+        self.session_ids = itertools.count()
+
+    def _handle_client(self, conn):
+        sessions = set()
+        try:
+            model_name, policy_setup = conn.recv()
+            if (model_name, policy_setup) != (self.model_name, self.policy_setup):
+                conn.send((None, f"Server runs {self.model_name} ({self.policy_setup}), "
+                                 f"not {model_name} ({policy_setup})"))
+                return
+            conn.send((None, None))
+            reply = queue.Queue(maxsize=1)
+            while True:
+                request = conn.recv()
+                if request[0] == "open":
+                    result = [next(self.session_ids) for _ in range(request[1])]
+                    sessions.update(result)
+                    conn.send((result, None))
+                    continue
+                if request[0] == "close":
+                    sessions.difference_update(request[1])
+                self.requests.put((request, reply))
+                conn.send(reply.get())
+        except (EOFError, OSError):
+            pass
+        finally:
+            if sessions:
+                self.requests.put((("close", list(sessions), None), None))
+            conn.close()
+
+    def _run(self, request):
+        command, session_ids, payload = request
+        if command == "reset":
+            self.model.reset_batch(payload, env_ids=session_ids)
+        elif command == "close":
+            for session_id in session_ids:
+                self.model.batch_states.pop(session_id, None)
+        else:
+            raise ValueError(command)
+
+    def _serve_batch(self, batch):
+        session_ids = [session_id for (_, ids, _), _ in batch for session_id in ids]
+        images = [image for (_, _, payload), _ in batch for image in payload]
+        try:
+            outputs = _to_numpy(self.model.step_batch(images, env_ids=session_ids))
+        except Exception:
+            error = traceback.format_exc()
+            for _, reply in batch:
+                reply.put((None, error))
+            return
+        start = 0
+        for (_, ids, _), reply in batch:
+            reply.put((outputs[start:start + len(ids)], None))
+            start += len(ids)
+
+    def _inference_loop(self):
+        while True:
+            request, reply = self.requests.get()
+            if request[0] != "step":
+                try:
+                    self._run(request)
+                    result = (None, None)
+                except Exception:
+                    result = (None, traceback.format_exc())
+                if reply is not None:
+                    reply.put(result)
+                continue
+            # gather the steps of other clients that arrive shortly after, so they share one forward pass
+            batch = [(request, reply)]
+            num_sessions = len(request[1])
+            deadline = time.monotonic() + self.batch_window
+            while num_sessions < self.max_batch:
+                try:
+                    request, reply = self.requests.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request[0] == "step":
+                    batch.append((request, reply))
+                    num_sessions += len(request[1])
+                else:
+                    # a client only sends its next request after the previous reply, so this never reorders a client
+                    try:
+                        self._run(request)
+                        result = (None, None)
+                    except Exception:
+                        result = (None, traceback.format_exc())
+                    if reply is not None:
+                        reply.put(result)
+            self._serve_batch(batch)
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        threading.Thread(target=self._inference_loop, daemon=True).start()
+        with Listener(self.address, family="AF_UNIX", authkey=AUTHKEY) as listener:
+            print(f"Serving {self.model_name} ({self.policy_setup}) on {self.address}")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._handle_client, args=(conn,), daemon=True).start()
+
+
+class PolicyClient:
+    """Drop-in replacement for an RT1/Octo/OpenVLA inference object that runs the policy on a PolicyServer.
+
+    reset/step run one episode as in the local policies; reset_batch/step_batch map the caller's env_ids to server
+    sessions, so VLAInterface.run_interface_batch works unchanged.
+    """
+
+    def __init__(self, address, model_name, policy_setup):
+        self.address = address
+        self.model_name = model_name
+        self.policy_setup = policy_setup
+        self.conn = Client(address, family="AF_UNIX", authkey=AUTHKEY)
+        self._call(model_name, policy_setup)
+        self.sessions = {}  # env_id -> session id; env_id None is the episode of reset/step
+        self.task_descriptions = {}
+
+    def _call(self, *request):
+        self.conn.send(request)
+        result, error = self.conn.recv()
+        if error is not None:
+            raise RuntimeError(f"Policy server error:\n{error}")
+        return result
+
+    def _reset(self, env_ids, task_descriptions):
+        new = [env_id for env_id in env_ids if env_id not in self.sessions]
+        if new:
+            self.sessions.update(zip(new, self._call("open", len(new))))
+        self._call("reset", [self.sessions[env_id] for env_id in env_ids], list(task_descriptions))
+        self.task_descriptions.update(zip(env_ids, task_descriptions))
+
+    def reset(self, task_description):
+        self._reset([None], [task_description])
+
+    def step(self, image, task_description=None, *args, **kwargs):
+        if task_description is not None and task_description != self.task_descriptions.get(None):
+            self.reset(task_description)
+        return self._call("step", [self.sessions[None]], [image])[0]
+
+    def reset_batch(self, task_descriptions, env_ids=None):
+        if env_ids is None:
+            self.close_sessions([env_id for env_id in self.sessions if env_id is not None])
+            env_ids = range(len(task_descriptions))
+        self._reset(list(env_ids), task_descriptions)
+
+    def step_batch(self, images, task_descriptions=None, env_ids=None):
+        env_ids = list(range(len(images))) if env_ids is None else list(env_ids)
+        if task_descriptions is not None:
+            changed = [(env_id, task_description) for env_id, task_description in zip(env_ids, task_descriptions)
+                       if task_description != self.task_descriptions.get(env_id)]
+            if changed:
+                self._reset([c[0] for c in changed], [c[1] for c in changed])
+        return self._call("step", [self.sessions[env_id] for env_id in env_ids], list(images))
+
+    def close_sessions(self, env_ids):
+        if env_ids:
+            self._call("close", [self.sessions.pop(env_id) for env_id in env_ids], None)
+            for env_id in env_ids:
+                self.task_descriptions.pop(env_id, None)
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="VLA Policy Server")
+    parser.add_argument('-m', '--model', choices=["rt_1_x", "rt_1_400k", "rt_1_58k", "rt_1_1k", "octo-base",
+                                                  "octo-small", "openvla-7b"], required=True, help="VLA model")
+    parser.add_argument('-ps', '--policy_setup', choices=["google_robot", "widowx_bridge"], required=True,
+                        help="google_robot for the grasp/move datasets, widowx_bridge for put-on/put-in")
+    parser.add_argument('-a', '--address', type=str, default=DEFAULT_ADDRESS, help="Unix socket to listen on")
+    parser.add_argument('-mb', '--max_batch', type=int, default=16, help="Maximum number of episodes per forward pass")
+    parser.add_argument('-bw', '--batch_window', type=float, default=0.005,
+                        help="Seconds to wait for steps of other clients before running a forward pass")
+
+    args = parser.parse_args()
+
+    PolicyServer(args.model, args.policy_setup, address=args.address, max_batch=args.max_batch,
+                 batch_window=args.batch_window).serve_forever()
@@ -11,6 +11,7 @@ from transforms3d.euler import euler2quat
 from transforms3d.quaternions import quat2mat, mat2quat
 import argparse
 from tqdm import tqdm
+from experiments.scenario_dataset import scenario_rng
 
 # Setup paths
 PACKAGE_DIR = Path(__file__).parent.resolve()
@@ -18,8 +19,8 @@ PACKAGE_DIR = Path(__file__).parent.resolve()
 
 class RandomCamera:
     def __init__(self, base=None, seed=None):
+        self.seed = seed
         if seed:
-            self.seed = seed
             np.random.seed(seed)
         if base == 'google':
             self.camera = 'overhead_camera'
@@ -36,18 +37,24 @@ class RandomCamera:
         else:
             raise NotImplementedError
 
-    def query(self):
-        pos = [np.random.uniform(-0.05, 0.05), np.random.uniform(-0.05, 0.05), np.random.uniform(-0.05, 0.05)]
-        rot_y_plane = np.random.uniform(-np.pi/36, np.pi/36)
-        rot_z_plane = np.random.uniform(-np.pi/36, np.pi/36)
+    def query(self, rng=None):
+        # draws from the global np.random stream, or from rng (a np.random.Generator) if given
+        random = rng if rng is not None else np.random
+        pos = [random.uniform(-0.05, 0.05), random.uniform(-0.05, 0.05), random.uniform(-0.05, 0.05)]
+        rot_y_plane = random.uniform(-np.pi/36, np.pi/36)
+        rot_z_plane = random.uniform(-np.pi/36, np.pi/36)
         r = quat2mat(self.base_rot)
         new_r = r @ quat2mat(euler2quat(0, rot_y_plane, rot_z_plane))
         new_rot = mat2quat(new_r)
 
         return [pos[0] + self.base_pos[0], pos[1] + self.base_pos[1], pos[2] + self.base_pos[2]], new_rot.tolist()
 
-    def generate_options(self):
-        p, q = self.query()
+    def generate_options_at(self, idx):
+        """Options idx, drawn from its own stream scenario_rng(seed, idx) only."""
+        return self.generate_options(scenario_rng(self.seed, idx))
+
+    def generate_options(self, rng=None):
+        p, q = self.query(rng)
         options = {
             "camera_cfgs": {
                 self.camera: {
@@ -65,6 +72,8 @@ if __name__ == '__main__':
     parser.add_argument('-s', '--seed', type=int, default=None, help="Random Seed")
     parser.add_argument('-o', '--output', type=str, help="Output path, e.g., folder")
     parser.add_argument('-b', '--base', type=str, default="google", help="Camera base")
+    parser.add_argument('-ss', '--streams', type=bool, default=False,
+                        help="Draw every camera from its own stream spawned from the seed (np.random.SeedSequence)")
 
     args = parser.parse_args()
 
@@ -76,13 +85,13 @@ if __name__ == '__main__':
 
     res = {}
     for i in tqdm(range(args.num)):
-        res[i] = fuzzer.generate_options()
+        res[i] = fuzzer.generate_options_at(i) if args.streams else fuzzer.generate_options()
 
     res["seed"] = random_seed
 
     res["num"] = args.num
 
-    output_name += f"camera_n-{args.num}_b-{args.base}_s-{random_seed}.json"
+    output_name += f"camera_n-{args.num}_b-{args.base}_s-{random_seed}" + ("_ss.json" if args.streams else ".json")
 
     output_path = args.output + output_name if args.output else str(PACKAGE_DIR) + "/../data/" + output_name
 
@@ -10,6 +10,7 @@ import numpy as np
 from transforms3d.euler import euler2quat
 import argparse
 from tqdm import tqdm
+from experiments.scenario_dataset import scenario_rng
 
 # Setup paths
 PACKAGE_DIR = Path(__file__).parent.resolve()
@@ -17,29 +18,35 @@ PACKAGE_DIR = Path(__file__).parent.resolve()
 
 class RandomLighting:
     def __init__(self, direction=None, seed=None, factor_range=None, step_range=None):
+        self.seed = seed
         if seed:
-            self.seed = seed
             np.random.seed(seed)
         self.factor_range = factor_range if factor_range else (1, 2)
         self.step_range = step_range if step_range else (0, 5)
         self.direction = direction
 
-    def query(self):
+    def query(self, rng=None):
         # direction, step, factor = self.lighting_cfgs[0], self.lighting_cfgs[1], self.lighting_cfgs[2]
+        # draws from the global np.random stream, or from rng (a np.random.Generator) if given
+        random = rng if rng is not None else np.random
         if self.direction:
             direction = self.direction
         else:
-            direction = np.random.choice(["BRIGHT", "DARK"])
+            direction = random.choice(["BRIGHT", "DARK"])
         if direction == 'DARK':
-            factor = np.random.uniform(1 / self.factor_range[1], 1 / self.factor_range[0])
+            factor = random.uniform(1 / self.factor_range[1], 1 / self.factor_range[0])
             factor = 1 / factor
         else:
-            factor = np.random.uniform(*self.factor_range)
-        step = np.random.randint(*self.step_range)
+            factor = random.uniform(*self.factor_range)
+        step = rng.integers(*self.step_range) if rng is not None else np.random.randint(*self.step_range)
         return direction, step, factor
 
-    def generate_options(self):
-        direction, step, factor = self.query()
+    def generate_options_at(self, idx):
+        """Options idx, drawn from its own stream scenario_rng(seed, idx) only."""
+        return self.generate_options(scenario_rng(self.seed, idx))
+
+    def generate_options(self, rng=None):
+        direction, step, factor = self.query(rng)
         if step == 0:
             return {"lighting_cfgs": "DEFAULT"}
         return {"lighting_cfgs": [direction, int(step), float(factor)]}
@@ -51,6 +58,8 @@ if __name__ == '__main__':
     parser.add_argument('-s', '--seed', type=int, default=None, help="Random Seed")
     parser.add_argument('-o', '--output', type=str, help="Output path, e.g., folder")
     parser.add_argument('-d', '--direction', type=str, default=None, help="Lighting direction")
+    parser.add_argument('-ss', '--streams', type=bool, default=False,
+                        help="Draw every lighting from its own stream spawned from the seed (np.random.SeedSequence)")
 
     args = parser.parse_args()
 
@@ -62,16 +71,17 @@ if __name__ == '__main__':
 
     res = {}
     for i in tqdm(range(args.num)):
-        res[i] = fuzzer.generate_options()
+        res[i] = fuzzer.generate_options_at(i) if args.streams else fuzzer.generate_options()
 
     res["seed"] = random_seed
 
     res["num"] = args.num
 
     if args.direction:
-        output_name += f"lighting_n-{args.num}_d-{args.direction}_s-{random_seed}.json"
+        output_name += f"lighting_n-{args.num}_d-{args.direction}_s-{random_seed}"
     else:
-        output_name += f"lighting_n-{args.num}_s-{random_seed}.json"
+        output_name += f"lighting_n-{args.num}_s-{random_seed}"
+    output_name += "_ss.json" if args.streams else ".json"
 
     output_path = args.output + output_name if args.output else str(PACKAGE_DIR) + "/../data/" + output_name
 
@@ -0,0 +1,318 @@
+"""SQLite store of episode results and per-step metrics."""
+import argparse
+import json
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+
+import numpy as np
+from tqdm import tqdm
+
+from experiments.scenario_fingerprint import ENV_VERSION
+
+EPISODE_KEY = ("dataset", "model", "seed", "idx")
+
+# VLAInterface options that change the recorded episodes (early stopping truncates them and adds decided_outcome;
+# adaptive settling and the actor pool start them from slightly different scenes), by the tag they add to the cached
+# task
+EPISODE_OPTIONS = {
+    "stop_on_decided_outcome": "early_stop",
+    "adaptive_settle": "adaptive_settle",
+    "use_actor_pool": "actor_pool",
+}
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    dataset TEXT NOT NULL,
+    model TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    success INTEGER,
+    num_steps INTEGER NOT NULL,
+    episode_stats TEXT NOT NULL,
+    PRIMARY KEY (dataset, model, seed, idx)
+);
+CREATE TABLE IF NOT EXISTS steps (
+    dataset TEXT NOT NULL,
+    model TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    timestep INTEGER NOT NULL,
+    PRIMARY KEY (dataset, model, seed, idx, timestep)
+);
+"""
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    fingerprint TEXT NOT NULL,
+    task TEXT NOT NULL,
+    model TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    env_version INTEGER NOT NULL,
+    success INTEGER,
+    episode_stats TEXT NOT NULL,
+    PRIMARY KEY (fingerprint, task, model, seed, env_version)
+);
+"""
+
+
+def _to_builtin(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+def _scalar(value):
+    # values as read back from log.json, where StableJSONizer writes numpy booleans as the strings "true" / "false"
+    value = _to_builtin(value)
+    if isinstance(value, str) and value in ("true", "false"):
+        return value == "true"
+    return value
+
+
+def flatten_info(info, prefix=""):
+    """Flatten one step's info dict into {column: scalar}; nested dicts are joined with '__', lists become JSON."""
+    flat = {}
+    for k, v in info.items():
+        column = re.sub(r"\W", "_", f"{prefix}{k}")
+        v = _scalar(v)
+        if isinstance(v, dict):
+            flat.update(flatten_info(v, prefix=f"{column}__"))
+        elif isinstance(v, (list, tuple)):
+            flat[column] = json.dumps(v, default=_to_builtin)
+        else:
+            flat[column] = v
+    return flat
+
+
+class SQLiteDB:
+    """SQLite database that several processes can share.
+
+    The connection is opened lazily (again in every process the object is pickled to) in WAL mode and creates SCHEMA
+    on first use; _write wraps a single IMMEDIATE transaction.
+    """
+
+    SCHEMA = ""
+
+    def __init__(self, path, timeout=120.0):
+        self.path = path
+        self.timeout = timeout
+        self._conn = None
+
+    def __getstate__(self):
+        # connections cannot cross process boundaries; every worker opens its own
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        return state
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    @contextmanager
+    def _write(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class ResultStore(SQLiteDB):
+    """Append-only SQLite store of fuzzing results, one row per scenario plus one row per step.
+
+    The episodes table is keyed by (dataset, model, seed, idx) and keeps the full episode_stats as JSON. The steps table
+    holds one column per info metric (nested dicts flattened with '__'), added on first use, so per-step metrics can be
+    filtered and aggregated in SQL without opening any per-scenario files. The database runs in WAL mode and every
+    write is a single IMMEDIATE transaction, so several workers can write to the same file concurrently.
+    """
+
+    SCHEMA = STORE_SCHEMA
+
+    def _step_columns(self):
+        return {row["name"] for row in self.conn.execute("PRAGMA table_info(steps)")}
+
+    def add_episode(self, dataset, model, seed, idx, episode_stats):
+        """Insert (or replace) the result of one scenario; episode_stats maps timestep -> info as in log.json."""
+        timesteps = sorted(episode_stats.keys(), key=int)
+        rows = [flatten_info(episode_stats[t]) for t in timesteps]
+        success = rows[-1].get("success", None) if rows else None
+        key = (dataset, model, int(seed), int(idx))
+        with self._write() as conn:
+            # the column set is re-read inside the write lock so concurrent writers never add the same column twice
+            columns = self._step_columns()
+            for row in rows:
+                for column, value in row.items():
+                    if column not in columns:
+                        conn.execute(f'ALTER TABLE steps ADD COLUMN "{column}"')
+                        columns.add(column)
+            conn.execute(
+                "INSERT OR REPLACE INTO episodes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                key + (None if success is None else int(success), len(rows),
+                       json.dumps(episode_stats, default=_to_builtin)),
+            )
+            conn.execute("DELETE FROM steps WHERE dataset=? AND model=? AND seed=? AND idx=?", key)
+            for t, row in zip(timesteps, rows):
+                names = ", ".join(f'"{c}"' for c in row.keys())
+                marks = ", ".join("?" * (len(row) + 5))
+                conn.execute(f"INSERT INTO steps (dataset, model, seed, idx, timestep, {names}) VALUES ({marks})",
+                             key + (int(t),) + tuple(row.values()))
+
+    @staticmethod
+    def _where(filters):
+        clauses, params = [], []
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if column not in EPISODE_KEY + ("success",):
+                raise ValueError(column)
+            if isinstance(value, (list, tuple, set)):
+                clauses.append(f"{column} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def completed_indices(self, dataset, model, seed):
+        where, params = self._where(dict(dataset=dataset, model=model, seed=seed))
+        return {row["idx"] for row in self.conn.execute(f"SELECT idx FROM episodes{where}", params)}
+
+    def episodes(self, with_stats=False, **filters):
+        """List episodes matching the filters (dataset, model, seed, idx, success; a list matches any of its values)."""
+        columns = "*" if with_stats else "dataset, model, seed, idx, success, num_steps"
+        where, params = self._where(filters)
+        results = []
+        for row in self.conn.execute(f"SELECT {columns} FROM episodes{where} ORDER BY {', '.join(EPISODE_KEY)}", params):
+            row = dict(row)
+            if with_stats:
+                row["episode_stats"] = json.loads(row["episode_stats"])
+            results.append(row)
+        return results
+
+    def success_rate(self, group_by=("dataset", "model"), **filters):
+        """Return {group: (success rate, number of episodes)} aggregated in SQL over the matching episodes."""
+        for column in group_by:
+            if column not in EPISODE_KEY:
+                raise ValueError(column)
+        where, params = self._where(filters)
+        groups = ", ".join(group_by)
+        query = f"SELECT {groups}, AVG(success) AS rate, COUNT(*) AS n FROM episodes{where} GROUP BY {groups}"
+        return {tuple(row[c] for c in group_by): (row["rate"], row["n"]) for row in self.conn.execute(query, params)}
+
+    def step_metrics(self, metrics, **filters):
+        """Return {column: np.ndarray} of the requested per-step metrics plus the episode key and timestep columns."""
+        available = self._step_columns()
+        for metric in metrics:
+            if metric not in available:
+                raise KeyError(metric)
+        where, params = self._where(filters)
+        columns = list(EPISODE_KEY) + ["timestep"] + list(metrics)
+        quoted = ", ".join(f'"{c}"' for c in columns)
+        query = f"SELECT {quoted} FROM steps{where} ORDER BY {', '.join(EPISODE_KEY)}, timestep"
+        rows = self.conn.execute(query, params).fetchall()
+        return {c: np.array([row[i] for row in rows]) for i, c in enumerate(columns)}
+
+
+def result_cache_key(vla_kwargs, seed):
+    """(task, model, seed) under which ResultCache keeps the episodes run by VLAInterface(**vla_kwargs) with seed.
+
+    The task is tagged with the EPISODE_OPTIONS that are on, so runs that record different episodes never share results.
+    """
+    task = vla_kwargs["task"] + "".join(f"+{tag}" for k, tag in EPISODE_OPTIONS.items() if vla_kwargs.get(k))
+    return task, vla_kwargs["model_name"], seed
+
+
+class ResultCache(SQLiteDB):
+    """Results of scenarios by content rather than by dataset, shared by all campaigns.
+
+    Episodes are keyed by (fingerprint, task, model, seed, env_version), the fingerprint being the
+    scenario_fingerprint of the options, so a scenario that was already run (e.g., in another dataset, or in an
+    earlier run with another output folder) is looked up instead of being simulated again. env_version
+    (scenario_fingerprint.ENV_VERSION) keeps results of older simulator or evaluation versions from being reused.
+    """
+
+    SCHEMA = CACHE_SCHEMA
+
+    def get(self, fingerprint, task, model, seed, env_version=ENV_VERSION):
+        """Return the cached episode_stats (timestep -> info, as in log.json) of a scenario, or None."""
+        row = self.conn.execute("SELECT episode_stats FROM results WHERE fingerprint=? AND task=? AND model=? AND "
+                                "seed=? AND env_version=?",
+                                (fingerprint, task, model, int(seed), env_version)).fetchone()
+        return None if row is None else {int(t): info for t, info in json.loads(row["episode_stats"]).items()}
+
+    def cached(self, fingerprints, task, model, seed, env_version=ENV_VERSION):
+        """The subset of fingerprints that have a cached result."""
+        fingerprints = list(fingerprints)
+        found = set()
+        for start in range(0, len(fingerprints), 500):
+            chunk = fingerprints[start:start + 500]
+            query = (f"SELECT fingerprint FROM results WHERE task=? AND model=? AND seed=? AND env_version=? AND "
+                     f"fingerprint IN ({', '.join('?' * len(chunk))})")
+            found.update(row["fingerprint"] for row in
+                         self.conn.execute(query, (task, model, int(seed), env_version, *chunk)))
+        return found
+
+    def put(self, fingerprint, task, model, seed, episode_stats, env_version=ENV_VERSION):
+        timesteps = sorted(episode_stats.keys(), key=int)
+        success = _scalar(episode_stats[timesteps[-1]].get("success")) if timesteps else None
+        with self._write() as conn:
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (fingerprint, task, model, int(seed), env_version,
+                          None if success is None else int(success), json.dumps(episode_stats, default=_to_builtin)))
+
+
+def import_results(store, results_root):
+    """Import an existing results tree (results_root/{dataset}/{model}_{seed}/{idx}/log.json) into the store."""
+    count = 0
+    for dataset in sorted(os.listdir(results_root)):
+        dataset_dir = os.path.join(results_root, dataset)
+        if not os.path.isdir(dataset_dir):
+            continue
+        for run in sorted(os.listdir(dataset_dir)):
+            model, _, seed = run.rpartition("_")
+            if not model or not seed.isdigit():
+                continue
+            run_dir = os.path.join(dataset_dir, run)
+            for idx in tqdm(sorted(os.listdir(run_dir)), desc=f"{dataset}/{run}"):
+                log_path = os.path.join(run_dir, idx, "log.json")
+                if not idx.isdigit() or not os.path.exists(log_path):
+                    continue
+                with open(log_path, "r") as f:
+                    episode_stats = json.load(f)
+                store.add_episode(dataset, model, int(seed), int(idx), episode_stats)
+                count += 1
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="Result Store")
+    parser.add_argument('-s', '--store', type=str, required=True, help="SQLite result store")
+    parser.add_argument('-i', '--import_dir', type=str, default=None,
+                        help="Import a results folder laid out as {dataset}/{model}_{seed}/{idx}/log.json")
+    parser.add_argument('-g', '--group_by', type=str, default="dataset,model", help="Columns to aggregate over")
+
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    if args.import_dir:
+        print(f"Imported {import_results(store, args.import_dir)} episodes")
+    for group, (rate, n) in sorted(store.success_rate(group_by=tuple(args.group_by.split(","))).items()):
+        print(*group, "n/a" if rate is None else f"{rate:.3f}", n)
+    store.close()
@@ -6,6 +6,15 @@ Time   : 8/8/24
 import argparse
 import numpy as np
 from experiments.model_interface import VLAInterface
+from experiments.worker_pool import ScenarioWorkerPool
+from experiments.result_store import ResultCache, ResultStore, result_cache_key
+from experiments.async_writer import AsyncImageWriter
+from experiments.frame_container import EpisodeFrameWriter, EpisodeVideoWriter
+from experiments.manifest import ResumeManifest, dump_json_atomic
+from experiments.scenario_dataset import open_dataset, parse_shard
+from experiments.scenario_fingerprint import scenario_fingerprint
+from experiments.test_generation import GeneratedDataset
+from functools import partial
 from pathlib import Path
 from tqdm import tqdm
 import json
@@ -24,6 +33,68 @@ class StableJSONizer(json.JSONEncoder):
             else super().default(obj)
 
 
+def get_task(dataset_name):
+    if "grasp" in dataset_name:
+        task = "google_robot_pick_customizable"
+    elif "move" in dataset_name:
+        task = "google_robot_move_near_customizable"
+    elif "put-on" in dataset_name:
+        task = "widowx_put_on_customizable"
+    elif "put-in" in dataset_name:
+        task = "widowx_put_in_customizable"
+    else:
+        raise NotImplementedError
+    if 'ycb' in dataset_name:
+        task += "_ycb"
+    return task
+
+
+def make_frame_sink(image_dir, idx, image_format):
+    if not image_dir:
+        return None
+    if image_format == "frames":
+        return EpisodeFrameWriter(image_dir + f"/{idx}.frames")
+    if image_format == "mp4":
+        return EpisodeVideoWriter(image_dir + f"/{idx}.mp4")
+    return None
+
+
+def claim(manifest, indices):
+    return [idx for idx in indices if manifest is None or manifest.claim(idx)]
+
+
+def save_result(result_dir, image_dir, idx, run_kwargs, images, episode_stats, store=None, run_key=None, writer=None,
+                image_format="jpg", manifest=None, cache=None, cache_key=None):
+    if cache is not None and run_kwargs is not None:
+        # cache_key is result_cache_key(vla_kwargs, seed); the cache keeps the episode as written to log.json, so cache hits write
+        # the same log.json as a run
+        cache.put(scenario_fingerprint(run_kwargs["options"]), *cache_key,
+                  json.loads(json.dumps(episode_stats, cls=StableJSONizer)))
+    if store is not None:
+        # run_key is (dataset, model, seed)
+        store.add_episode(*run_key, idx, episode_stats)
+    else:
+        os.makedirs(result_dir + f"/{idx}", exist_ok=True)
+        dump_json_atomic(episode_stats, result_dir + f"/{idx}/log.json", cls=StableJSONizer)
+    future = None
+    if image_dir and images:  # streamed formats (frames, mp4) are already on disk
+        if writer is not None:
+            future = writer.write_episode(image_dir + f"/{idx}", images, image_format=image_format)
+        else:
+            os.makedirs(image_dir + f"/{idx}", exist_ok=True)
+            for img_idx in range(len(images)):
+                im = Image.fromarray(images[img_idx])
+                im.save(image_dir + f"/{idx}/" + f'{img_idx}.{image_format}')
+    if manifest is not None and store is None:
+        # the scenario is done once all of its files are on disk; with the async writer, once its images are written
+        # (an episode dropped by a full writer has no images to wait for, a failed write leaves it to be re-run)
+        if future is None:
+            manifest.mark_done(idx)
+        else:
+            future.add_done_callback(lambda f: f.exception() is None and manifest.mark_done(idx))
+    return episode_stats[max(episode_stats.keys())]["success"] if episode_stats else None
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog="VLA Fuzzing")
     parser.add_argument('-d', '--data', type=str, help="Testing data")
@@ -35,40 +106,60 @@ if __name__ == '__main__':
                         default="rt_1_x",
                         help="VLA model")
     parser.add_argument('-r', '--resume', type=bool, default=True, help="Resume from where we left.")
+    parser.add_argument('-re', '--reuse_env', type=bool, default=False,
+                        help="Build the simulation environment once and reuse it across scenarios.")
+    parser.add_argument('-es', '--early_stop', type=bool, default=False,
+                        help="Stop an episode as soon as its final success can no longer change.")
+    parser.add_argument('-ps', '--policy_server', type=str, default=None,
+                        help="Unix socket of a running policy_server.py to use instead of loading the model here.")
+    parser.add_argument('-sc', '--settle_cache', type=str, default=None,
+                        help="Directory to cache the settled initial scenes in, shared by the runs of all models.")
+    parser.add_argument('-ap', '--actor_pool', type=bool, default=False,
+                        help="With --reuse_env, build each object once per environment and park the unused ones "
+                             "instead of rebuilding the scene for every scenario.")
+    parser.add_argument('-as', '--adaptive_settle', type=bool, default=False,
+                        help="End the settling of the initial scene as soon as all objects are at rest, instead of "
+                             "after fixed durations. The number of physics steps used is in the reset info.")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="Number of worker processes, each with its own environment and model.")
+    parser.add_argument('-b', '--batch_size', type=int, default=1,
+                        help="Number of scenarios rolled out in lockstep with batched model inference.")
+    parser.add_argument('-p', '--pipeline', type=int, default=1,
+                        help="Split each batch into this many groups whose simulation overlaps model inference.")
+    parser.add_argument('-st', '--store', type=str, default=None,
+                        help="Write results into this SQLite result store instead of one log.json per scenario.")
+    parser.add_argument('-if', '--image_format', type=str, choices=["jpg", "png", "mp4", "frames"], default="jpg",
+                        help="Save episode images as one file per frame (jpg, png), or stream them into one file per "
+                             "episode while it runs: a video (mp4) or an indexed frame container (frames).")
+    parser.add_argument('-aw', '--async_writers', type=int, default=0,
+                        help="Encode and write images on this many background threads (0 writes synchronously).")
+    parser.add_argument('-sh', '--shard', type=str, default=None,
+                        help="Only run shard i of n of the dataset, given as i/n (scenarios i, i+n, i+2n, ...).")
+    parser.add_argument('-dd', '--dedup', type=str, default=None,
+                        help="SQLite result cache shared across datasets and runs. Scenarios whose result (same scene, "
+                             "model, seed and env version) is cached are not simulated again and get no images.")
+    parser.add_argument('-g', '--generate', type=str, default=None,
+                        help="Generate the scenarios of a per-scenario streams dataset (test_generation.py --streams) "
+                             "by name, e.g., t-move_n-1000_o-m3_s-42_ss, instead of reading them from a file. "
+                             "With --shard, every fuzzer generates its own shard only.")
 
     args = parser.parse_args()
 
     random_seed = args.seed if args.seed else np.random.randint(0, 4294967295)  # max uint32
 
-    data_path = args.data if args.data else str(PACKAGE_DIR) + "/../data/t-grasp_n-1000_o-3.json"
+    if args.generate:
+        data_path = args.generate
+    else:
+        data_path = args.data if args.data else str(PACKAGE_DIR) + "/../data/t-grasp_n-1000_o-3.json"
 
     dataset_name = data_path.split('/')[-1]
 
-    if "grasp" in dataset_name:
-        if 'ycb' in dataset_name:
-            vla = VLAInterface(model_name=args.model, task="google_robot_pick_customizable_ycb")
-        else:
-            vla = VLAInterface(model_name=args.model, task="google_robot_pick_customizable")
-    elif "move" in dataset_name:
-        if 'ycb' in dataset_name:
-            vla = VLAInterface(model_name=args.model, task="google_robot_move_near_customizable_ycb")
-        else:
-            vla = VLAInterface(model_name=args.model, task="google_robot_move_near_customizable")
-    elif "put-on" in dataset_name:
-        if 'ycb' in dataset_name:
-            vla = VLAInterface(model_name=args.model, task="widowx_put_on_customizable_ycb")
-        else:
-            vla = VLAInterface(model_name=args.model, task="widowx_put_on_customizable")
-    elif "put-in" in dataset_name:
-        if 'ycb' in dataset_name:
-            vla = VLAInterface(model_name=args.model, task="widowx_put_in_customizable_ycb")
-        else:
-            vla = VLAInterface(model_name=args.model, task="widowx_put_in_customizable")
-    else:
-        raise NotImplementedError
+    vla_kwargs = dict(model_name=args.model, task=get_task(dataset_name), reuse_env=args.reuse_env,
+                      stop_on_decided_outcome=args.early_stop, policy_server=args.policy_server,
+                      settle_cache_dir=args.settle_cache, use_actor_pool=args.actor_pool,
+                      adaptive_settle=args.adaptive_settle)
 
-    with open(data_path, 'r') as f:
-        tasks = json.load(f)
+    tasks = GeneratedDataset.from_name(args.generate) if args.generate else open_dataset(data_path)
 
     if args.output:
         result_dir = args.output + data_path.split('/')[-1].split(".")[0]
@@ -89,16 +180,95 @@ if __name__ == '__main__':
     else:
         image_dir = None
 
-    for idx in tqdm(range(tasks["num"])):
-        if args.resume and os.path.exists(result_dir + f"/{idx}/" + '/log.json'):  # if resume allowed then skip the finished runs.
-            continue
-        options = tasks[str(idx)]
-        images, episode_stats = vla.run_interface(seed=random_seed, options=options)
-        os.makedirs(result_dir + f"/{idx}", exist_ok=True)
-        with open(result_dir + f"/{idx}/" + '/log.json', "w") as f:
-            json.dump(episode_stats, f, cls=StableJSONizer)
-        if image_dir:
-            os.makedirs(image_dir + f"/{idx}", exist_ok=True)
-            for img_idx in range(len(images)):
-                im = Image.fromarray(images[img_idx])
-                im.save(image_dir + f"/{idx}/" + f'{img_idx}.jpg')
\ No newline at end of file
+    # a .jsonl dataset is read line by line on demand, so a shard never parses the scenarios of other shards
+    if args.shard:
+        shard_id, num_shards = parse_shard(args.shard)
+        indices = range(shard_id, tasks["num"], num_shards)
+    else:
+        indices = range(tasks["num"])
+
+    if args.store:
+        store = ResultStore(args.store)
+        run_key = (data_path.split('/')[-1].split(".")[0], args.model, random_seed)
+        finished = store.completed_indices(*run_key) if args.resume else set()
+        manifest = None
+    else:
+        store, run_key = None, None
+        # finished scenarios are read from one manifest instead of probing every log.json
+        manifest = ResumeManifest(result_dir).load()
+        finished = {idx for idx in indices if manifest.is_done(idx)} if args.resume else set()
+
+    writer = AsyncImageWriter(max_workers=args.async_writers) if image_dir and args.async_writers > 0 else None
+    cache = ResultCache(args.dedup) if args.dedup else None
+    cache_key = result_cache_key(vla_kwargs, random_seed)
+    save_kwargs = dict(store=store, run_key=run_key, writer=writer, image_format=args.image_format, manifest=manifest,
+                       cache=cache, cache_key=cache_key)
+
+    todo = [idx for idx in indices if idx not in finished]  # if resume allowed then skip the finished runs.
+
+    duplicates = {}  # idx -> fingerprint of scenarios whose result comes from the cache
+    if cache is not None:
+        fingerprints = {idx: scenario_fingerprint(tasks[str(idx)]) for idx in todo}
+        cached = cache.cached(set(fingerprints.values()), *cache_key)
+        first = set()
+        for idx in todo:
+            # a scene that occurs several times in this run is simulated once
+            if fingerprints[idx] in cached or fingerprints[idx] in first:
+                duplicates[idx] = fingerprints[idx]
+            else:
+                first.add(fingerprints[idx])
+        todo = [idx for idx in todo if idx not in duplicates]
+        print(f"{len(duplicates)} scenarios are taken from the result cache")
+
+    batches = [todo[i:i + args.batch_size] for i in range(0, len(todo), args.batch_size)]
+
+    if args.workers > 1:
+        handler = partial(save_result, result_dir, image_dir, **save_kwargs)
+        with ScenarioWorkerPool(args.workers, vla_kwargs, handler=handler) as pool:
+            # scenarios are claimed only right before they are submitted, so concurrent fuzzers split the work
+            if args.batch_size > 1:
+                items = ((batch, dict(seed=random_seed, options_list=[tasks[str(idx)] for idx in batch],
+                                      num_groups=args.pipeline,
+                                      frame_sinks=[make_frame_sink(image_dir, idx, args.image_format) for idx in batch]))
+                         for batch in (claim(manifest, batch) for batch in batches) if batch)
+            else:
+                items = ((idx, dict(seed=random_seed, options=tasks[str(idx)],
+                                    frame_sink=make_frame_sink(image_dir, idx, args.image_format)))
+                         for idx in todo if claim(manifest, [idx]))
+            for idx, success, error in tqdm(pool.imap_unordered(items), total=len(todo)):
+                if error:
+                    print(f"Scenario {idx} failed:\n{error}")
+    elif args.batch_size > 1:
+        vla = VLAInterface(**vla_kwargs)
+        with tqdm(total=len(todo)) as pbar:
+            for batch in batches:
+                pbar.update(len(batch))
+                batch = claim(manifest, batch)
+                if not batch:
+                    continue
+                frame_sinks = [make_frame_sink(image_dir, idx, args.image_format) for idx in batch]
+                rollouts = vla.run_interface_batch(seed=random_seed, options_list=[tasks[str(idx)] for idx in batch],
+                                                   num_groups=args.pipeline, frame_sinks=frame_sinks)
+                for idx, (images, episode_stats) in zip(batch, rollouts):
+                    save_result(result_dir, image_dir, idx, dict(options=tasks[str(idx)]), images, episode_stats,
+                                **save_kwargs)
+        vla.close()
+    else:
+        vla = VLAInterface(**vla_kwargs)
+        for idx in tqdm(todo):
+            if not claim(manifest, [idx]):
+                continue
+            options = tasks[str(idx)]
+            images, episode_stats = vla.run_interface(seed=random_seed, options=options,
+                                                      frame_sink=make_frame_sink(image_dir, idx, args.image_format))
+            save_result(result_dir, image_dir, idx, dict(options=options), images, episode_stats, **save_kwargs)
+        vla.close()
+    for idx, fingerprint in duplicates.items():
+        episode_stats = cache.get(fingerprint, *cache_key)
+        if episode_stats is None:
+            # the run of the same scene earlier in this loop failed
+            print(f"Scenario {idx} has no cached result")
+        elif claim(manifest, [idx]):
+            save_result(result_dir, None, idx, None, [], episode_stats, **save_kwargs)
+    if writer is not None:
+        writer.close()
@@ -13,6 +13,8 @@ import json
 import os
 from PIL import Image
 import shutil
+from experiments.manifest import ResumeManifest, dump_json_atomic
+from experiments.scenario_dataset import find_dataset, open_dataset
 from experiments.random_camera import RandomCamera
 
 # Setup paths
@@ -62,6 +64,7 @@ if __name__ == '__main__':
         result_dir = str(PACKAGE_DIR) + "/../results/" + f"random_camera_{camera_random_seed}"
 
     os.makedirs(result_dir, exist_ok=True)
+    manifest = ResumeManifest(result_dir).load()
 
     if args.image_output:
         image_dir = args.image_output + f"random_camera_{camera_random_seed}"
@@ -78,7 +81,7 @@ if __name__ == '__main__':
 
         camera[dataset_name] = {}
 
-        data_path = str(PACKAGE_DIR) + f"/../data/{dataset_name}.json"
+        data_path = find_dataset(str(PACKAGE_DIR) + "/../data", dataset_name)
 
         for model_name in dataset[dataset_name].keys():
 
@@ -90,8 +93,7 @@ if __name__ == '__main__':
 
             valid_tasks = dataset[dataset_name][model_name]
 
-            with open(data_path, 'r') as f:
-                tasks = json.load(f)
+            tasks = open_dataset(data_path)
 
             for idx in range(tasks["num"]):
                 if idx in valid_tasks:
@@ -102,7 +104,7 @@ if __name__ == '__main__':
 
         if args.task in dataset_name:
 
-            data_path = str(PACKAGE_DIR) + f"/../data/{dataset_name}.json"
+            data_path = find_dataset(str(PACKAGE_DIR) + "/../data", dataset_name)
 
             for model_name in dataset[dataset_name].keys():
 
@@ -124,8 +126,7 @@ if __name__ == '__main__':
                     else:
                         raise NotImplementedError
 
-                    with open(data_path, 'r') as f:
-                        tasks = json.load(f)
+                    tasks = open_dataset(data_path)
 
                     for idx in tqdm(valid_tasks):
                         for sample in range(args.samples):
@@ -134,12 +135,14 @@ if __name__ == '__main__':
                             options = tasks[str(idx)]
                             options.update(camera_options)
 
-                            if args.resume and os.path.exists(result_dir + f"/{dataset_name}_{model_name}_{idx}_{sample}/" + '/log.json'):  # if resume allowed then skip the finished runs.
+                            key = f"{dataset_name}_{model_name}_{idx}_{sample}"
+                            if args.resume and manifest.is_done(key):  # if resume allowed then skip the finished runs.
+                                continue
+                            if not manifest.claim(key):  # running in another fuzzer process
                                 continue
                             images, episode_stats = vla.run_interface(seed=random_seed, options=options)
                             os.makedirs(result_dir + f"/{dataset_name}_{model_name}_{idx}_{sample}", exist_ok=True)
-                            with open(result_dir + f"/{dataset_name}_{model_name}_{idx}_{sample}/" + '/log.json', "w") as f:
-                                json.dump(episode_stats, f, cls=StableJSONizer)
+                            dump_json_atomic(episode_stats, result_dir + f"/{key}/log.json", cls=StableJSONizer)
                             if image_dir:
                                 os.makedirs(image_dir + f"/{dataset_name}_{model_name}_{idx}_{sample}", exist_ok=True)
                                 for img_idx in range(len(images)):
@@ -147,3 +150,4 @@ if __name__ == '__main__':
                                     im.save(image_dir + f"/{dataset_name}_{model_name}_{idx}_{sample}/" + f'{img_idx}.jpg')
                             with open(result_dir + f"/{dataset_name}_{model_name}_{idx}_{sample}/" + '/options.json', "w") as f:
                                 json.dump(options, f, cls=StableJSONizer)
+                            manifest.mark_done(key)
@@ -13,6 +13,9 @@ import json
 import os
 from PIL import Image
 import shutil
+from experiments.manifest import ResumeManifest, dump_json_atomic
+from experiments.scenario_dataset import open_dataset
+from mani_skill2_real2sim.utils.object_names import clean_object_name
 
 # Setup paths
 PACKAGE_DIR = Path(__file__).parent.resolve()
@@ -69,29 +72,15 @@ templates = {
 }
 
 
-def _get_instruction_obj_name(s):
-    # given an object name, process its name to be used for language instruction
-    s = s.split('_')
-    rm_list = ['opened', 'light', 'generated', 'modified', 'objaverse', 'bridge', 'baked', 'v2']
-    cleaned = []
-    for w in s:
-        if w[-2:] == "cm":
-            # object size in object name
-            continue
-        if w not in rm_list:
-            cleaned.append(w)
-    return ' '.join(cleaned)
-
-
 def mutate_instruction(task, options):
     if task == 'grasp':
-        return np.random.choice(templates[task]).replace("[OBJECT]", _get_instruction_obj_name(options["model_id"]))
+        return np.random.choice(templates[task]).replace("[OBJECT]", clean_object_name(options["model_id"]))
     elif task == 'move':
-        return np.random.choice(templates[task]).replace("[OBJECT A]", _get_instruction_obj_name(options["model_ids"][options["source_obj_id"]])).replace("[OBJECT B]", _get_instruction_obj_name(options["model_ids"][options["target_obj_id"]]))
+        return np.random.choice(templates[task]).replace("[OBJECT A]", clean_object_name(options["model_ids"][options["source_obj_id"]])).replace("[OBJECT B]", clean_object_name(options["model_ids"][options["target_obj_id"]]))
     elif task == 'put-on':
-        return np.random.choice(templates[task]).replace("[OBJECT A]", _get_instruction_obj_name(options["model_ids"][0])).replace("[OBJECT B]", _get_instruction_obj_name(options["model_ids"][1]))
+        return np.random.choice(templates[task]).replace("[OBJECT A]", clean_object_name(options["model_ids"][0])).replace("[OBJECT B]", clean_object_name(options["model_ids"][1]))
     elif task == 'put-in':
-        return np.random.choice(templates[task]).replace("[OBJECT]", _get_instruction_obj_name(options["model_ids"][0]))
+        return np.random.choice(templates[task]).replace("[OBJECT]", clean_object_name(options["model_ids"][0]))
     else:
         raise NotImplementedError
 
@@ -114,6 +103,14 @@ if __name__ == '__main__':
                         default="rt_1_x",
                         help="VLA model")
     parser.add_argument('-r', '--resume', type=bool, default=True, help="Resume from where we left.")
+    parser.add_argument('-re', '--reuse_env', type=bool, default=False,
+                        help="Build the simulation environment once and reuse it across scenarios.")
+    parser.add_argument('-es', '--early_stop', type=bool, default=False,
+                        help="Stop an episode as soon as its final success can no longer change.")
+    parser.add_argument('-ps', '--policy_server', type=str, default=None,
+                        help="Unix socket of a running policy_server.py to use instead of loading the model here.")
+    parser.add_argument('-sc', '--settle_cache', type=str, default=None,
+                        help="Directory to cache the settled initial scenes in, shared by the runs of all models.")
 
     args = parser.parse_args()
 
@@ -123,37 +120,39 @@ if __name__ == '__main__':
 
     dataset_name = data_path.split('/')[-1]
 
+    vla_kwargs = dict(reuse_env=args.reuse_env, stop_on_decided_outcome=args.early_stop,
+                      policy_server=args.policy_server, settle_cache_dir=args.settle_cache)
+
     task_name = None
 
     if "grasp" in dataset_name:
         task_name = "grasp"
         if 'ycb' in dataset_name:
-            vla = VLAInterfaceLM(model_name=args.model, task="google_robot_pick_customizable_ycb")
+            vla = VLAInterfaceLM(model_name=args.model, task="google_robot_pick_customizable_ycb", **vla_kwargs)
         else:
-            vla = VLAInterfaceLM(model_name=args.model, task="google_robot_pick_customizable")
+            vla = VLAInterfaceLM(model_name=args.model, task="google_robot_pick_customizable", **vla_kwargs)
     elif "move" in dataset_name:
         task_name = "move"
         if 'ycb' in dataset_name:
-            vla = VLAInterfaceLM(model_name=args.model, task="google_robot_move_near_customizable_ycb")
+            vla = VLAInterfaceLM(model_name=args.model, task="google_robot_move_near_customizable_ycb", **vla_kwargs)
         else:
-            vla = VLAInterfaceLM(model_name=args.model, task="google_robot_move_near_customizable")
+            vla = VLAInterfaceLM(model_name=args.model, task="google_robot_move_near_customizable", **vla_kwargs)
     elif "put-on" in dataset_name:
         task_name = "put-on"
         if 'ycb' in dataset_name:
-            vla = VLAInterfaceLM(model_name=args.model, task="widowx_put_on_customizable_ycb")
+            vla = VLAInterfaceLM(model_name=args.model, task="widowx_put_on_customizable_ycb", **vla_kwargs)
         else:
-            vla = VLAInterfaceLM(model_name=args.model, task="widowx_put_on_customizable")
+            vla = VLAInterfaceLM(model_name=args.model, task="widowx_put_on_customizable", **vla_kwargs)
     elif "put-in" in dataset_name:
         task_name = "put-in"
         if 'ycb' in dataset_name:
-            vla = VLAInterfaceLM(model_name=args.model, task="widowx_put_in_customizable_ycb")
+            vla = VLAInterfaceLM(model_name=args.model, task="widowx_put_in_customizable_ycb", **vla_kwargs)
         else:
-            vla = VLAInterfaceLM(model_name=args.model, task="widowx_put_in_customizable")
+            vla = VLAInterfaceLM(model_name=args.model, task="widowx_put_in_customizable", **vla_kwargs)
     else:
         raise NotImplementedError
 
-    with open(data_path, 'r') as f:
-        tasks = json.load(f)
+    tasks = open_dataset(data_path)
 
     if args.output:
         result_dir = args.output + data_path.split('/')[-1].split(".")[0]
@@ -176,16 +175,19 @@ if __name__ == '__main__':
     else:
         image_dir = None
 
+    manifest = ResumeManifest(result_dir).load()
+
     for idx in tqdm(range(tasks["num"])):
-        if args.resume and os.path.exists(result_dir + f"/{idx}/" + '/log.json'):  # if resume allowed then skip the finished runs.
+        if args.resume and manifest.is_done(idx):  # if resume allowed then skip the finished runs.
+            continue
+        if not manifest.claim(idx):  # running in another fuzzer process
             continue
         options = tasks[str(idx)]
         options['task_instruction'] = mutate_instruction(task_name, options)
         print(options["task_instruction"])
         images, episode_stats = vla.run_interface(seed=random_seed, options=options, instruction=options["task_instruction"])
         os.makedirs(result_dir + f"/{idx}", exist_ok=True)
-        with open(result_dir + f"/{idx}/" + '/log.json', "w") as f:
-            json.dump(episode_stats, f, cls=StableJSONizer)
+        dump_json_atomic(episode_stats, result_dir + f"/{idx}/log.json", cls=StableJSONizer)
         with open(result_dir + f"/{idx}/" + '/options.json', "w") as f:
             json.dump(options, f, cls=StableJSONizer)
         if image_dir:
@@ -193,3 +195,5 @@ if __name__ == '__main__':
             for img_idx in range(len(images)):
                 im = Image.fromarray(images[img_idx])
                 im.save(image_dir + f"/{idx}/" + f'{img_idx}.jpg')
+        manifest.mark_done(idx)
+    vla.close()
@@ -13,6 +13,8 @@ import json
 import os
 from PIL import Image
 import shutil
+from experiments.manifest import ResumeManifest, dump_json_atomic
+from experiments.scenario_dataset import find_dataset, open_dataset
 from experiments.random_lighting import RandomLighting
 
 # Setup paths
@@ -54,6 +56,7 @@ if __name__ == '__main__':
         result_dir = str(PACKAGE_DIR) + "/../results/" + f"random_lighting_{lighting_random_seed}"
 
     os.makedirs(result_dir, exist_ok=True)
+    manifest = ResumeManifest(result_dir).load()
 
     if args.image_output:
         image_dir = args.image_output + f"random_lighting_{lighting_random_seed}"
@@ -70,7 +73,7 @@ if __name__ == '__main__':
 
         lighting[dataset_name] = {}
 
-        data_path = str(PACKAGE_DIR) + f"/../data/{dataset_name}.json"
+        data_path = find_dataset(str(PACKAGE_DIR) + "/../data", dataset_name)
 
         for model_name in dataset[dataset_name].keys():
 
@@ -82,8 +85,7 @@ if __name__ == '__main__':
 
             valid_tasks = dataset[dataset_name][model_name]
 
-            with open(data_path, 'r') as f:
-                tasks = json.load(f)
+            tasks = open_dataset(data_path)
 
             for idx in range(tasks["num"]):
                 if idx in valid_tasks:
@@ -94,7 +96,7 @@ if __name__ == '__main__':
 
         if args.task in dataset_name:
 
-            data_path = str(PACKAGE_DIR) + f"/../data/{dataset_name}.json"
+            data_path = find_dataset(str(PACKAGE_DIR) + "/../data", dataset_name)
 
             for model_name in dataset[dataset_name].keys():
 
@@ -122,8 +124,7 @@ if __name__ == '__main__':
                     else:
                         raise NotImplementedError
 
-                    with open(data_path, 'r') as f:
-                        tasks = json.load(f)
+                    tasks = open_dataset(data_path)
 
                     for idx in tqdm(valid_tasks):
                         for sample in range(args.samples):
@@ -132,12 +133,14 @@ if __name__ == '__main__':
                             options = tasks[str(idx)]
                             options.update(lighting_options)
 
-                            if args.resume and os.path.exists(result_dir + f"/{dataset_name}_{model_name}_{idx}_{sample}/" + '/log.json'):  # if resume allowed then skip the finished runs.
+                            key = f"{dataset_name}_{model_name}_{idx}_{sample}"
+                            if args.resume and manifest.is_done(key):  # if resume allowed then skip the finished runs.
+                                continue
+                            if not manifest.claim(key):  # running in another fuzzer process
                                 continue
                             images, episode_stats = vla.run_interface(seed=random_seed, options=options)
                             os.makedirs(result_dir + f"/{dataset_name}_{model_name}_{idx}_{sample}", exist_ok=True)
-                            with open(result_dir + f"/{dataset_name}_{model_name}_{idx}_{sample}/" + '/log.json', "w") as f:
-                                json.dump(episode_stats, f, cls=StableJSONizer)
+                            dump_json_atomic(episode_stats, result_dir + f"/{key}/log.json", cls=StableJSONizer)
                             if image_dir:
                                 os.makedirs(image_dir + f"/{dataset_name}_{model_name}_{idx}_{sample}", exist_ok=True)
                                 for img_idx in range(len(images)):
@@ -145,3 +148,4 @@ if __name__ == '__main__':
                                     im.save(image_dir + f"/{dataset_name}_{model_name}_{idx}_{sample}/" + f'{img_idx}.jpg')
                             with open(result_dir + f"/{dataset_name}_{model_name}_{idx}_{sample}/" + '/options.json', "w") as f:
                                 json.dump(options, f, cls=StableJSONizer)
+                            manifest.mark_done(key)
@@ -0,0 +1,129 @@
+"""Streaming JSONL scenario datasets with an offset index."""
+import json
+import os
+
+import numpy as np
+
+INDEX_SUFFIX = ".idx.npy"
+
+
+def _save_index(path, offsets):
+    with open(path + INDEX_SUFFIX + ".tmp", "wb") as f:
+        np.save(f, np.asarray(offsets, dtype=np.uint64))
+    os.replace(path + INDEX_SUFFIX + ".tmp", path + INDEX_SUFFIX)
+
+
+class ScenarioWriter:
+    """Write a scenario dataset as JSON lines: a header line (e.g., seed and num), then one scenario per line.
+
+    The byte offset of every line is kept and saved next to the dataset as {path}.idx.npy when the writer is closed,
+    so readers can seek to any scenario without parsing the ones before it. The dataset is written to a temporary file
+    and only moved to path on close.
+    """
+
+    def __init__(self, path, header):
+        self.path = path
+        self.f = open(path + ".tmp", "wb")
+        self.f.write(json.dumps(header).encode() + b"\n")
+        self.offsets = [self.f.tell()]
+
+    def write(self, options):
+        self.f.write(json.dumps(options).encode() + b"\n")
+        self.offsets.append(self.f.tell())
+
+    def close(self):
+        self.f.close()
+        _save_index(self.path, self.offsets)
+        os.replace(self.path + ".tmp", self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ScenarioDataset:
+    """Random access to a dataset written by ScenarioWriter.
+
+    Indexing mirrors the dict of a .json dataset: dataset[str(idx)] (or dataset[idx]) parses and returns the options of
+    one scenario, and any other key (e.g., "num", "seed") is looked up in the header. The offset index is memory-mapped,
+    so opening a dataset and reading a shard of it costs only the lines of that shard. A missing index is rebuilt with
+    one scan over the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path + INDEX_SUFFIX) or os.path.getmtime(path + INDEX_SUFFIX) < os.path.getmtime(path):
+            self._build_index()
+        self.offsets = np.load(path + INDEX_SUFFIX, mmap_mode="r")
+        self.f = open(path, "rb")
+        self.header = json.loads(self.f.readline())
+
+    def _build_index(self):
+        offsets = []
+        with open(self.path, "rb") as f:
+            f.readline()
+            offsets.append(f.tell())
+            for _ in f:
+                offsets.append(f.tell())
+        _save_index(self.path, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, str) and not key.isdigit():
+            return self.header[key]
+        idx = int(key)
+        if not 0 <= idx < len(self):
+            raise KeyError(key)
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        self.f.seek(start)
+        return json.loads(self.f.read(end - start))
+
+    def __contains__(self, key):
+        if isinstance(key, str) and not key.isdigit():
+            return key in self.header
+        return 0 <= int(key) < len(self)
+
+    def close(self):
+        self.f.close()
+
+    def __getstate__(self):
+        # the file handle is reopened by whoever unpickles the dataset (e.g., a worker process)
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+def open_dataset(path):
+    """Open a scenario dataset: a .jsonl file written by ScenarioWriter, or a monolithic .json dict."""
+    if path.endswith(".jsonl"):
+        return ScenarioDataset(path)
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def find_dataset(data_dir, dataset_name):
+    """Path of a named dataset in data_dir, preferring the .jsonl version if both exist."""
+    path = os.path.join(data_dir, dataset_name + ".jsonl")
+    return path if os.path.exists(path) else os.path.join(data_dir, dataset_name + ".json")
+
+
+def parse_shard(shard):
+    """Parse a "{shard_id}/{num_shards}" command-line value."""
+    shard_id, num_shards = (int(v) for v in shard.split("/"))
+    if not 0 <= shard_id < num_shards:
+        raise ValueError(shard)
+    return shard_id, num_shards
+
+
+def scenario_rng(seed, idx):
+    """np.random.Generator of scenario idx of a dataset generated with seed.
+
+    The generator is seeded by the idx-th child of np.random.SeedSequence(seed) (the same as SeedSequence(seed).spawn),
+    so every scenario has its own independent stream and can be regenerated without drawing the scenarios before it.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(idx,)))
@@ -0,0 +1,103 @@
+"""Content fingerprints of scenarios, to deduplicate episodes across runs."""
+import argparse
+import hashlib
+import json
+from collections import defaultdict
+
+import numpy as np
+
+from experiments.scenario_dataset import open_dataset
+
+# Bump whenever the simulation or the evaluation of episodes changes, so results cached before are not reused
+ENV_VERSION = 1
+
+# keys of a scenario that describe its objects; everything else (e.g., lighting_cfgs, camera_cfgs) is kept as is
+OBJECT_KEYS = ("model_id", "model_ids", "obj_init_options", "distractor_model_ids", "distractor_obj_init_options",
+               "source_obj_id", "target_obj_id")
+
+
+def _round(values, decimals):
+    # adding 0.0 turns -0.0 into 0.0, so both round to the same fingerprint
+    return (np.round(np.asarray(values, dtype=np.float64), decimals) + 0.0).tolist()
+
+
+def _canonical_pose(init_options, decimals, quat_decimals):
+    pose = {}
+    if init_options.get("init_xy") is not None:
+        pose["xy"] = _round(init_options["init_xy"], decimals)
+    orientation = init_options.get("init_rot_quat", init_options.get("orientation"))
+    if isinstance(orientation, str):
+        pose["orientation"] = orientation
+    elif orientation is not None:
+        quat = np.asarray(orientation, dtype=np.float64)
+        # q and -q are the same rotation
+        leading = np.nonzero(np.round(quat, quat_decimals))[0]
+        if len(leading) and quat[leading[0]] < 0:
+            quat = -quat
+        pose["quat"] = _round(quat, quat_decimals)
+    for k, v in init_options.items():
+        if k not in ("init_xy", "init_rot_quat", "orientation"):
+            pose[k] = v
+    return pose
+
+
+def canonical_scenario(options, decimals=3, quat_decimals=3):
+    """Order-independent form of a scenario: the objects the task is about by role, the other objects sorted.
+
+    Positions are rounded to decimals (1 mm by default) and quaternions to quat_decimals with a non-negative leading
+    component, so scenarios that differ only in float noise, in the order of their distractors, or in the sign of a
+    quaternion are the same.
+    """
+    if "model_id" in options:
+        roles = {"target": (options["model_id"], options.get("obj_init_options", {}))}
+        init_options = options.get("distractor_obj_init_options", {})
+        objects = [(model_id, init_options.get(model_id, {})) for model_id in options.get("distractor_model_ids", [])]
+    else:
+        model_ids = options.get("model_ids", [])
+        init_options = options.get("obj_init_options", {})
+        special = {"source": options.get("source_obj_id"), "target": options.get("target_obj_id")}
+        roles = {role: (model_ids[i], init_options.get(model_ids[i], {}))
+                 for role, i in special.items() if i is not None}
+        objects = [(model_id, init_options.get(model_id, {})) for i, model_id in enumerate(model_ids)
+                   if i not in special.values()]
+    canonical = {role: [model_id, _canonical_pose(init, decimals, quat_decimals)]
+                 for role, (model_id, init) in roles.items()}
+    canonical["others"] = sorted(([model_id, _canonical_pose(init, decimals, quat_decimals)]
+                                  for model_id, init in objects), key=lambda v: json.dumps(v, sort_keys=True))
+    canonical.update({k: v for k, v in options.items() if k not in OBJECT_KEYS})
+    return canonical
+
+
+def scenario_fingerprint(options, decimals=3, quat_decimals=3):
+    """sha256 of the canonical form of a scenario."""
+    data = json.dumps(canonical_scenario(options, decimals, quat_decimals), sort_keys=True, separators=(",", ":"),
+                      default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def dataset_fingerprints(path):
+    """{fingerprint: [idx, ...]} of every scenario of a dataset."""
+    tasks = open_dataset(path)
+    fingerprints = defaultdict(list)
+    for idx in range(tasks["num"]):
+        fingerprints[scenario_fingerprint(tasks[str(idx)])].append(idx)
+    return fingerprints
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="Scenario Fingerprints")
+    parser.add_argument('-d', '--data', type=str, nargs='+', required=True, help="Datasets to compare")
+
+    args = parser.parse_args()
+
+    seen = set()
+    total = 0
+    for path in args.data:
+        fingerprints = dataset_fingerprints(path)
+        num = sum(len(v) for v in fingerprints.values())
+        overlap = sum(len(v) for fp, v in fingerprints.items() if fp in seen)
+        print(f"{path.split('/')[-1]}: {num} scenarios, {len(fingerprints)} distinct, "
+              f"{overlap} already in an earlier dataset")
+        seen.update(fingerprints)
+        total += num
+    print(f"{len(seen)} distinct scenarios out of {total}")
@@ -0,0 +1,127 @@
+"""Bounding-box pre-check that filters out infeasible scenes."""
+import numpy as np
+
+from experiments.object_catalog import load_catalog
+
+# model_db each task's environment builds its objects from, (task, ycb) -> catalog
+TASK_CATALOGS = {
+    ("grasp", False): "custom",
+    ("move", False): "custom",
+    ("put-on", False): "bridge",
+    ("put-in", False): "bridge",
+    ("grasp", True): "ycb",
+    ("move", True): "ycb",
+    ("put-on", True): "ycb_put",
+    ("put-in", True): "ycb_put",
+}
+
+
+def quat_to_matrix(q):
+    """Rotation matrices of wxyz quaternions of shape (..., 4)."""
+    q = q / np.maximum(np.linalg.norm(q, axis=-1, keepdims=True), 1e-12)
+    w, x, y, z = np.moveaxis(q, -1, 0)
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)], axis=-1),
+        np.stack([2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)], axis=-1),
+        np.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], axis=-1),
+    ], axis=-2)
+
+
+def scene_objects(options):
+    """(model_id, init_xy, init_rot_quat) of every placed object of a scenario, in either dataset layout."""
+    objects = []
+    if "model_id" in options:
+        init_options = options.get("obj_init_options", {})
+        objects.append((options["model_id"], init_options.get("init_xy"),
+                        init_options.get("init_rot_quat", init_options.get("orientation"))))
+        init_options = options.get("distractor_obj_init_options", {})
+        for model_id in options.get("distractor_model_ids", []):
+            objects.append((model_id, init_options.get(model_id, {}).get("init_xy"),
+                            init_options.get(model_id, {}).get("init_rot_quat")))
+    else:
+        init_options = options.get("obj_init_options", {})
+        for model_id in options.get("model_ids", []):
+            objects.append((model_id, init_options.get(model_id, {}).get("init_xy"),
+                            init_options.get(model_id, {}).get("init_rot_quat")))
+    return objects
+
+
+class SceneFeasibility:
+    """Physics-free check of generated scenarios against the model bounding boxes, before any simulator is started.
+
+    Every object's bbox (scaled by its largest scale in the model_db, posed by init_xy/init_rot_quat) is projected onto
+    the table, which gives a centrally symmetric hexagon spanned by the three projected half-axes. Two objects overlap
+    if no edge normal of either hexagon separates them by more than min_gap (separating axis theorem), and an object is
+    out of reach if its projection leaves safe_range (the range object centers are drawn from) widened by margin.
+    Support surfaces (objects lower than flat_height after rotation, e.g., plates, cloths and the sink target plane) may
+    carry other objects and are not checked. Objects without a bbox in the catalog are ignored. All scenarios of a batch
+    are checked at once.
+    """
+
+    def __init__(self, catalog, safe_range, margin=0.1, min_gap=0.0, flat_height=0.03):
+        self.catalog = load_catalog(catalog) if isinstance(catalog, str) else catalog
+        self.bounds = np.array(safe_range, dtype=np.float64).T + [[-margin], [margin]]  # rows: low, high
+        self.min_gap = min_gap
+        self.flat_height = flat_height
+        self.bbox_min = np.array([np.array(v["bbox"]["min"]) * max(v.get("scales", [1.0])) if "bbox" in v
+                                  else np.zeros(3) for v in self.catalog.info.values()])
+        self.bbox_max = np.array([np.array(v["bbox"]["max"]) * max(v.get("scales", [1.0])) if "bbox" in v
+                                  else np.zeros(3) for v in self.catalog.info.values()])
+        self.has_bbox = np.array(["bbox" in v for v in self.catalog.info.values()])
+
+    def _gather(self, options_list):
+        scenes = [scene_objects(options) for options in options_list]
+        num, k = len(scenes), max((len(objects) for objects in scenes), default=0)
+        idx = np.zeros((num, k), dtype=np.int64)
+        valid = np.zeros((num, k), dtype=bool)
+        xy = np.zeros((num, k, 2))
+        quat = np.tile([1.0, 0.0, 0.0, 0.0], (num, k, 1))
+        for i, objects in enumerate(scenes):
+            for j, (model_id, init_xy, init_rot_quat) in enumerate(objects):
+                if model_id not in self.catalog.index or init_xy is None:
+                    continue
+                idx[i, j] = self.catalog.index[model_id]
+                valid[i, j] = self.has_bbox[idx[i, j]]
+                xy[i, j] = init_xy
+                if init_rot_quat is not None and not isinstance(init_rot_quat, str):
+                    quat[i, j] = init_rot_quat
+        return idx, valid, xy, quat
+
+    def check(self, options_list):
+        """Return (feasible, reasons): a bool array, and per scenario None or a short description of the problem."""
+        idx, valid, xy, quat = self._gather(options_list)
+        num, k = idx.shape
+        feasible = np.ones(num, dtype=bool)
+        reasons = [None] * num
+        if k == 0:
+            return feasible, reasons
+        rot = quat_to_matrix(quat)  # (num, k, 3, 3)
+        half = (self.bbox_max[idx] - self.bbox_min[idx]) / 2
+        offset = np.einsum("nkij,nkj->nki", rot, (self.bbox_max[idx] + self.bbox_min[idx]) / 2)
+        center = xy + offset[..., :2]
+        gens = rot[..., :2, :] * half[..., None, :]  # (num, k, 2, 3), column i is the projected half-axis i
+        height = 2 * np.einsum("nki,nki->nk", np.abs(rot[..., 2, :]), half)
+        checked = valid & (height >= self.flat_height)
+
+        # reach: the axis-aligned extent of each footprint has to stay inside the widened safe range
+        reach = np.abs(gens).sum(axis=-1)  # (num, k, 2)
+        out = ((center - reach < self.bounds[0]) | (center + reach > self.bounds[1])).any(axis=-1) & checked
+
+        # overlap: separating axis test over the edge normals of both hexagons
+        a, b = np.triu_indices(k, 1)
+        normals = np.stack([-gens[..., 1, :], gens[..., 0, :]], axis=-1)  # (num, k, 3, 2)
+        normals /= np.maximum(np.linalg.norm(normals, axis=-1, keepdims=True), 1e-12)
+        axes = np.concatenate([normals[:, a], normals[:, b]], axis=2)  # (num, pairs, 6, 2)
+        radius_a = np.abs(np.einsum("npxc,npcg->npxg", axes, gens[:, a])).sum(axis=-1)
+        radius_b = np.abs(np.einsum("npxc,npcg->npxg", axes, gens[:, b])).sum(axis=-1)
+        distance = np.abs(np.einsum("npxc,npc->npx", axes, center[:, b] - center[:, a]))
+        separated = (distance - radius_a - radius_b > self.min_gap).any(axis=-1)
+        overlap = ~separated & checked[:, a] & checked[:, b]
+
+        names = self.catalog.names
+        for i in np.nonzero(out.any(axis=1) | overlap.any(axis=1))[0]:
+            feasible[i] = False
+            problems = [f"{names[idx[i, j]]} out of reach" for j in np.nonzero(out[i])[0]]
+            problems += [f"{names[idx[i, a[p]]]} overlaps {names[idx[i, b[p]]]}" for p in np.nonzero(overlap[i])[0]]
+            reasons[i] = ", ".join(problems)
+        return feasible, reasons
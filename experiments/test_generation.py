@@ -5,23 +5,100 @@ Time   : 8/7/24
 """
 
 import json
+import multiprocessing as mp
+import re
 from pathlib import Path
 import numpy as np
 from transforms3d.euler import euler2quat
 import argparse
+from functools import partial
 from tqdm import tqdm
 from scipy.spatial import KDTree
+from experiments.object_catalog import GroupSampler, ObjectCatalog, load_catalog
+from experiments.scenario_dataset import ScenarioWriter, scenario_rng
+from experiments.scene_feasibility import TASK_CATALOGS, SceneFeasibility
+from mani_skill2_real2sim.utils.object_names import clean_object_name
 
 # Setup paths
 PACKAGE_DIR = Path(__file__).parent.resolve()
 
 
+class InfeasiblePlacementError(ValueError):
+    pass
+
+
+class PlacementSampler:
+    """Place object positions uniformly in safe_range, each at least min_dist away from all earlier ones.
+
+    Placed positions are bucketed in a grid of min_dist-sized cells, so checking a candidate only looks at the 3x3 cells
+    around it instead of every earlier position. A candidate is first rejection-sampled with np.random.uniform (the
+    draws of the original while-loop, so seeded datasets are unchanged); after max_tries misses, the free space is
+    enumerated on a jittered lattice of min_dist / 4 spacing with a KDTree of the placed positions and one free spot is
+    picked at random. If there is none, InfeasiblePlacementError is raised instead of looping forever.
+    """
+
+    def __init__(self, safe_range, min_dist, max_tries=1000):
+        self.safe_range = safe_range
+        self.min_dist = min_dist
+        self.max_tries = max_tries
+        self.grid = {}
+        self.positions = []
+
+    def reset(self):
+        self.grid = {}
+        self.positions = []
+
+    def _cell(self, pos):
+        return int(np.floor(pos[0] / self.min_dist)), int(np.floor(pos[1] / self.min_dist))
+
+    def is_free(self, pos):
+        if self.min_dist <= 0:
+            return True
+        cx, cy = self._cell(pos)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for other in self.grid.get((cx + dx, cy + dy), ()):
+                    if (pos[0] - other[0]) ** 2 + (pos[1] - other[1]) ** 2 < self.min_dist ** 2:
+                        return False
+        return True
+
+    def add(self, pos):
+        pos = (pos[0], pos[1])
+        self.positions.append(pos)
+        if self.min_dist > 0:
+            self.grid.setdefault(self._cell(pos), []).append(pos)
+
+    def _sample_free(self):
+        spacing = self.min_dist / 4
+        xs = np.arange(self.safe_range[0][0] + spacing / 2, self.safe_range[0][1], spacing)
+        ys = np.arange(self.safe_range[1][0] + spacing / 2, self.safe_range[1][1], spacing)
+        candidates = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+        candidates += np.random.uniform(-spacing / 2, spacing / 2, candidates.shape)
+        candidates = np.clip(candidates, [r[0] for r in self.safe_range], [r[1] for r in self.safe_range])
+        dist, _ = KDTree(self.positions).query(candidates)
+        free = candidates[dist >= self.min_dist]
+        if len(free) == 0:
+            raise InfeasiblePlacementError(f"No position in {self.safe_range} is {self.min_dist} away from the "
+                                           f"{len(self.positions)} objects already placed")
+        return free[np.random.randint(len(free))].tolist()
+
+    def sample(self):
+        for _ in range(self.max_tries):
+            pos_x, pos_y = np.random.uniform(*self.safe_range[0]), np.random.uniform(*self.safe_range[1])
+            if self.is_free([pos_x, pos_y]):
+                break
+        else:
+            pos_x, pos_y = self._sample_free()
+        self.add([pos_x, pos_y])
+        return pos_x, pos_y
+
+
 class RandomTesting:
     def __init__(self, object_list=None, safe_range=None, seed=None, max_obstacles=None, random_number_obstacles=True):
         if safe_range is None:
             safe_range = [(-0.5, -0.1), (0, 0.4)]
+        self.seed = seed
         if seed:
-            self.seed = seed
             np.random.seed(seed)
         if max_obstacles >= 0:
             self.max_obstacles = max_obstacles
@@ -30,39 +107,25 @@ class RandomTesting:
         self.random_number_obstacles = random_number_obstacles
         if object_list:
             if object_list == 'ycb':
-                with open(str(PACKAGE_DIR) + '/../ManiSkill2_real2sim/data/ycb-dataset/info_ycb.json', 'r') as f:
-                    self.object_list = list(json.load(f).keys())
+                self.catalog = load_catalog("ycb")
             else:
-                self.object_list = list(json.load(object_list).keys())
+                self.catalog = ObjectCatalog(json.load(object_list))
         else:
-            with open(str(PACKAGE_DIR) + '/../ManiSkill2_real2sim/data/custom/info_pick_custom_v0.json', 'r') as f:
-                self.object_list = list(json.load(f).keys())
-        self.object_queue = self.object_list.copy()
+            self.catalog = load_catalog("custom")
+        self.object_list = list(self.catalog.names)
+        self.object_queue = GroupSampler(self.catalog)
         self.safe_rage = safe_range
 
     @staticmethod
     def _get_instruction_obj_name(s):
         # given an object name, process its name to be used for language instruction
-        s = s.split('_')
-        rm_list = ['opened', 'light', 'generated', 'modified', 'objaverse', 'bridge', 'baked', 'v2']
-        cleaned = []
-        for w in s:
-            if w[-2:] == "cm":
-                # object size in object name
-                continue
-            if w not in rm_list:
-                cleaned.append(w)
-        return ' '.join(cleaned)
+        return clean_object_name(s)
 
     def reset(self):
-        self.object_queue = self.object_list.copy()
+        self.object_queue.reset()
 
     def query(self):
-        obj = np.random.choice(self.object_queue)
-        obj_to_remove = [v for v in self.object_queue if
-                         self._get_instruction_obj_name(v) == self._get_instruction_obj_name(obj)]
-        for candidate in obj_to_remove:
-            self.object_queue.remove(candidate)
+        obj = self.object_queue.draw()
         pos_x, pos_y = np.random.uniform(*self.safe_rage[0]), np.random.uniform(*self.safe_rage[1])
         orientation = np.random.choice(["standing", "horizontal"])
         if orientation == "horizontal":
@@ -83,6 +146,90 @@ class RandomTesting:
         self.reset()
         return commands
 
+    def generate_options_at(self, idx, feasibility=None, max_tries=1000):
+        """Scenario idx, drawn (as by generate_options_batch) from its own stream scenario_rng(seed, idx) only.
+
+        The scenario does not depend on any other one, so a dataset can be generated in any order, in parallel, or
+        scenario by scenario on demand. With a SceneFeasibility, infeasible scenarios are drawn again from the same
+        stream.
+        """
+        rng = scenario_rng(self.seed, idx)
+        for _ in range(max_tries):
+            options = self.generate_options_batch(1, rng)[0]
+            if feasibility is None or feasibility.check([options])[0][0]:
+                return options
+        raise InfeasiblePlacementError(f"No feasible scenario {idx} in {max_tries} tries")
+
+    # Batch generation: draws the scenarios of a whole batch at once as arrays from a np.random.Generator. The
+    # distribution matches the one-at-a-time generators, the random stream does not.
+
+    def _num_objects_batch(self, rng, num, low):
+        if self.random_number_obstacles:
+            return rng.integers(low, self.max_obstacles + low + 1, size=num)
+        return np.full(num, self.max_obstacles + low)
+
+    def _sample_objects_batch(self, rng, num, k, chunk_size=1 << 14):
+        """Draw k distinct-name objects per scenario, like k successive query() calls, shape (num, k)."""
+        # objects sharing an instruction name are never placed together, so objects are drawn as name groups
+        objects, sizes, starts = self.catalog.group_objects, self.catalog.group_sizes, self.catalog.group_starts
+        if k > len(sizes):
+            raise ValueError(f"Cannot place {k} objects with distinct names out of {len(sizes)}")
+        chosen = np.empty((num, k), dtype=np.int64)
+        for start in range(0, num, chunk_size):
+            n = min(chunk_size, num - start)
+            # picking an object uniformly and dropping its name group is sampling groups without replacement with
+            # probability proportional to their size, i.e., taking the k largest keys log(u) / size
+            keys = np.log(rng.random((n, len(sizes)))) / sizes
+            if k < len(sizes):
+                top = np.argpartition(-keys, k - 1, axis=1)[:, :k]
+            else:
+                top = np.tile(np.arange(len(sizes)), (n, 1))
+            order = np.argsort(-np.take_along_axis(keys, top, axis=1), axis=1)
+            chosen[start:start + n] = np.take_along_axis(top, order, axis=1)
+        return objects[starts[chosen] + rng.integers(0, sizes[chosen])]
+
+    @staticmethod
+    def _sample_orientations_batch(rng, shape):
+        """Quaternions (wxyz) of standing objects, or lying ones with a uniform yaw, with equal probability."""
+        standing = rng.random(shape) < 0.5
+        yaw = rng.uniform(-np.pi, np.pi, size=shape)
+        quats = np.zeros(shape + (4,))
+        quats[..., 0] = np.where(standing, np.cos(np.pi / 4), np.cos(yaw / 2))  # euler2quat(np.pi / 2, 0, 0)
+        quats[..., 1] = np.where(standing, np.sin(np.pi / 4), 0)
+        quats[..., 3] = np.where(standing, 0, np.sin(yaw / 2))  # euler2quat(0, 0, yaw)
+        return quats
+
+    def _sample_positions_batch(self, rng, num_objects, safe_dist=0, max_tries=100, max_restarts=100):
+        """Uniform positions in the safe range, shape (num, max(num_objects), 2), resampled where two of the first
+        num_objects of a scenario are closer than safe_dist.
+
+        Objects are placed one after another as in query(); a scenario whose next object finds no free spot within
+        max_tries draws its whole layout again (the one-by-one generators would retry forever).
+        """
+        low, high = [r[0] for r in self.safe_rage], [r[1] for r in self.safe_rage]
+        xy = rng.uniform(low, high, size=(len(num_objects), num_objects.max(), 2))
+        if safe_dist <= 0:
+            return xy
+        stuck = np.zeros(len(num_objects), dtype=bool)
+        for j in range(1, xy.shape[1]):
+            rows = np.nonzero((num_objects > j) & ~stuck)[0]
+            for _ in range(max_tries):
+                too_close = (np.linalg.norm(xy[rows, :j] - xy[rows, j:j + 1], axis=-1) < safe_dist).any(axis=1)
+                rows = rows[too_close]
+                if len(rows) == 0:
+                    break
+                xy[rows, j] = rng.uniform(low, high, size=(len(rows), 2))
+            else:
+                too_close = (np.linalg.norm(xy[rows, :j] - xy[rows, j:j + 1], axis=-1) < safe_dist).any(axis=1)
+                stuck[rows[too_close]] = True
+        if stuck.any():
+            if max_restarts == 0:
+                raise InfeasiblePlacementError(f"Could not place the objects of {stuck.sum()} scenarios "
+                                               f"{safe_dist} apart")
+            retry = self._sample_positions_batch(rng, num_objects[stuck], safe_dist, max_tries, max_restarts - 1)
+            xy[np.nonzero(stuck)[0], :retry.shape[1]] = retry
+        return xy
+
 
 class GraspSingleRandomTesting(RandomTesting):
     def __init__(self, **kwargs):
@@ -113,34 +260,38 @@ class GraspSingleRandomTesting(RandomTesting):
         self.reset()
         return options
 
+    def generate_options_batch(self, num, rng):
+        num_objects = self._num_objects_batch(rng, num, 1)
+        objs = self._sample_objects_batch(rng, num, num_objects.max()).tolist()
+        xy = self._sample_positions_batch(rng, num_objects).tolist()
+        quats = self._sample_orientations_batch(rng, (num, num_objects.max())).tolist()
+        batch = []
+        for i, n in enumerate(num_objects.tolist()):
+            options = {"model_id": objs[i][0], "obj_init_options": {"init_xy": xy[i][0], "orientation": quats[i][0]}}
+            if n > 1:
+                options["distractor_model_ids"] = objs[i][1:n]
+                options["distractor_obj_init_options"] = {obj: {"init_xy": xy[i][j], "init_rot_quat": quats[i][j]}
+                                                          for j, obj in enumerate(objs[i][:n]) if j > 0}
+            batch.append(options)
+        return batch
+
 
 class MoveNearRandomTesting(RandomTesting):
     def __init__(self, safe_dist=0.15, **kwargs):
         super().__init__(**kwargs)
-        self.omit_space = []
         self.safe_dist = safe_dist
+        self.placement = PlacementSampler(self.safe_rage, safe_dist)
 
     def _check_safe(self, new_pose):
-        for pose in self.omit_space:
-            if np.linalg.norm(np.array(pose) - np.array(new_pose)) < self.safe_dist:
-                return False
-        return True
+        return self.placement.is_free(new_pose)
 
     def reset(self):
-        self.object_queue = self.object_list.copy()
-        self.omit_space = []
+        self.object_queue.reset()
+        self.placement.reset()
 
     def query(self):
-        obj = np.random.choice(self.object_queue)
-        obj_to_remove = [v for v in self.object_queue if
-                         self._get_instruction_obj_name(v) == self._get_instruction_obj_name(obj)]
-        for candidate in obj_to_remove:
-            self.object_queue.remove(candidate)
-        while True:
-            pos_x, pos_y = np.random.uniform(*self.safe_rage[0]), np.random.uniform(*self.safe_rage[1])
-            if self._check_safe([pos_x, pos_y]):
-                break
-        self.omit_space.append([pos_x, pos_y])
+        obj = self.object_queue.draw()
+        pos_x, pos_y = self.placement.sample()
         orientation = np.random.choice(["standing", "horizontal"])
         if orientation == "horizontal":
             orientation = [v for v in euler2quat(0, 0, np.random.uniform(-np.pi, np.pi))]
@@ -171,6 +322,49 @@ class MoveNearRandomTesting(RandomTesting):
         self.reset()
         return options
 
+    def generate_options_batch(self, num, rng):
+        num_objects = self._num_objects_batch(rng, num, 2)
+        objs = self._sample_objects_batch(rng, num, num_objects.max()).tolist()
+        xy = self._sample_positions_batch(rng, num_objects, self.safe_dist).tolist()
+        quats = self._sample_orientations_batch(rng, (num, num_objects.max())).tolist()
+        # the first two entries of a random permutation of the objects
+        source = rng.integers(0, num_objects)
+        target = rng.integers(0, num_objects - 1)
+        target += target >= source
+        batch = []
+        for i, (n, s, t) in enumerate(zip(num_objects.tolist(), source.tolist(), target.tolist())):
+            batch.append({
+                "model_ids": objs[i][:n],
+                "obj_init_options": {obj: {"init_xy": xy[i][j], "init_rot_quat": quats[i][j]}
+                                     for j, obj in enumerate(objs[i][:n])},
+                "source_obj_id": s,
+                "target_obj_id": t,
+            })
+        return batch
+
+    def _generate_with_target_batch(self, num, rng, target_objs, target_xy=None):
+        # source object, then the target, then 0..max_obstacles distractors, as in PutOn/PutIn generate_options
+        num_distractors = self._num_objects_batch(rng, num, 0)
+        objs = self._sample_objects_batch(rng, num, num_distractors.max() + 1)
+        objs = np.insert(objs, 1, target_objs, axis=1).tolist()
+        xy = self._sample_positions_batch(rng, num_distractors + 2, self.safe_dist)
+        if target_xy is not None:
+            xy[:, 1] = target_xy
+        xy = xy.tolist()
+        quats = self._sample_orientations_batch(rng, (num, num_distractors.max() + 2))
+        quats[:, 1] = [1, 0, 0, 0]
+        quats = quats.tolist()
+        batch = []
+        for i, n in enumerate((num_distractors + 2).tolist()):
+            batch.append({
+                "model_ids": objs[i][:n],
+                "obj_init_options": {obj: {"init_xy": xy[i][j], "init_rot_quat": quats[i][j]}
+                                     for j, obj in enumerate(objs[i][:n])},
+                "source_obj_id": 0,
+                "target_obj_id": 1,
+            })
+        return batch
+
 
 class PutOnRandomTesting(MoveNearRandomTesting):
     def __init__(self, safe_dist=0.05, safe_range=None, target_list=None, **kwargs):
@@ -195,11 +389,7 @@ class PutOnRandomTesting(MoveNearRandomTesting):
         options["obj_init_options"][obj]["init_rot_quat"] = orientation
 
         # target obj
-        while True:
-            pos_x, pos_y = np.random.uniform(*self.safe_rage[0]), np.random.uniform(*self.safe_rage[1])
-            if self._check_safe([pos_x, pos_y]):
-                break
-        self.omit_space.append([pos_x, pos_y])
+        pos_x, pos_y = self.placement.sample()
         obj = np.random.choice(self.target_list)
         options["model_ids"].append(obj)
         options["obj_init_options"][obj] = {}
@@ -217,6 +407,9 @@ class PutOnRandomTesting(MoveNearRandomTesting):
         self.reset()
         return options
 
+    def generate_options_batch(self, num, rng):
+        return self._generate_with_target_batch(num, rng, rng.choice(self.target_list, size=num))
+
 
 class PutInRandomTesting(PutOnRandomTesting):
     def __init__(self, safe_dist=0, safe_range=None, **kwargs):
@@ -254,6 +447,76 @@ class PutInRandomTesting(PutOnRandomTesting):
         self.reset()
         return options
 
+    def generate_options_batch(self, num, rng):
+        # the sink target has a fixed place and is not kept apart from the other objects
+        return self._generate_with_target_batch(num, rng, "dummy_sink_target_plane", target_xy=[-0.125, 0.025])
+
+
+GENERATORS = {
+    "grasp": GraspSingleRandomTesting,
+    "move": MoveNearRandomTesting,
+    "put-on": PutOnRandomTesting,
+    "put-in": PutInRandomTesting,
+}
+
+STREAMS_NAME = re.compile(r"(ycb_)?t-(grasp|move|put-on|put-in)_n-(\d+)_o-(m?)(\d+)_s-(\d+)_ss(?:-f(\d+))?")
+
+
+def streams_dataset_name(task, num, obstacles, random_number_obstacles, seed, ycb=False, filter_margin=None):
+    """Name of a dataset generated from per-scenario streams; it holds everything needed to generate it again."""
+    name = ('ycb_' if ycb else '') + f"t-{task}_n-{num}_o-{'m' if random_number_obstacles else ''}{obstacles}"
+    name += f"_s-{seed}_ss"
+    if filter_margin is not None:
+        name += f"-f{round(filter_margin * 1000)}"  # mm
+    return name
+
+
+class GeneratedDataset:
+    """Scenarios of a per-scenario streams dataset, generated on demand instead of read from a file.
+
+    Indexing mirrors open_dataset: dataset[str(idx)] generates scenario idx with generate_options_at, and "num" and
+    "seed" are looked up in the header. Since every scenario has its own stream, a fuzzer (or each shard of it) can
+    generate exactly the scenarios it runs, and gets the same ones as the dataset file test_generation.py writes.
+    """
+
+    def __init__(self, fuzzer, num, feasibility=None):
+        self.fuzzer = fuzzer
+        self.feasibility = feasibility
+        self.header = dict(seed=fuzzer.seed, num=num)
+
+    @classmethod
+    def from_name(cls, name):
+        """The dataset of a name given by streams_dataset_name."""
+        match = STREAMS_NAME.fullmatch(name)
+        if match is None:
+            raise ValueError(f"{name} is not the name of a per-scenario streams dataset")
+        ycb, task, num, ro, obstacles, seed, margin = match.groups()
+        fuzzer = GENERATORS[task](seed=int(seed), max_obstacles=int(obstacles), random_number_obstacles=bool(ro),
+                                  object_list="ycb" if ycb else None)
+        feasibility = SceneFeasibility(TASK_CATALOGS[(task, bool(ycb))], fuzzer.safe_rage,
+                                       margin=int(margin) / 1000) if margin is not None else None
+        return cls(fuzzer, int(num), feasibility)
+
+    def __len__(self):
+        return self.header["num"]
+
+    def __getitem__(self, key):
+        if isinstance(key, str) and not key.isdigit():
+            return self.header[key]
+        idx = int(key)
+        if not 0 <= idx < len(self):
+            raise KeyError(key)
+        return self.fuzzer.generate_options_at(idx, self.feasibility)
+
+    def __contains__(self, key):
+        if isinstance(key, str) and not key.isdigit():
+            return key in self.header
+        return 0 <= int(key) < len(self)
+
+
+def _generate_at(dataset, idx):
+    return dataset[idx]
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog="VLA Fuzzing")
@@ -265,48 +528,104 @@ if __name__ == '__main__':
     parser.add_argument('--obstacles', type=int, default=3, help="Max number of obstacles")
     parser.add_argument('-o', '--output', type=str, help="Output path, e.g., folder")
     parser.add_argument('--ycb', type=bool, default=False, help="Use YCB dataset")
+    parser.add_argument('-b', '--batch_size', type=int, default=0,
+                        help="Generate scenarios in vectorized batches of this size from a np.random.Generator "
+                             "(same distribution, different scenarios than the default one-by-one generation)")
+    parser.add_argument('-f', '--format', type=str, choices=["json", "jsonl"], default="json",
+                        help="One JSON dict (json), or one scenario per line with a seek index (jsonl)")
+    parser.add_argument('--filter', type=bool, default=False,
+                        help="Regenerate scenarios whose objects overlap or leave the reachable area (bbox check)")
+    parser.add_argument('--filter_margin', type=float, default=0.1,
+                        help="How far (m) an object's footprint may reach beyond the safe range with --filter")
+    parser.add_argument('-ss', '--streams', type=bool, default=False,
+                        help="Draw every scenario from its own stream spawned from the seed (np.random.SeedSequence), "
+                             "so any scenario can be regenerated alone, e.g., by run_fuzzer.py --generate")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="Number of processes generating the scenarios (with --streams)")
 
     args = parser.parse_args()
 
+    if args.streams and args.nl:
+        parser.error("--streams generates options only")
+
     random_seed = args.seed if args.seed else np.random.randint(0, 4294967295)  # max uint32
 
-    if args.task == "grasp":
-        fuzzer = GraspSingleRandomTesting(seed=random_seed, max_obstacles=args.obstacles,
-                                          random_number_obstacles=args.ro, object_list="ycb" if args.ycb else None)
-    elif args.task == "move":
-        fuzzer = MoveNearRandomTesting(seed=random_seed, max_obstacles=args.obstacles,
-                                       random_number_obstacles=args.ro, object_list="ycb" if args.ycb else None)
-    elif args.task == "put-on":
-        fuzzer = PutOnRandomTesting(seed=random_seed, max_obstacles=args.obstacles,
-                                    random_number_obstacles=args.ro, object_list="ycb" if args.ycb else None)
-    elif args.task == "put-in":
-        fuzzer = PutInRandomTesting(seed=random_seed, max_obstacles=args.obstacles,
-                                    random_number_obstacles=args.ro, object_list="ycb" if args.ycb else None)
-    else:
+    if args.task not in GENERATORS:
         raise NotImplementedError
+    fuzzer = GENERATORS[args.task](seed=random_seed, max_obstacles=args.obstacles, random_number_obstacles=args.ro,
+                                   object_list="ycb" if args.ycb else None)
 
     output_name = ""
 
-    if args.ycb:
-        output_name += 'ycb_'
+    if args.streams:
+        output_name += streams_dataset_name(args.task, args.num, args.obstacles, args.ro, random_seed, args.ycb,
+                                            args.filter_margin if args.filter else None) + f".{args.format}"
+    else:
+        if args.ycb:
+            output_name += 'ycb_'
 
-    res = {}
-    for i in tqdm(range(args.num)):
-        if args.nl:
-            res[i] = fuzzer.generate_nl_commands()
+        if args.ro:
+            output_name += f"t-{args.task}_n-{args.num}_o-m{args.obstacles}_s-{random_seed}.{args.format}"
         else:
-            res[i] = fuzzer.generate_options()
-
-    res["seed"] = random_seed
+            output_name += f"t-{args.task}_n-{args.num}_o-{args.obstacles}_s-{random_seed}.{args.format}"
 
-    res["num"] = args.num
+    output_path = args.output + output_name if args.output else str(PACKAGE_DIR) + "/../data/" + output_name
 
-    if args.ro:
-        output_name += f"t-{args.task}_n-{args.num}_o-m{args.obstacles}_s-{random_seed}.json"
+    rng = np.random.default_rng(random_seed)
+    feasibility = SceneFeasibility(TASK_CATALOGS[(args.task, args.ycb)], fuzzer.safe_rage,
+                                   margin=args.filter_margin) if args.filter else None
+    rejected = 0
+
+    def generate_options(num):
+        global rejected
+        options_list = []
+        for _ in range(1000):
+            if args.batch_size > 0:
+                candidates = fuzzer.generate_options_batch(num - len(options_list), rng)
+            else:
+                candidates = [fuzzer.generate_options() for _ in range(num - len(options_list))]
+            if feasibility is not None:
+                feasible, _ = feasibility.check(candidates)
+                rejected += int((~feasible).sum())
+                candidates = [options for options, ok in zip(candidates, feasible) if ok]
+            options_list.extend(candidates)
+            if len(options_list) == num:
+                return options_list
+        raise InfeasiblePlacementError(f"Only {len(options_list)} of {num} scenarios passed the feasibility check")
+
+    def generate():
+        if args.streams:
+            dataset = GeneratedDataset(fuzzer, args.num, feasibility)
+            if args.workers > 1:
+                with mp.get_context("spawn").Pool(args.workers) as pool:
+                    yield from tqdm(pool.imap(partial(_generate_at, dataset), range(args.num), chunksize=256),
+                                    total=args.num)
+            else:
+                for idx in tqdm(range(args.num)):
+                    yield dataset[idx]
+        elif args.nl:
+            for _ in tqdm(range(args.num)):
+                yield fuzzer.generate_nl_commands()
+        else:
+            step = args.batch_size if args.batch_size > 0 else 1
+            for start in tqdm(range(0, args.num, step)):
+                yield from generate_options(min(step, args.num - start))
+
+    if args.format == "jsonl":
+        # scenarios are streamed to disk instead of being collected into one dict
+        with ScenarioWriter(output_path, dict(seed=random_seed, num=args.num)) as writer:
+            for options in generate():
+                writer.write(options)
     else:
-        output_name += f"t-{args.task}_n-{args.num}_o-{args.obstacles}_s-{random_seed}.json"
+        res = dict(enumerate(generate()))
 
-    output_path = args.output + output_name if args.output else str(PACKAGE_DIR) + "/../data/" + output_name
+        res["seed"] = random_seed
+
+        res["num"] = args.num
+
+        with open(output_path, 'w') as f:
+            # json.dumps encodes the whole dict in C, json.dump streams it through the pure-Python encoder
+            f.write(json.dumps(res))
 
-    with open(output_path, 'w') as f:
-        json.dump(res, f)
+    if feasibility is not None and not args.streams:
+        print(f"Rejected {rejected} infeasible scenarios")
@@ -0,0 +1,154 @@
+"""Multi-process pool of workers that run scenarios."""
+import multiprocessing as mp
+import os
+import queue
+import traceback
+
+from experiments.model_interface import VLAInterface
+
+
+def _setup_worker_devices():
+    # several workers share the same GPU(s), so none of them may grab all the device memory up front
+    os.environ["XLA_PYTHON_CLIENT_PREALLOCATE"] = "false"
+    try:
+        import tensorflow as tf
+
+        for gpu in tf.config.list_physical_devices("GPU"):
+            tf.config.experimental.set_memory_growth(gpu, True)
+    except (ImportError, RuntimeError):
+        pass
+
+
+def _handle_result(handler, key, run_kwargs, images, episode_stats, result_queue):
+    try:
+        if handler is not None:
+            result = handler(key, run_kwargs, images, episode_stats)
+        else:
+            result = episode_stats
+        result_queue.put((key, result, None))
+    except Exception:
+        result_queue.put((key, None, traceback.format_exc()))
+
+
+def _worker_loop(worker_id, interface_cls, interface_kwargs, handler, task_queue, result_queue):
+    _setup_worker_devices()
+    vla = interface_cls(**interface_kwargs)
+    try:
+        while True:
+            item = task_queue.get()
+            if item is None:
+                break
+            key, run_kwargs = item
+            if "options_list" in run_kwargs:
+                # a batch of scenarios rolled out in lockstep, one key per scenario
+                keys = key
+                try:
+                    rollouts = vla.run_interface_batch(**run_kwargs)
+                except Exception:
+                    error = traceback.format_exc()
+                    for key in keys:
+                        result_queue.put((key, None, error))
+                    continue
+                shared_kwargs = {k: v for k, v in run_kwargs.items()
+                                 if k not in ("options_list", "instructions", "num_groups", "frame_sinks")}
+                for key, options, (images, episode_stats) in zip(keys, run_kwargs["options_list"], rollouts):
+                    _handle_result(handler, key, dict(shared_kwargs, options=options), images, episode_stats,
+                                   result_queue)
+                continue
+            try:
+                images, episode_stats = vla.run_interface(**run_kwargs)
+            except Exception:
+                result_queue.put((key, None, traceback.format_exc()))
+                continue
+            _handle_result(handler, key, run_kwargs, images, episode_stats, result_queue)
+    finally:
+        vla.close()
+
+
+class ScenarioWorkerPool:
+    """Run scenarios on a set of worker processes, each owning its own environment and policy.
+
+    Items are (key, run_kwargs) pairs, run_kwargs being forwarded to interface_cls.run_interface; a list of keys with
+    run_kwargs holding an "options_list" is rolled out in lockstep by run_interface_batch instead and still yields one
+    result per key. Workers pull items from a shared queue, so long and short episodes balance out. If given,
+    handler(key, run_kwargs, images, episode_stats) runs inside the worker (e.g., to write results to disk) and only its
+    return value is sent back; it must be picklable, i.e., a module-level function or a functools.partial of one.
+    """
+
+    def __init__(self, num_workers, interface_kwargs, interface_cls=VLAInterface, handler=None, poll_interval=5.0):
+        self.num_workers = num_workers
+        self.interface_kwargs = interface_kwargs
+        self.interface_cls = interface_cls
+        self.handler = handler
+        self.poll_interval = poll_interval
+        # simulator and model runtimes are not fork-safe
+        self.ctx = mp.get_context("spawn")
+        self.task_queue = self.ctx.Queue()
+        self.result_queue = self.ctx.Queue()
+        self.workers = []
+        self.pending = 0
+
+    def start(self):
+        for worker_id in range(self.num_workers):
+            p = self.ctx.Process(target=_worker_loop,
+                                 args=(worker_id, self.interface_cls, self.interface_kwargs, self.handler,
+                                       self.task_queue, self.result_queue),
+                                 daemon=True)
+            p.start()
+            self.workers.append(p)
+        return self
+
+    def submit(self, key, run_kwargs):
+        self.task_queue.put((key, run_kwargs))
+        self.pending += len(key) if "options_list" in run_kwargs else 1
+
+    def next_result(self):
+        """Block until any submitted scenario finishes and return (key, result, error)."""
+        if self.pending <= 0:
+            raise RuntimeError("No pending scenarios")
+        while True:
+            try:
+                key, result, error = self.result_queue.get(timeout=self.poll_interval)
+                self.pending -= 1
+                return key, result, error
+            except queue.Empty:
+                if not any(p.is_alive() for p in self.workers):
+                    raise RuntimeError(f"All workers exited with {self.pending} scenarios pending, "
+                                       f"exit codes: {[p.exitcode for p in self.workers]}")
+
+    def imap_unordered(self, items, window=2):
+        """Submit items lazily, keeping about `window` items per worker in flight, and yield results as they finish."""
+        items = iter(items)
+        exhausted = False
+        item_size = 1
+        while True:
+            while not exhausted and self.pending < window * self.num_workers * item_size:
+                try:
+                    key, run_kwargs = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if "options_list" in run_kwargs:
+                    item_size = max(item_size, len(key))
+                self.submit(key, run_kwargs)
+            if self.pending == 0:
+                break
+            yield self.next_result()
+
+    def close(self):
+        for _ in self.workers:
+            self.task_queue.put(None)
+        for p in self.workers:
+            p.join()
+        self.workers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            for p in self.workers:
+                p.terminate()
+            self.workers = []
+        else:
+            self.close()
@@ -94,10 +94,11 @@ ENVIRONMENT_MAP = {
 }
 
 
-def make(task_name):
-    """Creates simulated eval environment from task name."""
+def make(task_name, **env_kwargs):
+    """Creates simulated eval environment from task name. Extra env_kwargs (e.g., settle_cache_dir) go to the env."""
     assert task_name in ENVIRONMENTS, f"Task {task_name} is not supported. Environments: \n {ENVIRONMENTS}"
     env_name, kwargs = ENVIRONMENT_MAP[task_name]
+    kwargs = dict(kwargs, **env_kwargs)
     kwargs["prepackaged_config"] = True
     env = gym.make(env_name, obs_mode="rgbd", **kwargs)
     return env
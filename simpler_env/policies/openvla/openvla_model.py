@@ -1,4 +1,5 @@
 from collections import deque
+from types import SimpleNamespace
 from typing import Optional, Sequence
 import os
 
@@ -82,6 +83,7 @@ class OpenVLAInference:
         else:
             self.action_ensembler = None
         self.num_image_history = 0
+        self.batch_states = {}
 
     def _resize_image(self, image: np.ndarray) -> np.ndarray:
         image = tf.image.resize(
@@ -93,20 +95,23 @@ class OpenVLAInference:
         image = tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8).numpy()
         return image
 
-    def _add_image_to_history(self, image: np.ndarray) -> None:
-        self.image_history.append(image)
+    def _add_image_to_history(self, image: np.ndarray, state=None) -> None:
+        # `state` holds the per-episode buffers; it defaults to this object for single-environment rollouts
+        state = self if state is None else state
+        state.image_history.append(image)
         # Alternative implementation below; but looks like for real eval, filling the entire buffer at the first step is not necessary
         # if self.num_image_history == 0:
         #     self.image_history.extend([image] * self.horizon)
         # else:
         #     self.image_history.append(image)
-        self.num_image_history = min(self.num_image_history + 1, self.horizon)
+        state.num_image_history = min(state.num_image_history + 1, self.horizon)
 
-    def _obtain_image_history_and_mask(self) -> tuple[np.ndarray, np.ndarray]:
-        images = np.stack(self.image_history, axis=0)
-        horizon = len(self.image_history)
+    def _obtain_image_history_and_mask(self, state=None) -> tuple[np.ndarray, np.ndarray]:
+        state = self if state is None else state
+        images = np.stack(state.image_history, axis=0)
+        horizon = len(state.image_history)
         pad_mask = np.ones(horizon, dtype=np.float64)  # note: this should be of float type, not a bool type
-        pad_mask[: horizon - min(horizon, self.num_image_history)] = 0
+        pad_mask[: horizon - min(horizon, state.num_image_history)] = 0
         # pad_mask = np.ones(self.horizon, dtype=np.float64) # note: this should be of float type, not a bool type
         # pad_mask[:self.horizon - self.num_image_history] = 0
         return images, pad_mask
@@ -124,6 +129,28 @@ class OpenVLAInference:
         # self.gripper_is_closed = False
         self.previous_gripper_action = None
 
+    def _new_episode_state(self, task_description: str) -> SimpleNamespace:
+        return SimpleNamespace(
+            task_description=task_description,
+            image_history=deque(maxlen=self.horizon),
+            num_image_history=0,
+            action_ensembler=(
+                ActionEnsembler(self.pred_action_horizon, self.action_ensemble_temp) if self.action_ensemble else None
+            ),
+            sticky_action_is_on=False,
+            gripper_action_repeat=0,
+            sticky_gripper_action=0.0,
+            previous_gripper_action=None,
+        )
+
+    def reset_batch(self, task_descriptions: Sequence[str], env_ids: Optional[Sequence[int]] = None) -> None:
+        """Reset the policy state of several environments that are stepped together with step_batch."""
+        if env_ids is None:
+            self.batch_states = {}
+            env_ids = range(len(task_descriptions))
+        for env_id, task_description in zip(env_ids, task_descriptions):
+            self.batch_states[env_id] = self._new_episode_state(task_description)
+
     def step(self, image: np.ndarray, task_description: Optional[str] = None, *args, **kwargs) -> tuple[dict[str, np.ndarray], dict[str, np.ndarray]]:
         """
         Input:
@@ -151,8 +178,39 @@ class OpenVLAInference:
         image: Image.Image = Image.fromarray(image)
         inputs = self.tokenizer(prompt, image).to(self.device, dtype=torch.bfloat16)
         raw_actions = self.model.predict_action(**inputs, unnorm_key=self.dataset_id, do_sample=False)
+        return self._postprocess_action(raw_actions)
+
+    def step_batch(
+        self,
+        images: Sequence[np.ndarray],
+        task_descriptions: Optional[Sequence[str]] = None,
+        env_ids: Optional[Sequence[int]] = None,
+    ) -> list[tuple[dict[str, np.ndarray], dict[str, np.ndarray]]]:
+        """
+        Batched counterpart of step for environments stepped in lockstep, see OctoInference.step_batch.
+        predict_action of the released OpenVLA checkpoint only supports a batch size of 1, so the forward passes are
+        issued one after another; the per-environment policy state is still kept separately.
+        """
+        env_ids = list(range(len(images))) if env_ids is None else list(env_ids)
+        if task_descriptions is not None:
+            for env_id, task_description in zip(env_ids, task_descriptions):
+                if env_id not in self.batch_states or task_description != self.batch_states[env_id].task_description:
+                    self.reset_batch([task_description], [env_id])
+
+        outputs = []
+        for env_id, image in zip(env_ids, images):
+            assert image.dtype == np.uint8
+            state = self.batch_states[env_id]
+            self._add_image_to_history(self._resize_image(image), state)
+            inputs = self.tokenizer(state.task_description, Image.fromarray(image)).to(self.device, dtype=torch.bfloat16)
+            raw_actions = self.model.predict_action(**inputs, unnorm_key=self.dataset_id, do_sample=False)
+            outputs.append(self._postprocess_action(raw_actions, state))
+        return outputs
+
+    def _postprocess_action(self, raw_actions: np.ndarray, state=None) -> tuple[dict[str, np.ndarray], dict[str, np.ndarray]]:
+        state = self if state is None else state
         if self.action_ensemble:
-            raw_actions = self.action_ensembler.ensemble_action(raw_actions)
+            raw_actions = state.action_ensembler.ensemble_action(raw_actions)
             raw_actions = raw_actions[None]  # [1, 7]
 
         raw_action = {
@@ -174,26 +232,26 @@ class OpenVLAInference:
             current_gripper_action = raw_action["open_gripper"]
 
             # alternative implementation
-            if self.previous_gripper_action is None:
+            if state.previous_gripper_action is None:
                 relative_gripper_action = np.array([0])
             else:
                 relative_gripper_action = (
-                    self.previous_gripper_action - current_gripper_action
+                    state.previous_gripper_action - current_gripper_action
                 )  # google robot 1 = close; -1 = open
-            self.previous_gripper_action = current_gripper_action
+            state.previous_gripper_action = current_gripper_action
 
-            if np.abs(relative_gripper_action) > 0.5 and self.sticky_action_is_on is False:
-                self.sticky_action_is_on = True
-                self.sticky_gripper_action = relative_gripper_action
+            if np.abs(relative_gripper_action) > 0.5 and state.sticky_action_is_on is False:
+                state.sticky_action_is_on = True
+                state.sticky_gripper_action = relative_gripper_action
 
-            if self.sticky_action_is_on:
-                self.gripper_action_repeat += 1
-                relative_gripper_action = self.sticky_gripper_action
+            if state.sticky_action_is_on:
+                state.gripper_action_repeat += 1
+                relative_gripper_action = state.sticky_gripper_action
 
-            if self.gripper_action_repeat == self.sticky_gripper_num_repeat:
-                self.sticky_action_is_on = False
-                self.gripper_action_repeat = 0
-                self.sticky_gripper_action = 0.0
+            if state.gripper_action_repeat == self.sticky_gripper_num_repeat:
+                state.sticky_action_is_on = False
+                state.gripper_action_repeat = 0
+                state.sticky_gripper_action = 0.0
 
             action["gripper"] = relative_gripper_action
 
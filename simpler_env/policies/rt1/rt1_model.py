@@ -1,4 +1,5 @@
 from collections import defaultdict
+from types import SimpleNamespace
 from typing import Optional, Sequence
 
 import matplotlib.pyplot as plt
@@ -36,6 +37,8 @@ class RT1Inference:
         self.policy_state = None
         self.task_description = None
         self.task_description_embedding = None
+        self.batched_tfa_policy = None
+        self.batch_states = {}
 
         self.policy_setup = policy_setup
         if self.policy_setup == "google_robot":
@@ -174,7 +177,87 @@ class RT1Inference:
         # obtain (unnormalized and filtered) raw action from model forward pass
         self.tfa_time_step = ts.transition(self.observation, reward=np.zeros((), dtype=np.float32))
         policy_step = self.tfa_policy.action(self.tfa_time_step, self.policy_state)
-        raw_action = policy_step.action
+        raw_action, action = self._postprocess_action(policy_step.action)
+
+        # update policy state
+        self.policy_state = policy_step.state
+
+        return raw_action, action
+
+    def _new_episode_state(self, task_description: str, task_description_embedding: tf.Tensor) -> SimpleNamespace:
+        return SimpleNamespace(
+            task_description=task_description,
+            task_description_embedding=task_description_embedding,
+            policy_state=self.tfa_policy.get_initial_state(batch_size=1),
+        )
+
+    def reset_batch(self, task_descriptions: Sequence[str], env_ids: Optional[Sequence[int]] = None) -> None:
+        """Reset the policy state of several environments that are stepped together with step_batch."""
+        if self.batched_tfa_policy is None:
+            # share the loaded saved model, but let the wrapper take time steps that already have a batch dimension
+            self.batched_tfa_policy = py_tf_eager_policy.PyTFEagerPolicyBase(
+                self.tfa_policy._policy,
+                self.tfa_policy.time_step_spec,
+                self.tfa_policy.action_spec,
+                self.tfa_policy.policy_state_spec,
+                self.tfa_policy.info_spec,
+                use_tf_function=True,
+                batch_time_steps=False,
+            )
+        if env_ids is None:
+            self.batch_states = {}
+            env_ids = range(len(task_descriptions))
+        embeddings = self.lang_embed_model(list(task_descriptions))
+        for i, (env_id, task_description) in enumerate(zip(env_ids, task_descriptions)):
+            self.batch_states[env_id] = self._new_episode_state(task_description, embeddings[i])
+
+    def step_batch(
+        self,
+        images: Sequence[np.ndarray],
+        task_descriptions: Optional[Sequence[str]] = None,
+        env_ids: Optional[Sequence[int]] = None,
+    ) -> list[tuple[dict[str, np.ndarray], dict[str, np.ndarray]]]:
+        """
+        Batched counterpart of step for environments stepped in lockstep.
+        Input:
+            images: sequence of np.ndarray of shape (H, W, 3), uint8, one per environment
+            task_descriptions: Optional sequence of str; an environment whose description changed is reset
+            env_ids: Optional ids of the environments in `images` (as given to reset_batch); environments that have
+                finished are simply left out
+        Output:
+            list of (raw_action, action) tuples in the order of `images`, see step
+        """
+        env_ids = list(range(len(images))) if env_ids is None else list(env_ids)
+        if task_descriptions is not None:
+            changed = [
+                (env_id, task_description)
+                for env_id, task_description in zip(env_ids, task_descriptions)
+                if env_id not in self.batch_states or task_description != self.batch_states[env_id].task_description
+            ]
+            if changed:
+                self.reset_batch([c[1] for c in changed], [c[0] for c in changed])
+        states = [self.batch_states[env_id] for env_id in env_ids]
+        num_envs = len(states)
+
+        for image in images:
+            assert image.dtype == np.uint8
+        observation = tf_agents.specs.zero_spec_nest(
+            tf_agents.specs.from_spec(self.batched_tfa_policy.time_step_spec.observation), outer_dims=(num_envs,)
+        )
+        observation["image"] = self._resize_image(np.stack(images, axis=0))
+        observation["natural_language_embedding"] = tf.stack([state.task_description_embedding for state in states])
+        tfa_time_step = ts.transition(observation, reward=np.zeros((num_envs,), dtype=np.float32))
+        policy_state = tf.nest.map_structure(lambda *xs: tf.concat(xs, axis=0), *[state.policy_state for state in states])
+        policy_step = self.batched_tfa_policy.action(tfa_time_step, policy_state)
+
+        batch_raw_action = {k: np.asarray(v) for k, v in policy_step.action.items()}
+        outputs = []
+        for i, state in enumerate(states):
+            outputs.append(self._postprocess_action({k: v[i] for k, v in batch_raw_action.items()}))
+            state.policy_state = tf.nest.map_structure(lambda x: x[i : i + 1], policy_step.state)
+        return outputs
+
+    def _postprocess_action(self, raw_action: dict[str, np.ndarray | tf.Tensor]) -> tuple[dict[str, np.ndarray], dict[str, np.ndarray]]:
         if self.policy_setup == "google_robot":
             raw_action = self._small_action_filter_google_robot(raw_action, arm_movement=False, gripper=True)
         if self.unnormalize_action:
@@ -224,9 +307,6 @@ class RT1Inference:
 
         action["terminate_episode"] = raw_action["terminate_episode"]
 
-        # update policy state
-        self.policy_state = policy_step.state
-
         return raw_action, action
 
     def visualize_epoch(self, predicted_raw_actions: Sequence[np.ndarray], images: Sequence[np.ndarray], save_path: str) -> None: